@@ -9,11 +9,9 @@ from langgraph.prebuilt import ToolNode
 from typing import TypedDict, Annotated, Sequence, Literal
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
+from bounded_checkpointer import BoundedCheckpointer
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
 from pinecone import Pinecone
 from langchain_pinecone import PineconeVectorStore
 from langchain_openai import OpenAIEmbeddings
@@ -26,6 +24,11 @@ from langgraph.prebuilt import ToolNode
 from langgraph.prebuilt import tools_condition
 from langchain_core.documents import Document
 from IPython.display import display, Markdown
+from embedding_cache import CachedEmbeddings
+from corpus_index import CorpusIndex, pdf_splitter
+from node_resources import NodeResources, PromptStore
+from doc_grader import DOC_SEPARATOR, CrossEncoderGrader, LLMGrader, split_documents
+from doc_grader import grade as grade_chunks
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -47,63 +50,50 @@ TAVILY_API_KEY = os.getenv('TAVILY_API_KEY')
 LANGCHAIN_API_KEY = os.getenv('LANGCHAIN_API_KEY')
 LANGCHAIN_TRACING_V2 = os.getenv('LANGCHAIN_TRACING_V2')
 LANGCHAIN_PROJECT = os.getenv('LANGCHAIN_PROJECT')
+# Per-chunk relevance grading: a local cross-encoder if one is named, otherwise MODEL
+GRADER_CROSS_ENCODER = os.getenv('GRADER_CROSS_ENCODER')
+GRADE_THRESHOLD = float(os.getenv('GRADE_THRESHOLD', 0.5))
+GRADE_MAX_RELEVANT = int(os.getenv('GRADE_MAX_RELEVANT', 0)) or None  # Stop grading once this many chunks pass
 
 pc = Pinecone(api_key=PINECONE_API_KEY)
 pinecone_index = pc.Index("testing")
 web_search_tool = TavilySearchResults(description="Search the internet for real-time information and current events",k=3)
 
-# Load and split documents for RAG
-file_path = "data/testing2.pdf" 
-loader = PyPDFLoader(file_path)
-pages = loader.load_and_split()
-text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=350, chunk_overlap=50)
-chunked_documents = text_splitter.split_documents(pages)
+# Documents for RAG
+file_path = "data/testing2.pdf"
 
-# Instantiate the Embedding Model and FAISS index
-embeddings = OpenAIEmbeddings()
-vector_store = PineconeVectorStore.from_documents(chunked_documents, embedding=embeddings, index_name="testing")
+# Instantiate the Embedding Model and index only new or changed chunks of the corpus
+embeddings = CachedEmbeddings(OpenAIEmbeddings())
+corpus = CorpusIndex(pinecone_index, embeddings, pdf_splitter(chunk_size=350, chunk_overlap=50))
+print("Corpus sync:", corpus.sync([file_path]).as_dict())
+vector_store = PineconeVectorStore(index=pinecone_index, embedding=embeddings, text_key="text")
 retriever = vector_store.as_retriever()
 
 retriever_tool = create_retriever_tool(
     retriever,
     "retrieve_documents",
-    "Search and return information from the context you have only."
+    "Search and return information from the context you have only.",
+    document_separator=DOC_SEPARATOR,
 )
 
 
 
 tools = [retriever_tool, web_search_tool]
 
-class AgentState(TypedDict):
-    # The add_messages function defines how an update should be processed
-    # Default is to replace. add_messages says "append"
-    messages: Annotated[Sequence[BaseMessage], add_messages]
-
-def grade_documents(state) -> Literal["generate", "web_search"]:
-    """
-    Determines whether the retrieved documents are relevant to the question.
-
-    Args:
-        state (messages): The current state
-
-    Returns:
-        str: A decision for whether the documents are relevant or not
-    """
+# Model clients, chains and prompts are built once and shared by every node and graph run
+resources = NodeResources()
+prompts = PromptStore()
 
-    print("---CHECK RELEVANCE---")
-
-    # Data model
-    class grade(BaseModel):
-        """Binary score for relevance check."""
+def chat_model():
+    return resources.get("chat_model", lambda: ChatOpenAI(temperature=0, model_name="gpt-4o", api_key=OPENAI_API_KEY))
 
-        binary_score: str = Field(description="Relevance score 'yes' or 'no'")
+# Data model
+class grade(BaseModel):
+    """Binary score for relevance check."""
 
-    # LLM
-    model =  ChatOpenAI(temperature=0, model_name="gpt-4o", api_key=OPENAI_API_KEY)
-
-    # LLM with tool and validation
-    llm_with_tool = model.with_structured_output(grade)
+    binary_score: str = Field(description="Relevance score 'yes' or 'no'")
 
+def grader_chain():
     # Prompt
     prompt = PromptTemplate(
         template="""You are a grader assessing relevance of a retrieved document to a user question. \n
@@ -114,31 +104,77 @@ def grade_documents(state) -> Literal["generate", "web_search"]:
         input_variables=["context", "question"],
     )
 
+    # Cheap LLM with tool and validation, called once per chunk
+    model = resources.get("grader_model", lambda: ChatOpenAI(temperature=0, model_name=MODEL, api_key=OPENAI_API_KEY))
+    llm_with_tool = model.with_structured_output(grade)
+
     # Chain
-    chain = prompt | llm_with_tool
+    return prompt | llm_with_tool
+
+def chunk_grader():
+    if GRADER_CROSS_ENCODER:
+        return CrossEncoderGrader(GRADER_CROSS_ENCODER)
+    return LLMGrader(resources.get("grader_chain", grader_chain))
+
+def rag_chain():
+    return prompts.get("rlm/rag-prompt") | chat_model() | StrOutputParser()
+
+class AgentState(TypedDict):
+    # The add_messages function defines how an update should be processed
+    # Default is to replace. add_messages says "append"
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+
+@resources.timed("grade_documents")
+def grade_documents(state):
+    """
+    Grades each retrieved document concurrently and keeps only the relevant ones.
+
+    Args:
+        state (messages): The current state
+
+    Returns:
+        dict: The retrieval message, replaced by one holding only the relevant documents
+    """
+
+    print("---CHECK RELEVANCE---")
 
     messages = state["messages"]
     last_message = messages[-1]
 
     question = messages[0].content
-    docs = last_message.content
+    docs = split_documents(last_message.content)
+
+    relevant = []
+    if docs:
+        grader = resources.get("chunk_grader", chunk_grader)
+        result = grade_chunks(grader, question, docs, threshold=GRADE_THRESHOLD, max_relevant=GRADE_MAX_RELEVANT)
+        print(result.as_dict())
+        relevant = result.relevant
 
-    scored_result = chain.invoke({"question": question, "context": docs})
+    # Same id, so add_messages replaces the retrieval output instead of appending
+    return {"messages": [last_message.model_copy(update={"content": DOC_SEPARATOR.join(relevant)})]}
 
-    score = scored_result.binary_score
+def route_graded(state) -> Literal["generate", "web_search"]:
+    """
+    Determines whether any retrieved document survived grading.
 
-    if score == "yes":
+    Args:
+        state (messages): The current state
+
+    Returns:
+        str: A decision for whether the documents are relevant or not
+    """
+    if state["messages"][-1].content:
         print("---DECISION: DOCS RELEVANT---")
         return "generate"
-
     else:
         print("---DECISION: DOCS NOT RELEVANT---")
-        print(score)
         return "web_search"
 
 
 ### Nodes
 
+@resources.timed("web_search")
 def web_search_agent(state):
     """
     Web search based on the re-phrased question.
@@ -162,6 +198,7 @@ def web_search_agent(state):
     # We return a list, because this will get added to the existing list
     return {"messages": [web_results]}
 
+@resources.timed("agent")
 def retrieve_agent(state):
     """
     Invokes the agent model to generate a response based on the current state. Given
@@ -175,13 +212,13 @@ def retrieve_agent(state):
     """
     print("---CALL AGENT---")
     messages = state["messages"]
-    model =  ChatOpenAI(temperature=0, model_name="gpt-4o", api_key=OPENAI_API_KEY)
-    model = model.bind_tools(tools)
+    model = resources.get("agent_model", lambda: chat_model().bind_tools(tools))
     response = model.invoke(messages)
     # We return a list, because this will get added to the existing list
     return {"messages": [response]}
 
 
+@resources.timed("rewrite")
 def rewrite(state):
     """
     Transform the query to produce a better question.
@@ -209,11 +246,11 @@ def rewrite(state):
         )
     ]
 
-    llm =  ChatOpenAI(temperature=0, model_name="gpt-4o", api_key=OPENAI_API_KEY)
-    response = llm.invoke(msg)
+    response = chat_model().invoke(msg)
     return {"messages": [response]}
 
 
+@resources.timed("generate")
 def generate(state):
     """
     Generate answer
@@ -231,26 +268,16 @@ def generate(state):
 
     docs = last_message.content
 
-    # Prompt
-    prompt = hub.pull("rlm/rag-prompt")
-
-    # LLM
-    llm =  ChatOpenAI(temperature=0, model_name="gpt-4o", api_key=OPENAI_API_KEY)
-
-    # Post-processing
-    def format_docs(docs):
-        return "\n\n".join(doc.page_content for doc in docs)
-
     # Chain
-    rag_chain = prompt | llm | StrOutputParser()
+    chain = resources.get("rag_chain", rag_chain)
 
     # Run
-    response = rag_chain.invoke({"context": docs, "question": question})
+    response = chain.invoke({"context": docs, "question": question})
     return {"messages": [response]}
 
 
 print("*" * 20 + "Prompt[rlm/rag-prompt]" + "*" * 20)
-prompt = hub.pull("rlm/rag-prompt").pretty_print()
+prompts.get("rlm/rag-prompt").pretty_print()
 
 # Define a new graph
 workflow = StateGraph(AgentState)
@@ -260,6 +287,7 @@ workflow.add_node("web_search", web_search_agent)  # web search
 workflow.add_node("agent", retrieve_agent)  # agent
 retrieve = ToolNode([retriever_tool, web_search_tool])
 workflow.add_node("retrieve", retrieve)
+workflow.add_node("grade_documents", grade_documents)  # Per-document relevance filter
 workflow.add_node(
     "generate", generate
 )  # Generating a response after we know the documents are relevant
@@ -281,14 +309,15 @@ workflow.add_conditional_edges(
 )
 
 # Edges taken after the `action` node is called.
+workflow.add_edge("retrieve", "grade_documents")
 workflow.add_conditional_edges(
-    "retrieve",
+    "grade_documents",
     # Assess agent decision
-    grade_documents,
+    route_graded,
 )
 workflow.add_edge("generate", END)
 mermaid_syntax = workflow.draw_mermaid()
-checkpointer = MemorySaver()
+checkpointer = BoundedCheckpointer()
 # Compile
 graph = workflow.compile(checkpointer=checkpointer)
 
@@ -311,3 +340,5 @@ for output in graph.stream(inputs):
         pprint.pprint("---")
         pprint.pprint(value, indent=2, width=80, depth=None)
     pprint.pprint("\n---\n")
+
+pprint.pprint(resources.stats())
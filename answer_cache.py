@@ -0,0 +1,136 @@
+"""Semantic cache of chat answers, in front of the RAG graph.
+
+Questions asked of a namespace are often near-duplicates ("what is the refund
+policy?" / "what's your refund policy"), and each one otherwise pays for
+retrieval plus several LLM calls. The cache keeps recent answers per
+(namespace, quality) with the embedding of their question, and serves a new
+question whose embedding is at least `threshold` cosine-similar to a cached
+one.
+
+Entries expire after `ttl` seconds, the least recently used are evicted past
+`max_entries`, and `invalidate(namespace)` drops everything cached for a
+namespace: call it whenever documents are added to or removed from it. An
+answer computed while its namespace was being invalidated is not stored: take
+`generation(namespace)` before running the graph and pass it to `store`.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+class CachedAnswer:
+    def __init__(self, query: str, answer: str, vector: np.ndarray, created_at: float):
+        self.query = query
+        self.answer = answer
+        self.vector = vector
+        self.created_at = created_at
+
+
+class SemanticAnswerCache:
+    """Thread-safe, TTL- and size-bounded nearest-question answer cache."""
+
+    def __init__(self, embeddings, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 10_000):
+        self.embeddings = embeddings  # Anything with embed_query(text)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, int], CachedAnswer]" = OrderedDict()  # LRU order
+        self._by_scope: Dict[Tuple[str, str], Dict[int, CachedAnswer]] = {}
+        self._next_id = 0
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._counts = {"lookups": 0, "hits": 0, "stores": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    def embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, namespace: str, quality: str, vector: np.ndarray) -> Optional[Tuple[CachedAnswer, float]]:
+        """Most similar fresh answer for a question embedding, with its similarity, if above the threshold."""
+        scope = (namespace, quality)
+        now = time.time()
+        with self._lock:
+            self._counts["lookups"] += 1
+            entries = self._by_scope.get(scope, {})
+            for entry_id in [i for i, entry in entries.items() if now - entry.created_at > self.ttl]:
+                self._remove(scope, entry_id)
+                self._counts["expired"] += 1
+            if not entries:
+                return None
+            ids = list(entries)
+            similarities = np.stack([entries[i].vector for i in ids]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            self._counts["hits"] += 1
+            self._entries.move_to_end((*scope, ids[best]))
+            return entries[ids[best]], float(similarities[best])
+
+    def generation(self, namespace: str) -> int:
+        with self._lock:
+            return self._generations[namespace]
+
+    def store(self, namespace: str, quality: str, query: str, vector: np.ndarray, answer: str, generation: int) -> bool:
+        """Cache an answer unless the namespace was invalidated since `generation` was taken."""
+        scope = (namespace, quality)
+        with self._lock:
+            if self._generations[namespace] != generation:
+                return False
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = CachedAnswer(query, answer, vector, time.time())
+            self._entries[(*scope, entry_id)] = entry
+            self._by_scope.setdefault(scope, {})[entry_id] = entry
+            self._counts["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                namespace_, quality_, oldest = next(iter(self._entries))
+                self._remove((namespace_, quality_), oldest)
+                self._counts["evicted"] += 1
+            return True
+
+    def invalidate(self, namespace: str) -> int:
+        """Drop every answer cached for `namespace`; returns how many were dropped."""
+        dropped = 0
+        with self._lock:
+            self._generations[namespace] += 1
+            for scope in [scope for scope in self._by_scope if scope[0] == namespace]:
+                for entry_id in list(self._by_scope[scope]):
+                    self._remove(scope, entry_id)
+                    dropped += 1
+            self._counts["invalidated"] += dropped
+        return dropped
+
+    def clear(self) -> None:
+        with self._lock:
+            for namespace in {scope[0] for scope in self._by_scope}:
+                self._generations[namespace] += 1
+            self._counts["invalidated"] += len(self._entries)
+            self._entries.clear()
+            self._by_scope.clear()
+
+    def _remove(self, scope: Tuple[str, str], entry_id: int) -> None:
+        del self._entries[(*scope, entry_id)]
+        entries = self._by_scope[scope]
+        del entries[entry_id]
+        if not entries:
+            del self._by_scope[scope]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            namespaces: Dict[str, int] = {}
+            for (namespace, _), entries in self._by_scope.items():
+                namespaces[namespace] = namespaces.get(namespace, 0) + len(entries)
+            lookups = self._counts["lookups"]
+            return {
+                **self._counts,
+                "hit_rate": round(self._counts["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_sec": self.ttl,
+                "namespaces": namespaces,
+            }
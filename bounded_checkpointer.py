@@ -0,0 +1,246 @@
+"""A size-bounded LangGraph checkpointer for long-running chat services.
+
+`BoundedCheckpointer` wraps another saver (in-memory by default, SQLite for
+persistence) and evicts whole conversation threads by LRU and idle TTL. A
+thread whose checkpoint history grows past a limit can be compacted down to
+its latest checkpoint. Resident threads, approximate bytes and evictions are
+exposed via `metrics()`.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+
+
+class _ThreadInfo:
+    __slots__ = ("last_access", "checkpoints", "bytes")
+
+    def __init__(self):
+        self.last_access = time.time()
+        self.checkpoints = 0
+        self.bytes = 0
+
+
+class BoundedCheckpointer(BaseCheckpointSaver):
+    def __init__(
+        self,
+        inner: Optional[BaseCheckpointSaver] = None,
+        max_threads: int = 10_000,
+        ttl_sec: Optional[float] = 7 * 24 * 3600,
+        max_checkpoints_per_thread: int = 50,
+    ):
+        self.inner = inner if inner is not None else MemorySaver()
+        super().__init__(serde=self.inner.serde)
+        self.max_threads = max_threads
+        self.ttl_sec = ttl_sec
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.evictions = 0
+        self.compactions = 0
+        self._threads: "OrderedDict[str, _ThreadInfo]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_existing_threads()
+
+    @classmethod
+    def sqlite(cls, path: str, **kwargs) -> "BoundedCheckpointer":
+        """Persist checkpoints to SQLite so conversations survive restarts."""
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        conn = sqlite3.connect(path, check_same_thread=False)
+        return cls(SqliteSaver(conn), **kwargs)
+
+    # Bookkeeping
+
+    def _touch(self, config: RunnableConfig, checkpoint: Optional[Checkpoint] = None, write: bool = False) -> Optional[str]:
+        """Mark a thread as recently used; only writes register a thread not seen before.
+
+        Reads of unknown thread ids (a new conversation's first lookup, a probe
+        of a random id) must not take an LRU slot and evict a real thread.
+        """
+        thread_id = config.get("configurable", {}).get("thread_id")
+        if thread_id is None:
+            return None
+        with self._lock:
+            info = self._threads.pop(thread_id, None)
+            if info is None:
+                if not write:
+                    return thread_id
+                info = _ThreadInfo()
+            info.last_access = time.time()
+            if checkpoint is not None:
+                info.checkpoints += 1
+                info.bytes += len(self.serde.dumps_typed(checkpoint)[1])
+            self._threads[thread_id] = info
+        return thread_id
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used threads past max_threads, and any idle past the TTL."""
+        now = time.time()
+        victims = []
+        with self._lock:
+            for thread_id, info in self._threads.items():
+                over_limit = len(self._threads) - len(victims) > self.max_threads
+                expired = self.ttl_sec is not None and now - info.last_access > self.ttl_sec
+                if not over_limit and not expired:
+                    break
+                if thread_id != keep:
+                    victims.append(thread_id)
+            for thread_id in victims:
+                del self._threads[thread_id]
+            self.evictions += len(victims)
+        for thread_id in victims:
+            self.inner.delete_thread(thread_id)
+
+    def _load_existing_threads(self):
+        """Register threads already present in a persistent backend so they can be evicted too."""
+        if isinstance(self.inner, MemorySaver):
+            return
+        with self._lock:
+            for item in self.inner.list(None):
+                thread_id = item.config["configurable"]["thread_id"]
+                info = self._threads.setdefault(thread_id, _ThreadInfo())
+                info.checkpoints += 1
+                info.last_access = min(info.last_access, _checkpoint_time(item.checkpoint))
+            self._threads = OrderedDict(sorted(self._threads.items(), key=lambda kv: kv[1].last_access))
+
+    def compact(self, thread_id: str) -> bool:
+        """Collapse a thread's history to its latest checkpoint if it has too many.
+
+        Only call this between runs of the thread: pending writes of the
+        latest checkpoint are discarded.
+        """
+        with self._lock:
+            info = self._threads.get(thread_id)
+            if info is None or info.checkpoints <= self.max_checkpoints_per_thread:
+                return False
+            latest = self.inner.get_tuple({"configurable": {"thread_id": thread_id}})
+            if latest is None:
+                return False
+            self.inner.delete_thread(thread_id)
+            config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": latest.config["configurable"].get("checkpoint_ns", "")}}
+            self.inner.put(config, latest.checkpoint, latest.metadata, latest.checkpoint["channel_versions"])
+            info.checkpoints = 1
+            info.bytes = len(self.serde.dumps_typed(latest.checkpoint)[1])
+            self.compactions += 1
+            return True
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threads_resident": len(self._threads),
+                "checkpoints": sum(info.checkpoints for info in self._threads.values()),
+                "bytes": sum(info.bytes for info in self._threads.values()),
+                "evictions": self.evictions,
+                "compactions": self.compactions,
+                "max_threads": self.max_threads,
+                "ttl_sec": self.ttl_sec,
+            }
+
+    # BaseCheckpointSaver interface, delegated to the wrapped saver
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._touch(config)
+        return self.inner.get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        return self.inner.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        result = self.inner.put(config, checkpoint, metadata, new_versions)
+        thread_id = self._touch(config, checkpoint, write=True)
+        self._evict(keep=thread_id)
+        return result
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        self._touch(config, write=True)
+        self.inner.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+        self.inner.delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._touch(config)
+        return await self.inner.aget_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.inner.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        result = await self.inner.aput(config, checkpoint, metadata, new_versions)
+        thread_id = self._touch(config, checkpoint, write=True)
+        self._evict(keep=thread_id)
+        return result
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        self._touch(config, write=True)
+        await self.inner.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+        await self.inner.adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+
+def _checkpoint_time(checkpoint: Checkpoint) -> float:
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(checkpoint["ts"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def trim_thread_messages(graph, config: RunnableConfig, max_messages: int) -> int:
+    """Remove the oldest messages of a thread so at most `max_messages` remain.
+
+    The kept window always starts at a human message so tool calls are never
+    separated from their results. Returns the number of messages removed.
+    """
+    from langchain_core.messages import RemoveMessage
+
+    messages = graph.get_state(config).values.get("messages", [])
+    if len(messages) <= max_messages:
+        return 0
+    start = len(messages) - max_messages
+    while start < len(messages) and messages[start].type != "human":
+        start += 1
+    if start >= len(messages):
+        return 0
+    graph.update_state(config, {"messages": [RemoveMessage(id=m.id) for m in messages[:start]]})
+    return start
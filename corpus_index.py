@@ -0,0 +1,254 @@
+"""Idempotent, incremental indexing of a fixed corpus of files into Pinecone.
+
+A service that indexes its corpus at startup should not re-embed and re-upsert
+everything on every restart. CorpusIndex keeps a SQLite manifest of each
+file's hash and of the chunks it produced. Chunk ids are derived from the file
+path and the chunk's content, so the same chunk always gets the same id. On
+`sync`:
+
+    - an unchanged file (same hash) is skipped without being parsed,
+    - a changed file is re-split and only chunks whose id is new are embedded
+      and upserted; chunks that disappeared are deleted from the index,
+    - a file that is no longer part of the corpus has all its chunks deleted.
+
+Chunks are recorded only after their upsert succeeds and the file hash only
+after the whole file is done, so an interrupted sync is finished by the next.
+Vectors written before the manifest existed (e.g. by `from_documents`, with
+random ids) are not tracked; clear the namespace once before the first sync.
+
+    python corpus_index.py data/testing2.pdf --index testing
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from doc_registry import batched, delete_ids
+from rag_ingest import with_retry
+
+DEFAULT_MANIFEST_PATH = os.getenv("CORPUS_MANIFEST_PATH", "corpus_index.db")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(path: str, texts: Sequence[str]) -> List[str]:
+    """Deterministic ids: path + content hash, plus an occurrence counter for repeated chunks."""
+    seen: Dict[str, int] = {}
+    ids = []
+    for text in texts:
+        digest = chunk_hash(text)
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(str(uuid.uuid5(uuid.NAMESPACE_URL, f"{path}:{digest}:{occurrence}")))
+    return ids
+
+
+class SyncStats:
+    """What one `sync` did."""
+
+    def __init__(self):
+        self.files_unchanged = 0
+        self.files_indexed = 0
+        self.files_removed = 0
+        self.chunks_kept = 0
+        self.chunks_upserted = 0
+        self.chunks_deleted = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def as_dict(self):
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return {
+            "files_unchanged": self.files_unchanged,
+            "files_indexed": self.files_indexed,
+            "files_removed": self.files_removed,
+            "chunks_kept": self.chunks_kept,
+            "chunks_upserted": self.chunks_upserted,
+            "chunks_deleted": self.chunks_deleted,
+            "elapsed_sec": round(end - self.started_at, 3),
+        }
+
+
+class CorpusIndex:
+    """Manifest-driven sync of files into one Pinecone namespace.
+
+    `split(path)` loads a file and returns its chunks as LangChain Documents;
+    `embeddings` is anything with `embed_documents(texts)` and `index` a Pinecone index.
+    """
+
+    def __init__(
+        self,
+        index,
+        embeddings,
+        split: Callable[[str], List],
+        namespace: str = "",
+        manifest_path: str = DEFAULT_MANIFEST_PATH,
+        text_key: str = "text",
+        embed_batch_size: int = 128,
+        upsert_batch_size: int = 100,
+    ):
+        self.index = index
+        self.embeddings = embeddings
+        self.split = split
+        self.namespace = namespace
+        self.text_key = text_key
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(manifest_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                namespace TEXT,
+                path TEXT,
+                file_hash TEXT,
+                chunk_count INTEGER,
+                indexed_at REAL,
+                PRIMARY KEY (namespace, path)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                namespace TEXT,
+                chunk_id TEXT,
+                path TEXT,
+                chunk_hash TEXT,
+                PRIMARY KEY (namespace, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_file ON chunks (namespace, path);
+        ''')
+        self._conn.commit()
+
+    def indexed_files(self) -> Dict[str, str]:
+        """path -> file hash of every fully indexed file."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT path, file_hash FROM files WHERE namespace = ?", (self.namespace,)
+            ))
+
+    def _chunk_ids(self, path: str) -> List[str]:
+        with self._lock:
+            return [chunk_id for (chunk_id,) in self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE namespace = ? AND path = ?", (self.namespace, path)
+            )]
+
+    def sync(self, paths: Iterable[str]) -> SyncStats:
+        """Bring the index in line with `paths`, touching only what changed since the last sync."""
+        stats = SyncStats()
+        paths = [os.path.normpath(path) for path in paths]
+        indexed = self.indexed_files()
+        for path in paths:
+            digest = file_hash(path)
+            if indexed.get(path) == digest:
+                stats.files_unchanged += 1
+                continue
+            self._sync_file(path, digest, stats)
+            stats.files_indexed += 1
+
+        # Files dropped from the corpus, including ones whose indexing never finished
+        with self._lock:
+            tracked = {path for (path,) in self._conn.execute(
+                "SELECT DISTINCT path FROM chunks WHERE namespace = ?", (self.namespace,)
+            )}
+        for path in (tracked | set(indexed)) - set(paths):
+            stats.chunks_deleted += self._delete(self._chunk_ids(path))
+            with self._lock:
+                self._conn.execute("DELETE FROM files WHERE namespace = ? AND path = ?", (self.namespace, path))
+                self._conn.commit()
+            stats.files_removed += 1
+
+        stats.finished_at = time.time()
+        return stats
+
+    def _sync_file(self, path: str, digest: str, stats: SyncStats) -> None:
+        chunks = self.split(path)
+        ids = chunk_ids(path, [chunk.page_content for chunk in chunks])
+        existing = set(self._chunk_ids(path))
+        new = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in existing]
+        stats.chunks_kept += len(ids) - len(new)
+
+        for batch in batched(new, self.embed_batch_size):
+            vectors = with_retry(self.embeddings.embed_documents, [chunk.page_content for _, chunk in batch])
+            records = [
+                (chunk_id, vector, {**chunk.metadata, self.text_key: chunk.page_content})
+                for (chunk_id, chunk), vector in zip(batch, vectors)
+            ]
+            for part in batched(records, self.upsert_batch_size):
+                with_retry(self.index.upsert, vectors=list(part), namespace=self.namespace)
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (namespace, chunk_id, path, chunk_hash) VALUES (?, ?, ?, ?)",
+                    [(self.namespace, chunk_id, path, chunk_hash(chunk.page_content)) for chunk_id, chunk in batch],
+                )
+                self._conn.commit()
+            stats.chunks_upserted += len(batch)
+
+        stats.chunks_deleted += self._delete(existing - set(ids))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (namespace, path, file_hash, chunk_count, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, path, digest, len(ids), time.time()),
+            )
+            self._conn.commit()
+
+    def _delete(self, ids: Iterable[str]) -> int:
+        ids = list(ids)
+        if not ids:
+            return 0
+        delete_ids(self.index, self.namespace, ids)
+        with self._lock:
+            for part in batched(ids, 500):
+                self._conn.execute(
+                    f"DELETE FROM chunks WHERE namespace = ? AND chunk_id IN ({','.join('?' * len(part))})",
+                    [self.namespace, *part],
+                )
+            self._conn.commit()
+        return len(ids)
+
+
+def pdf_splitter(chunk_size: int = 350, chunk_overlap: int = 50) -> Callable[[str], List]:
+    """Load a PDF and split it the way the agentic RAG services do."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.document_loaders import PyPDFLoader
+
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    def split(path: str) -> List:
+        return text_splitter.split_documents(PyPDFLoader(path).load_and_split())
+
+    return split
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally index files into a Pinecone namespace.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--index", default="testing")
+    parser.add_argument("--namespace", default="")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from langchain_openai import OpenAIEmbeddings
+    from pinecone import Pinecone
+    from embedding_cache import CachedEmbeddings
+    load_dotenv('.env')
+
+    index = Pinecone(api_key=os.getenv('PINECONE_API_KEY')).Index(args.index)
+    corpus = CorpusIndex(index, CachedEmbeddings(OpenAIEmbeddings()), pdf_splitter(), args.namespace, args.manifest)
+    print(corpus.sync(args.files).as_dict())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Per-document relevance grading for retrieval results.
+
+Instead of asking one large model for a single yes/no over everything that
+was retrieved, each chunk is scored on its own, concurrently, by a cheap
+grader, and only the chunks that pass are handed to generation. Two graders
+share the same interface:
+
+    LLMGrader          a structured-output chain (e.g. gpt-4o-mini) called once per chunk on a thread pool
+    CrossEncoderGrader a local sentence-transformers cross-encoder, scoring all chunks in one batch
+
+`grade` returns as soon as the last outstanding chunk is scored, or as soon
+as `max_relevant` chunks have passed, cancelling the calls still queued.
+"""
+import inspect
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+# Separator the retriever tool puts between chunks, so its output can be split back into them
+DOC_SEPARATOR = "\n\n-----\n\n"
+
+
+def split_documents(content: str, separator: str = DOC_SEPARATOR) -> List[str]:
+    return [doc for doc in content.split(separator) if doc.strip()]
+
+
+class GradeResult:
+    """Chunks that passed (in retrieval order) and how grading went."""
+
+    def __init__(self, docs: Sequence[str], scores: List[Optional[float]], threshold: float, seconds: float, early_exit: bool):
+        self.scores = scores  # None for chunks left ungraded by an early exit
+        self.relevant = [doc for doc, score in zip(docs, scores) if score is not None and score >= threshold]
+        self.seconds = seconds
+        self.early_exit = early_exit
+
+    def as_dict(self):
+        return {
+            "retrieved": len(self.scores),
+            "graded": sum(score is not None for score in self.scores),
+            "relevant": len(self.relevant),
+            "seconds": round(self.seconds, 3),
+            "early_exit": self.early_exit,
+        }
+
+
+class LLMGrader:
+    """Scores chunks 1.0/0.0 with a chain returning an object with a `binary_score` of "yes" or "no"."""
+
+    def __init__(self, chain, max_workers: int = 8):
+        self.chain = chain
+        self.max_workers = max_workers
+
+    def iter_scores(self, question: str, docs: Sequence[str]) -> Iterator[Tuple[int, float]]:
+        """Yield (index, score) as grading calls complete; closing the iterator cancels the rest."""
+        pool = ThreadPoolExecutor(max_workers=min(self.max_workers, len(docs)) or 1, thread_name_prefix="grade")
+        try:
+            pending = {
+                pool.submit(self.chain.invoke, {"question": question, "context": doc}): i for i, doc in enumerate(docs)
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    try:
+                        yield i, 1.0 if future.result().binary_score.strip().lower() == "yes" else 0.0
+                    except Exception as e:
+                        print(f"Grading chunk {i} failed, treating it as irrelevant: {e}")
+                        yield i, 0.0
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class CrossEncoderGrader:
+    """Scores chunks 0..1 with a local single-label cross-encoder (needs sentence-transformers).
+
+    Models like ms-marco-MiniLM return raw logits, so a sigmoid is applied
+    explicitly: a threshold of 0.5 then means a logit of 0, whatever the model.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        import torch
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name)
+        # sentence-transformers 4 renamed predict's activation_fct to activation_fn
+        parameters = inspect.signature(self.model.predict).parameters
+        self._activation = {("activation_fn" if "activation_fn" in parameters else "activation_fct"): torch.nn.Sigmoid()}
+
+    def iter_scores(self, question: str, docs: Sequence[str]) -> Iterator[Tuple[int, float]]:
+        for i, score in enumerate(self.model.predict([(question, doc) for doc in docs], **self._activation)):
+            yield i, float(score)
+
+
+def grade(grader, question: str, docs: Sequence[str], threshold: float = 0.5, max_relevant: Optional[int] = None) -> GradeResult:
+    """Grade `docs` against `question`, stopping early once the outcome cannot change."""
+    started = time.perf_counter()
+    scores: List[Optional[float]] = [None] * len(docs)
+    passed = graded = 0
+    early_exit = False
+    scored = grader.iter_scores(question, docs)
+    try:
+        for i, score in scored:
+            scores[i] = score
+            graded += 1
+            passed += score >= threshold
+            if max_relevant is not None and passed >= max_relevant and graded < len(docs):
+                early_exit = True
+                break
+    finally:
+        scored.close()
+    return GradeResult(docs, scores, threshold, time.perf_counter() - started, early_exit)
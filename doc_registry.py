@@ -0,0 +1,270 @@
+"""Local registry of which chunks belong to which document in each namespace.
+
+Pinecone has no cheap "list vectors by metadata" call, so the service records
+namespace -> doc_title -> chunk ids here at ingest time and uses it for
+listing, deleting and renaming instead of dummy-vector top_k scans. If the
+registry and the index ever drift apart, rebuild it from the index with:
+
+    python doc_registry.py reconcile [--namespace NAME]
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_REGISTRY_PATH = os.getenv("DOC_REGISTRY_PATH", "doc_registry.db")
+
+
+def batched(items: Sequence, size: int) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class DocumentRegistry:
+    """SQLite mapping of namespace -> doc_title -> chunk ids, with per-document stats."""
+
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS documents (
+                namespace TEXT,
+                doc_title TEXT,
+                filename TEXT,
+                chunk_count INTEGER DEFAULT 0,
+                char_count INTEGER DEFAULT 0,
+                created_at REAL,
+                updated_at REAL,
+                PRIMARY KEY (namespace, doc_title)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                namespace TEXT,
+                chunk_id TEXT,
+                doc_title TEXT,
+                chunk_index INTEGER,
+                char_count INTEGER,
+                PRIMARY KEY (namespace, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_document ON chunks (namespace, doc_title, chunk_index);
+        ''')
+        self._conn.commit()
+
+    def add_chunks(self, namespace: str, records: Iterable[Tuple[str, Optional[List[float]], dict]]) -> None:
+        """Register upserted (id, values, metadata) records, as passed to `index.upsert`."""
+        now = time.time()
+        rows = []
+        for chunk_id, _, metadata in records:
+            rows.append((
+                namespace,
+                chunk_id,
+                metadata.get('doc_title'),
+                metadata.get('chunk_index'),
+                len(metadata.get('text', '')),
+                metadata.get('original_filename'),
+            ))
+        if not rows:
+            return
+        with self._lock:
+            # Re-registering a chunk (e.g. a resumed job) must not double count it
+            existing = set()
+            for part in batched([row[1] for row in rows], 500):
+                existing.update(chunk_id for (chunk_id,) in self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE namespace = ? AND chunk_id IN ({','.join('?' * len(part))})",
+                    [namespace, *part],
+                ))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (namespace, chunk_id, doc_title, chunk_index, char_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [row[:5] for row in rows],
+            )
+            for row in rows:
+                if row[1] in existing or row[2] is None:
+                    continue
+                self._conn.execute(
+                    "INSERT INTO documents (namespace, doc_title, filename, chunk_count, char_count, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 1, ?, ?, ?) "
+                    "ON CONFLICT (namespace, doc_title) DO UPDATE SET "
+                    "chunk_count = chunk_count + 1, char_count = char_count + excluded.char_count, "
+                    "updated_at = excluded.updated_at",
+                    (namespace, row[2], row[5], row[4], now, now),
+                )
+            self._conn.commit()
+
+    def namespaces(self) -> List[str]:
+        with self._lock:
+            return [ns for (ns,) in self._conn.execute("SELECT DISTINCT namespace FROM documents ORDER BY namespace")]
+
+    def list_documents(self, namespace: str, limit: int = 100, offset: int = 0) -> Tuple[int, List[dict]]:
+        """Return (total document count, one page of documents) for a namespace."""
+        with self._lock:
+            (total,) = self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE namespace = ?", (namespace,)
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT doc_title, filename, chunk_count, char_count, created_at, updated_at FROM documents "
+                "WHERE namespace = ? ORDER BY doc_title LIMIT ? OFFSET ?",
+                (namespace, limit, offset),
+            ).fetchall()
+        return total, [
+            {
+                'title': title,
+                'filename': filename,
+                'total_chunks': chunk_count,
+                'total_chars': char_count,
+                'created_at': created_at,
+                'updated_at': updated_at,
+            }
+            for title, filename, chunk_count, char_count, created_at, updated_at in rows
+        ]
+
+    def chunks(self, namespace: str, doc_title: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, chunk_index FROM chunks WHERE namespace = ? AND doc_title = ? ORDER BY chunk_index",
+                (namespace, doc_title),
+            ).fetchall()
+        return [{'id': chunk_id, 'chunk_index': chunk_index} for chunk_id, chunk_index in rows]
+
+    def iter_chunk_ids(self, namespace: str, doc_title: Optional[str] = None, page_size: int = 1000) -> Iterator[List[str]]:
+        """Yield chunk ids of a namespace (or of one document in it) in pages."""
+        last_id = ""
+        while True:
+            query = "SELECT chunk_id FROM chunks WHERE namespace = ? AND chunk_id > ?"
+            params = [namespace, last_id]
+            if doc_title is not None:
+                query += " AND doc_title = ?"
+                params.append(doc_title)
+            with self._lock:
+                ids = [chunk_id for (chunk_id,) in self._conn.execute(
+                    query + " ORDER BY chunk_id LIMIT ?", [*params, page_size]
+                )]
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    def delete_chunks(self, namespace: str, chunk_ids: Sequence[str]) -> None:
+        with self._lock:
+            for part in batched(list(chunk_ids), 500):
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f"SELECT doc_title, COUNT(*), SUM(char_count) FROM chunks "
+                    f"WHERE namespace = ? AND chunk_id IN ({placeholders}) GROUP BY doc_title",
+                    [namespace, *part],
+                ).fetchall()
+                self._conn.execute(
+                    f"DELETE FROM chunks WHERE namespace = ? AND chunk_id IN ({placeholders})", [namespace, *part]
+                )
+                for doc_title, count, chars in rows:
+                    self._conn.execute(
+                        "UPDATE documents SET chunk_count = chunk_count - ?, char_count = char_count - ?, "
+                        "updated_at = ? WHERE namespace = ? AND doc_title = ?",
+                        (count, chars or 0, time.time(), namespace, doc_title),
+                    )
+            self._conn.execute("DELETE FROM documents WHERE namespace = ? AND chunk_count <= 0", (namespace,))
+            self._conn.commit()
+
+    def delete_document(self, namespace: str, doc_title: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ? AND doc_title = ?", (namespace, doc_title))
+            self._conn.execute("DELETE FROM documents WHERE namespace = ? AND doc_title = ?", (namespace, doc_title))
+            self._conn.commit()
+
+    def delete_namespace(self, namespace: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+            self._conn.execute("DELETE FROM documents WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def _merge_namespace(self, old_namespace: str, new_namespace: str) -> None:
+        """Upsert the rows of `old_namespace` into `new_namespace`, like copying its vectors over does."""
+        self._conn.execute(
+            "INSERT INTO chunks SELECT ?, chunk_id, doc_title, chunk_index, char_count FROM chunks WHERE namespace = ? "
+            "ON CONFLICT (namespace, chunk_id) DO UPDATE SET doc_title = excluded.doc_title, "
+            "chunk_index = excluded.chunk_index, char_count = excluded.char_count",
+            (new_namespace, old_namespace),
+        )
+        self._conn.execute(
+            "INSERT INTO documents SELECT ?, doc_title, filename, chunk_count, char_count, created_at, updated_at "
+            "FROM documents WHERE namespace = ? "
+            "ON CONFLICT (namespace, doc_title) DO UPDATE SET filename = excluded.filename, "
+            "created_at = MIN(created_at, excluded.created_at), updated_at = MAX(updated_at, excluded.updated_at)",
+            (new_namespace, old_namespace),
+        )
+        # Documents present on both sides may share chunks, so recount from the merged chunks
+        self._conn.execute(
+            "UPDATE documents SET "
+            "chunk_count = (SELECT COUNT(*) FROM chunks c "
+            "WHERE c.namespace = documents.namespace AND c.doc_title = documents.doc_title), "
+            "char_count = (SELECT COALESCE(SUM(c.char_count), 0) FROM chunks c "
+            "WHERE c.namespace = documents.namespace AND c.doc_title = documents.doc_title) "
+            "WHERE namespace = ?",
+            (new_namespace,),
+        )
+        self._conn.execute("DELETE FROM documents WHERE namespace = ? AND chunk_count <= 0", (new_namespace,))
+
+    def rename_namespace(self, old_namespace: str, new_namespace: str) -> None:
+        """Move every row to `new_namespace`, merging with whatever it already holds."""
+        with self._lock:
+            self._merge_namespace(old_namespace, new_namespace)
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (old_namespace,))
+            self._conn.execute("DELETE FROM documents WHERE namespace = ?", (old_namespace,))
+            self._conn.commit()
+
+    def copy_namespace(self, old_namespace: str, new_namespace: str) -> None:
+        with self._lock:
+            self._merge_namespace(old_namespace, new_namespace)
+            self._conn.commit()
+
+    def reconcile(self, index, namespace: str, page_size: int = 100) -> int:
+        """Rebuild the registry for `namespace` by paging through every vector id in the index."""
+        self.delete_namespace(namespace)
+        total = 0
+        for ids in index.list(namespace=namespace, limit=page_size):
+            if not ids:
+                continue
+            fetched = index.fetch(ids=list(ids), namespace=namespace)
+            self.add_chunks(namespace, [
+                (vector_id, None, dict(vector.metadata or {}))
+                for vector_id, vector in fetched.vectors.items()
+            ])
+            total += len(ids)
+        return total
+
+
+def delete_ids(index, namespace: str, ids: Sequence[str], batch_size: int = 1000) -> int:
+    """Delete ids from the index in batches within Pinecone's per-request limit."""
+    deleted = 0
+    for part in batched(list(ids), batch_size):
+        index.delete(ids=list(part), namespace=namespace)
+        deleted += len(part)
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local document registry.")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--namespace", help="Only reconcile this namespace (default: all)")
+    parser.add_argument("--index", default="testing")
+    parser.add_argument("--registry", default=DEFAULT_REGISTRY_PATH)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+    load_dotenv('.env')
+
+    index = Pinecone(api_key=os.getenv('PINECONE_API_KEY')).Index(args.index)
+    registry = DocumentRegistry(args.registry)
+    namespaces = [args.namespace] if args.namespace else list(index.describe_index_stats().namespaces.keys())
+    for namespace in namespaces:
+        started = time.time()
+        count = registry.reconcile(index, namespace)
+        print(f"{namespace}: registered {count} chunks in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Persistent, content-addressed cache for text embeddings.
+
+Vectors are stored in SQLite keyed by a hash of (model name, normalized text),
+so re-uploading a file, or a revision that shares most of its chunks, only
+pays for the chunks that actually changed. The database runs in WAL mode and
+can be shared by several services/processes on the same machine.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:  # the cache itself has no hard dependency on LangChain
+    Embeddings = object
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode and whitespace so trivially different chunks share an entry."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store with LRU eviction by entry count and total bytes."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 1_000_000, max_bytes: int = 4 * 1024 ** 3):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                vector BLOB,
+                nbytes INTEGER,
+                last_access REAL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        # Running entry/byte totals, kept exact by triggers in the same transaction as every write,
+        # so eviction never has to scan the table. Seeded once for databases created without them.
+        self._conn.executescript('''
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS embedding_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                entries INTEGER,
+                bytes INTEGER
+            );
+            INSERT OR IGNORE INTO embedding_totals
+                SELECT 0, COUNT(*), COALESCE(SUM(nbytes), 0) FROM embeddings;
+            CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN
+                UPDATE embedding_totals SET entries = entries + 1, bytes = bytes + NEW.nbytes WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN
+                UPDATE embedding_totals SET entries = entries - 1, bytes = bytes - OLD.nbytes WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_resize AFTER UPDATE OF nbytes ON embeddings BEGIN
+                UPDATE embedding_totals SET bytes = bytes - OLD.nbytes + NEW.nbytes WHERE id = 0;
+            END;
+            COMMIT;
+        ''')
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Look up vectors for `texts`; missing entries come back as None."""
+        keys = [cache_key(model, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            unique = list(set(keys))
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = array("f", vector).tobytes()
+            rows.append((cache_key(model, text), model, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                # An upsert (not INSERT OR REPLACE, which deletes without firing triggers) keeps the totals exact
+                "INSERT INTO embeddings (key, model, vector, nbytes, last_access) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET model = excluded.model, vector = excluded.vector, "
+                "nbytes = excluded.nbytes, last_access = excluded.last_access",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def get_or_compute(self, model: str, texts: Sequence[str], compute: Callable[[List[str]], List[List[float]]]):
+        """Return vectors for `texts`, calling `compute` once for the distinct misses."""
+        vectors = self.get_many(model, texts)
+        missing: Dict[str, List[int]] = {}
+        for i, (text, vector) in enumerate(zip(texts, vectors)):
+            if vector is None:
+                missing.setdefault(cache_key(model, text), []).append(i)
+        if missing:
+            # One representative text per distinct normalized chunk
+            todo = [texts[positions[0]] for positions in missing.values()]
+            computed = compute(todo)
+            self.put_many(model, todo, computed)
+            for positions, vector in zip(missing.values(), computed):
+                for i in positions:
+                    vectors[i] = list(vector)
+        return vectors
+
+    def _totals(self):
+        return self._conn.execute("SELECT entries, bytes FROM embedding_totals WHERE id = 0").fetchone()
+
+    def _evict(self):
+        count, total = self._totals()
+        while count > self.max_entries or total > self.max_bytes:
+            # Drop the least recently used ~5% in one go rather than row by row
+            batch = max(1, count // 20)
+            rows = self._conn.execute(
+                "SELECT key, nbytes FROM embeddings ORDER BY last_access LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+            self.evictions += len(rows)
+            count -= len(rows)
+            total -= sum(nbytes for _, nbytes in rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._totals()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+_shared_caches: Dict[str, EmbeddingCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str = DEFAULT_CACHE_PATH) -> EmbeddingCache:
+    """Return the process-wide cache for `path`, creating it on first use."""
+    with _shared_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = EmbeddingCache(path)
+        return _shared_caches[path]
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap a LangChain embeddings object (e.g. OpenAIEmbeddings) with an EmbeddingCache."""
+
+    def __init__(self, embeddings, cache: Optional[EmbeddingCache] = None, model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.model_name = (
+            model_name
+            or getattr(embeddings, "model", None)
+            or getattr(embeddings, "model_name", None)
+            or type(embeddings).__name__
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.cache.get_or_compute(self.model_name, texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.get_or_compute(
+            self.model_name, [text], lambda texts: [self.embeddings.embed_query(texts[0])]
+        )[0]
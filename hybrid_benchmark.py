@@ -0,0 +1,195 @@
+"""Recall and latency of dense-only vs hybrid (BM25 + dense, RRF, rerank) retrieval on a fixture corpus.
+
+The fixture is a synthetic corpus of invoice/product/meeting notes. Each chunk
+carries a unique identifier (invoice number, SKU or a person's name) and a few
+distinctive concepts, every concept having two synonymous surface forms. Half
+the queries ask for an identifier; the other half paraphrase a chunk's
+concepts with their other surface form, which BM25 cannot match. The stub
+dense model understands the synonyms but blurs identifiers, the way real
+embedding models do. --openai uses text-embedding-3-small instead (needs
+OPENAI_API_KEY); the made-up synonyms mean nothing to it, so only its
+identifier recall is meaningful. Recall is whether the target chunk is in the context
+handed to the LLM.
+
+    python hybrid_benchmark.py --chunks 5000 --queries 200 --dense-latency 0.08
+    python hybrid_benchmark.py --rerank-model cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from hybrid_retrieval import HybridRetriever, SparseIndex, token_counter
+
+TOPICS = {
+    "billing": "invoice payment overdue balance refund credit charge billing statement amount due",
+    "shipping": "shipment delivery courier tracking warehouse dispatch parcel delayed carrier route",
+    "product": "sku product inventory stock variant colour size catalogue listing supplier",
+    "meeting": "meeting agenda minutes attendees decision action follow-up schedule review quarterly",
+    "support": "ticket customer complaint support escalation resolved outage account password reset",
+}
+FIRST_NAMES = "amina bruno chen dalia emeka farah goran hana ivan jonas kofi lena mateo nadia omar priya".split()
+LAST_NAMES = "abbott bianchi cruz dimitrov eriksen fontaine gupta haddad ito jensen kowalski lindqvist moreau".split()
+
+
+def make_identifier(rng, topic, i):
+    if topic == "billing":
+        return f"INV-{2020 + i % 5}-{i:05d}"
+    if topic == "product":
+        return f"SKU-{rng.choice('ABCDEFGH')}{i:05d}"
+    return f"{rng.choice(FIRST_NAMES).title()} {rng.choice(LAST_NAMES).title()}{i}"
+
+
+SYLLABLES = "ka lo mi ne ru sa ti vo ze bra dun fel gor hap jin kel mor pil quor sten".split()
+
+
+def make_concepts(n_concepts, rng):
+    """[(form used in documents, synonym used in queries)] of made-up words"""
+    words = set()
+    while len(words) < 2 * n_concepts:
+        words.add("".join(rng.choices(SYLLABLES, k=3)))
+    words = sorted(words)
+    rng.shuffle(words)
+    return list(zip(words[::2], words[1::2]))
+
+
+def make_corpus(n_chunks, seed, concepts_per_chunk=6):
+    """Returns [(chunk_id, identifier, concepts, text)] and the synonym table {word: concept}."""
+    rng = random.Random(seed)
+    concepts = make_concepts(max(100, n_chunks // 2), rng)
+    synonyms = {word: form for form, synonym in concepts for word in (form, synonym)}
+    corpus = []
+    for i in range(n_chunks):
+        topic = rng.choice(list(TOPICS))
+        identifier = make_identifier(rng, topic, i)
+        chosen = rng.sample(concepts, concepts_per_chunk)
+        words = rng.choices(TOPICS[topic].split(), k=40) + [form for form, _ in chosen]
+        rng.shuffle(words)
+        position = rng.randrange(len(words))
+        text = " ".join(words[:position] + [f"regarding {identifier}"] + words[position:]) + "."
+        corpus.append((f"chunk-{i}", identifier, chosen, text))
+    return corpus, synonyms
+
+
+def make_queries(corpus, n_queries, seed):
+    """[(kind, query, target chunk id)]"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for n in range(n_queries):
+        chunk_id, identifier, concepts, _ = rng.choice(corpus)
+        if n % 2 == 0:
+            queries.append(("identifier", f"what is the status of {identifier}?", chunk_id))
+        else:
+            queries.append(("topical", " ".join(synonym for _, synonym in rng.sample(concepts, 4)), chunk_id))
+    return queries
+
+
+class StubEmbeddings:
+    """Hashed bag-of-concepts embeddings: synonyms share a dimension, words with digits are dropped."""
+
+    def __init__(self, synonyms, dim=1024):
+        self.synonyms = synonyms
+        self.dim = dim
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().replace("?", " ").replace(".", " ").split():
+            if any(ch.isdigit() for ch in word):
+                continue
+            word = self.synonyms.get(word, word)
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16) % self.dim] += 1.0
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class InMemoryVectorStore:
+    """Exact cosine search with a simulated network round trip."""
+
+    def __init__(self, embeddings, corpus, latency):
+        self.embeddings = embeddings
+        self.latency = latency
+        self.docs = [Document(page_content=text, metadata={"doc_id": chunk_id}) for chunk_id, *_, text in corpus]
+        vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in self.docs]), dtype=np.float32)
+        self.matrix = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+    def similarity_search(self, query, k=4):
+        time.sleep(self.latency)
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        scores = self.matrix @ (vector / (np.linalg.norm(vector) or 1.0))
+        return [self.docs[i] for i in np.argsort(-scores)[:k]]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run(name, retrieve, queries, count_tokens):
+    hits, latencies, tokens = {"identifier": [], "topical": []}, [], []
+    for kind, query, target in queries:
+        started = time.perf_counter()
+        docs = retrieve(query)
+        latencies.append(time.perf_counter() - started)
+        hits[kind].append(any(doc.metadata.get("doc_id") == target for doc in docs))
+        tokens.append(sum(count_tokens(doc.page_content) for doc in docs))
+    print(
+        f"{name:<22}{statistics.mean(hits['identifier'] + hits['topical']):>8.2%}"
+        f"{statistics.mean(hits['identifier']):>8.2%}{statistics.mean(hits['topical']):>8.2%}"
+        f"{statistics.mean(tokens):>8.0f}{1000 * percentile(latencies, 0.5):>9.1f}{1000 * percentile(latencies, 0.95):>9.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dense-latency", type=float, default=0.08, help="Simulated vector search round trip (s)")
+    parser.add_argument("--max-tokens", type=int, default=400, help="Context token budget of the hybrid retriever")
+    parser.add_argument("--rerank-model", default=None, help="Cross-encoder for the reranked run (needs sentence-transformers)")
+    parser.add_argument("--openai", action="store_true", help="Use OpenAI embeddings for the dense side")
+    parser.add_argument("--dir", default=None, help="Where to build the sparse index (default: a temp dir)")
+    args = parser.parse_args()
+
+    corpus, synonyms = make_corpus(args.chunks, args.seed)
+    queries = make_queries(corpus, args.queries, args.seed)
+    if args.openai:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    else:
+        embeddings = StubEmbeddings(synonyms)
+
+    started = time.perf_counter()
+    vector_store = InMemoryVectorStore(embeddings, corpus, args.dense_latency)
+    sparse_index = SparseIndex(os.path.join(args.dir or tempfile.mkdtemp(), "sparse_index.db"))
+    sparse_index.add_chunks("bench", [(chunk_id, None, {"text": text, "doc_id": chunk_id}) for chunk_id, *_, text in corpus])
+    print(f"Indexed {len(corpus)} chunks in {time.perf_counter() - started:.1f}s; {len(queries)} queries\n")
+
+    count_tokens = token_counter()
+    hybrid = HybridRetriever(lambda namespace: vector_store, sparse_index, max_tokens=args.max_tokens, count_tokens=count_tokens)
+    print(f"{'retriever':<22}{'recall':>8}{'ids':>8}{'topical':>8}{'tokens':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    run("dense k=2", lambda query: vector_store.similarity_search(query, k=2), queries, count_tokens)
+    run("dense k=10", lambda query: vector_store.similarity_search(query, k=10), queries, count_tokens)
+    run("bm25 k=10", lambda query: [
+        Document(page_content=hit.text, metadata=hit.metadata) for hit in sparse_index.search("bench", query, k=10)
+    ], queries, count_tokens)
+    run("hybrid rrf", lambda query: hybrid.retrieve("bench", query)[0], queries, count_tokens)
+    if args.rerank_model:
+        from doc_grader import CrossEncoderGrader
+        hybrid.reranker = CrossEncoderGrader(args.rerank_model)
+        run("hybrid rrf + rerank", lambda query: hybrid.retrieve("bench", query)[0], queries, count_tokens)
+
+
+if __name__ == "__main__":
+    main()
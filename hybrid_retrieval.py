@@ -0,0 +1,351 @@
+"""Hybrid sparse + dense retrieval for the RAG services.
+
+Dense similarity search is good at paraphrases but routinely misses exact
+terms (invoice numbers, SKUs, names) that embedding models blur. SparseIndex
+is a local BM25 index kept alongside each Pinecone namespace: chunks are added
+at ingest time (it has the same add/delete/rename/copy methods as
+DocumentRegistry, so it hangs off the same hooks) and stored in SQLite.
+
+HybridRetriever runs the dense and the BM25 search concurrently, fuses the two
+rankings with reciprocal rank fusion, optionally reranks the fused candidates
+on CPU with a small cross-encoder, and keeps the best chunks that fit in a
+token budget instead of a fixed k. Namespaces indexed before the sparse index
+existed can be back-filled from Pinecone with:
+
+    python hybrid_retrieval.py reconcile [--namespace NAME]
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from doc_registry import batched
+
+DEFAULT_SPARSE_INDEX_PATH = os.getenv("SPARSE_INDEX_PATH", "sparse_index.db")
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:#][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when where "
+    "which who why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; identifiers like "INV-2024-0042" are kept whole and also split into their parts."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-_./:#]", token) if part not in STOPWORDS)
+    return terms
+
+
+class SparseHit:
+    def __init__(self, chunk_id: str, score: float, text: str, metadata: dict):
+        self.chunk_id = chunk_id
+        self.score = score
+        self.text = text
+        self.metadata = metadata
+
+
+class SparseIndex:
+    """SQLite-backed BM25 index over the chunks of each namespace."""
+
+    def __init__(self, path: str = DEFAULT_SPARSE_INDEX_PATH, k1: float = 1.5, b: float = 0.75, text_key: str = "text"):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.text_key = text_key
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                namespace TEXT,
+                chunk_id TEXT,
+                doc_title TEXT,
+                length INTEGER,
+                text TEXT,
+                metadata TEXT,
+                PRIMARY KEY (namespace, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_document ON chunks (namespace, doc_title);
+            CREATE TABLE IF NOT EXISTS postings (
+                namespace TEXT,
+                term TEXT,
+                chunk_id TEXT,
+                tf INTEGER,
+                PRIMARY KEY (namespace, term, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS postings_by_chunk ON postings (namespace, chunk_id);
+        ''')
+        self._conn.commit()
+
+    def add_chunks(self, namespace: str, records: Iterable[Tuple[str, Optional[List[float]], dict]]) -> None:
+        """Index upserted (id, values, metadata) records, as passed to `index.upsert`."""
+        rows, postings = [], []
+        for chunk_id, _, metadata in records:
+            text = metadata.get(self.text_key, "")
+            terms = Counter(tokenize(text))
+            extra = {key: value for key, value in metadata.items() if key != self.text_key}
+            rows.append((namespace, chunk_id, metadata.get("doc_title"), sum(terms.values()), text, json.dumps(extra, default=str)))
+            postings.extend((namespace, term, chunk_id, tf) for term, tf in terms.items())
+        if not rows:
+            return
+        with self._lock:
+            # Re-indexing a chunk (e.g. a resumed job) replaces its postings
+            self._delete_postings(namespace, [row[1] for row in rows])
+            self._conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?, ?)", postings)
+            self._conn.commit()
+
+    def _delete_postings(self, namespace: str, chunk_ids: Sequence[str]) -> None:
+        for part in batched(list(chunk_ids), 500):
+            self._conn.execute(
+                f"DELETE FROM postings WHERE namespace = ? AND chunk_id IN ({','.join('?' * len(part))})",
+                [namespace, *part],
+            )
+
+    def delete_chunks(self, namespace: str, chunk_ids: Sequence[str]) -> None:
+        with self._lock:
+            self._delete_postings(namespace, chunk_ids)
+            for part in batched(list(chunk_ids), 500):
+                self._conn.execute(
+                    f"DELETE FROM chunks WHERE namespace = ? AND chunk_id IN ({','.join('?' * len(part))})",
+                    [namespace, *part],
+                )
+            self._conn.commit()
+
+    def delete_document(self, namespace: str, doc_title: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM postings WHERE namespace = ? AND chunk_id IN "
+                "(SELECT chunk_id FROM chunks WHERE namespace = ? AND doc_title = ?)",
+                (namespace, namespace, doc_title),
+            )
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ? AND doc_title = ?", (namespace, doc_title))
+            self._conn.commit()
+
+    def delete_namespace(self, namespace: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM postings WHERE namespace = ?", (namespace,))
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def _merge_namespace(self, old_namespace: str, new_namespace: str) -> None:
+        """Upsert the chunks of `old_namespace` into `new_namespace`, replacing the postings of shared ids."""
+        self._conn.execute(
+            "DELETE FROM postings WHERE namespace = ? AND chunk_id IN (SELECT chunk_id FROM chunks WHERE namespace = ?)",
+            (new_namespace, old_namespace),
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO postings SELECT ?, term, chunk_id, tf FROM postings WHERE namespace = ?",
+            (new_namespace, old_namespace),
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chunks SELECT ?, chunk_id, doc_title, length, text, metadata FROM chunks WHERE namespace = ?",
+            (new_namespace, old_namespace),
+        )
+
+    def rename_namespace(self, old_namespace: str, new_namespace: str) -> None:
+        """Move every chunk to `new_namespace`, merging with whatever it already holds."""
+        with self._lock:
+            self._merge_namespace(old_namespace, new_namespace)
+            self._conn.execute("DELETE FROM postings WHERE namespace = ?", (old_namespace,))
+            self._conn.execute("DELETE FROM chunks WHERE namespace = ?", (old_namespace,))
+            self._conn.commit()
+
+    def copy_namespace(self, old_namespace: str, new_namespace: str) -> None:
+        with self._lock:
+            self._merge_namespace(old_namespace, new_namespace)
+            self._conn.commit()
+
+    def search(self, namespace: str, query: str, k: int = 10) -> List[SparseHit]:
+        """Top `k` chunks of `namespace` by BM25 score for `query`."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE namespace = ?", (namespace,)
+            ).fetchone()
+            if n_docs == 0:
+                return []
+            postings = self._conn.execute(
+                f"SELECT term, chunk_id, tf FROM postings WHERE namespace = ? AND term IN ({','.join('?' * len(terms))})",
+                [namespace, *terms],
+            ).fetchall()
+            by_term = defaultdict(list)
+            for term, chunk_id, tf in postings:
+                by_term[term].append((chunk_id, tf))
+            lengths = {}
+            for part in batched(list({chunk_id for _, chunk_id, _ in postings}), 500):
+                lengths.update(self._conn.execute(
+                    f"SELECT chunk_id, length FROM chunks WHERE namespace = ? AND chunk_id IN ({','.join('?' * len(part))})",
+                    [namespace, *part],
+                ))
+
+            average_length = total_length / n_docs
+            scores = defaultdict(float)
+            for term, matches in by_term.items():
+                idf = math.log(1 + (n_docs - len(matches) + 0.5) / (len(matches) + 0.5))
+                for chunk_id, tf in matches:
+                    norm = self.k1 * (1 - self.b + self.b * lengths.get(chunk_id, average_length) / average_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not top:
+                return []
+            rows = dict((chunk_id, (text, metadata)) for chunk_id, text, metadata in self._conn.execute(
+                f"SELECT chunk_id, text, metadata FROM chunks WHERE namespace = ? AND chunk_id IN ({','.join('?' * len(top))})",
+                [namespace, *[chunk_id for chunk_id, _ in top]],
+            ))
+        return [SparseHit(chunk_id, score, rows[chunk_id][0], json.loads(rows[chunk_id][1])) for chunk_id, score in top]
+
+    def reconcile(self, index, namespace: str, page_size: int = 100) -> int:
+        """Rebuild the sparse index for `namespace` from the text stored in the vectors' metadata."""
+        self.delete_namespace(namespace)
+        total = 0
+        for ids in index.list(namespace=namespace, limit=page_size):
+            if not ids:
+                continue
+            fetched = index.fetch(ids=list(ids), namespace=namespace)
+            self.add_chunks(namespace, [
+                (vector_id, None, dict(vector.metadata or {}))
+                for vector_id, vector in fetched.vectors.items()
+            ])
+            total += len(ids)
+        return total
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+def token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except ImportError:
+        return lambda text: len(text) // 4 + 1
+
+
+def _chunk_key(doc: Document) -> str:
+    return doc.metadata.get("doc_id") or getattr(doc, "id", None) or doc.page_content
+
+
+class HybridRetriever:
+    """Dense + BM25 retrieval fused with RRF, optionally reranked, trimmed to a token budget.
+
+    `vector_store_for(namespace)` returns a LangChain vector store; `reranker`
+    is anything with `iter_scores(query, texts)` (e.g. doc_grader.CrossEncoderGrader).
+    """
+
+    def __init__(
+        self,
+        vector_store_for: Callable[[str], object],
+        sparse_index: SparseIndex,
+        reranker=None,
+        dense_k: int = 10,
+        sparse_k: int = 10,
+        rerank_candidates: int = 20,
+        max_tokens: int = 1000,
+        rrf_k: int = 60,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        self.vector_store_for = vector_store_for
+        self.sparse_index = sparse_index
+        self.reranker = reranker
+        self.dense_k = dense_k
+        self.sparse_k = sparse_k
+        self.rerank_candidates = rerank_candidates
+        self.max_tokens = max_tokens
+        self.rrf_k = rrf_k
+        self.count_tokens = count_tokens or token_counter()
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dense")
+
+    def retrieve(self, namespace: str, query: str) -> Tuple[List[Document], Dict[str, float]]:
+        """Return the selected chunks, best first, and per-stage timings in seconds."""
+        started = time.perf_counter()
+        timings = {}
+
+        def dense():
+            dense_started = time.perf_counter()
+            docs = self.vector_store_for(namespace).similarity_search(query, k=self.dense_k)
+            timings["dense"] = round(time.perf_counter() - dense_started, 4)
+            return docs
+
+        # The dense search is a network round trip; run BM25 while it is in flight
+        dense_future = self._pool.submit(dense)
+        sparse_started = time.perf_counter()
+        sparse_hits = self.sparse_index.search(namespace, query, k=self.sparse_k) if self.sparse_k else []
+        timings["sparse"] = round(time.perf_counter() - sparse_started, 4)
+        dense_docs = dense_future.result()
+
+        candidates: Dict[str, Document] = {}
+        for doc in dense_docs:
+            candidates.setdefault(_chunk_key(doc), doc)
+        for hit in sparse_hits:
+            candidates.setdefault(hit.chunk_id, Document(page_content=hit.text, metadata=hit.metadata))
+        fused = reciprocal_rank_fusion(
+            [[_chunk_key(doc) for doc in dense_docs], [hit.chunk_id for hit in sparse_hits]], k=self.rrf_k
+        )[: self.rerank_candidates]
+        ranked = [candidates[key] for key in fused]
+
+        if self.reranker is not None and len(ranked) > 1:
+            rerank_started = time.perf_counter()
+            scores = dict(self.reranker.iter_scores(query, [doc.page_content for doc in ranked]))
+            ranked = [ranked[i] for i in sorted(range(len(ranked)), key=lambda i: scores.get(i, 0.0), reverse=True)]
+            timings["rerank"] = round(time.perf_counter() - rerank_started, 4)
+
+        selected, used = [], 0
+        for doc in ranked:
+            tokens = self.count_tokens(doc.page_content)
+            if selected and used + tokens > self.max_tokens:
+                break
+            selected.append(doc)
+            used += tokens
+        timings["total"] = round(time.perf_counter() - started, 4)
+        return selected, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local sparse (BM25) index.")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--namespace", help="Only reconcile this namespace (default: all)")
+    parser.add_argument("--index", default="testing")
+    parser.add_argument("--sparse-index", default=DEFAULT_SPARSE_INDEX_PATH)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+    load_dotenv('.env')
+
+    index = Pinecone(api_key=os.getenv('PINECONE_API_KEY')).Index(args.index)
+    sparse_index = SparseIndex(args.sparse_index)
+    namespaces = [args.namespace] if args.namespace else list(index.describe_index_stats().namespaces.keys())
+    for namespace in namespaces:
+        started = time.time()
+        count = sparse_index.reconcile(index, namespace)
+        print(f"{namespace}: indexed {count} chunks in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
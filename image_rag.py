@@ -13,15 +13,22 @@ import streamlit as st
 import torch
 from PIL import Image
 import sqlite3
-import numpy as np
 import pickle
 import base64
 import io
 from colpali_engine.models import ColQwen2, ColQwen2Processor
 import gc
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
 from io import BytesIO
 import hashlib  # Import hashlib for hashing
+import os
+import queue
+import threading
+from multivector_index import MultiVectorIndex
+
+INDEX_DIR = os.getenv("IMAGE_INDEX_DIR", "image_index")
+ENCODE_BATCH_SIZE = int(os.getenv("IMAGE_ENCODE_BATCH_SIZE", "4"))
+RENDER_BATCH_PAGES = int(os.getenv("PDF_RENDER_BATCH_PAGES", "8"))
 
 def get_device():
     if torch.cuda.is_available():
@@ -47,39 +54,140 @@ def load_model():
     return model, processor
 
 # Function to get a database connection
+@st.cache_resource
 def get_db_connection():
-    conn = sqlite3.connect('image_embeddings.db')
+    """One shared WAL connection; page images live in their own table, read only for top-k hits."""
+    conn = sqlite3.connect('image_embeddings.db', check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS images (
+            image_hash TEXT PRIMARY KEY,
+            png BLOB
+        )
+    ''')
+    conn.commit()
     return conn
 
-def process_and_index_image(image, img_str, image_hash, processor, model):
-    # Store in database
+@st.cache_resource
+def load_index():
+    """Open the multi-vector index, migrating rows written by older versions into the index and image table."""
+    index = MultiVectorIndex(INDEX_DIR)
     conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS embeddings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            image_base64 TEXT,
-            image_hash TEXT UNIQUE,
-            embedding BLOB
+    try:
+        rows = conn.execute('SELECT image_hash, embedding FROM embeddings WHERE embedding IS NOT NULL')
+        migrated = index.add_many(
+            (image_hash, pickle.loads(embedding_bytes))
+            for image_hash, embedding_bytes in rows
+            if image_hash not in index
         )
-    ''')
-    # Check if the image hash already exists
-    c.execute('SELECT id FROM embeddings WHERE image_hash = ?', (image_hash,))
-    result = c.fetchone()
-    if result:
-        # Image already indexed
-        conn.close()
-        return
-    # Process image to get embedding
-    batch_images = processor.process_images([image]).to(model.device)
+        conn.executemany(
+            'INSERT OR IGNORE INTO images (image_hash, png) VALUES (?, ?)',
+            [(image_hash, base64.b64decode(img_str))
+             for image_hash, img_str in conn.execute('SELECT image_hash, image_base64 FROM embeddings')],
+        )
+        conn.execute('DROP TABLE embeddings')
+        conn.commit()
+        print(f"Migrated {migrated} embeddings to {INDEX_DIR}")
+    except sqlite3.OperationalError:
+        pass  # Nothing to migrate
+    return index
+
+def get_page_images(image_hashes):
+    """Load PNG bytes for the given page hashes only."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        f"SELECT image_hash, png FROM images WHERE image_hash IN ({','.join('?' * len(image_hashes))})",
+        list(image_hashes),
+    ).fetchall()
+    return dict(rows)
+
+def to_page(image):
+    """PNG-encode a page and hash it; the hash keys the page in both the index and the image table."""
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    png = buffer.getvalue()
+    return image, png, hashlib.sha256(png).hexdigest()
+
+def render_uploads(uploaded_files, pages, render_batch=RENDER_BATCH_PAGES, stop=None):
+    """Producer: render PDF pages a few at a time (and decode images) onto a bounded queue.
+
+    Stops early once `stop` is set, e.g. because the consumer failed.
+    """
+    try:
+        for uploaded_file in uploaded_files:
+            data = uploaded_file.getvalue()
+            if uploaded_file.type == 'application/pdf':
+                page_count = pdfinfo_from_bytes(data)["Pages"]
+                for first in range(1, page_count + 1, render_batch):
+                    last = min(first + render_batch - 1, page_count)
+                    for image in convert_from_bytes(data, first_page=first, last_page=last):
+                        if stop is not None and stop.is_set():
+                            return
+                        pages.put(to_page(image.convert('RGB')))
+            else:
+                if stop is not None and stop.is_set():
+                    return
+                pages.put(to_page(Image.open(io.BytesIO(data)).convert('RGB')))
+    except Exception as e:
+        pages.put(e)
+    finally:
+        pages.put(None)
+
+def encode_pages(batch, processor, model):
+    """Run the model on a batch of pages and return per-page token embeddings without padding."""
+    batch_images = processor.process_images([image for image, _, _ in batch]).to(model.device)
     with torch.no_grad():
         image_embeddings = model(**batch_images)
-    image_embedding = image_embeddings[0].cpu().to(torch.float32).numpy()
-    # Serialize the embedding
-    embedding_bytes = pickle.dumps(image_embedding)
-    c.execute('INSERT INTO embeddings (image_base64, image_hash, embedding) VALUES (?, ?, ?)', (img_str, image_hash, embedding_bytes))
-    conn.commit()
-    conn.close()
+    mask = batch_images["attention_mask"].bool().cpu()
+    embeddings = image_embeddings.cpu().to(torch.float32)
+    return [embeddings[i][mask[i]].numpy() for i in range(len(batch))]
+
+def index_uploads(uploaded_files, processor, model, index, batch_size=ENCODE_BATCH_SIZE, on_progress=None):
+    """Index uploaded images/PDFs; pages render in a thread while the model encodes earlier batches."""
+    conn = get_db_connection()
+    pages = queue.Queue(maxsize=batch_size * 2)
+    stop = threading.Event()
+    renderer = threading.Thread(target=render_uploads, args=(uploaded_files, pages), kwargs={"stop": stop}, daemon=True)
+    renderer.start()
+    added = 0
+    done = False
+    try:
+        while not done:
+            batch, seen = [], set()
+            while len(batch) < batch_size:
+                page = pages.get()
+                if page is None:
+                    done = True
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                if page[2] in index or page[2] in seen:
+                    continue  # Already indexed
+                seen.add(page[2])
+                batch.append(page)
+            if not batch:
+                continue
+            embeddings = encode_pages(batch, processor, model)
+            # Images first: a page only counts as indexed once its embedding is in the index
+            conn.executemany(
+                'INSERT OR IGNORE INTO images (image_hash, png) VALUES (?, ?)',
+                [(image_hash, png) for _, png, image_hash in batch],
+            )
+            conn.commit()
+            index.add_many(zip([image_hash for _, _, image_hash in batch], embeddings))
+            added += len(batch)
+            if on_progress is not None:
+                on_progress(added)
+    except BaseException:
+        # Let the renderer finish instead of blocking forever on a full queue
+        stop.set()
+        while not done and pages.get() is not None:
+            pass
+        raise
+    finally:
+        renderer.join()
+    return added
 
 def clear_cache():
     """Clear GPU memory cache for different platforms."""
@@ -96,10 +204,7 @@ def main():
     st.title("📷 Image RAG(Colpali + Llama Vision)")
 
     model, processor = load_model()
-
-    # Initialize session state for image hashes
-    if 'image_hashes' not in st.session_state:
-        st.session_state.image_hashes = set()
+    index = load_index()
 
     # Use st.radio for tab selection
     tab = st.radio("Navigation", ["➕ Add to Index", "🔍 Query Index"])
@@ -109,37 +214,13 @@ def main():
         # File uploader
         uploaded_files = st.file_uploader("Upload Images", accept_multiple_files=True, type=['png', 'jpg', 'jpeg', 'pdf'])
         if uploaded_files:
-            # Process the uploaded images
-            for uploaded_file in uploaded_files:
-                if uploaded_file.type == 'application/pdf':
-                    images = convert_from_bytes(uploaded_file.read())
-                    for image in images:
-                        buffer = BytesIO()
-                        image.save(buffer, format="PNG")
-                        byte_data = buffer.getvalue()
-                        img_str = base64.b64encode(byte_data).decode('utf-8')
-                        # Compute image hash
-                        image_hash = hashlib.sha256(byte_data).hexdigest()
-                        if image_hash in st.session_state.image_hashes:
-                            continue  # Skip if already processed in this session
-                        process_and_index_image(image, img_str, image_hash, processor, model)
-                        st.session_state.image_hashes.add(image_hash)
-                else:
-                    # Read image data
-                    image_data = uploaded_file.read()
-                    # Compute image hash
-                    image_hash = hashlib.sha256(image_data).hexdigest()
-                    if image_hash in st.session_state.image_hashes:
-                        continue  # Skip if already processed in this session
-                    # Convert to PIL Image
-                    image = Image.open(io.BytesIO(image_data)).convert('RGB')
-                    # Encode image to base64
-                    buffered = io.BytesIO()
-                    image.save(buffered, format="PNG")
-                    img_str = base64.b64encode(buffered.getvalue()).decode()
-                    process_and_index_image(image, img_str, image_hash, processor, model)
-                    st.session_state.image_hashes.add(image_hash)
-            st.success("Images added to index.")
+            status = st.empty()
+            added = index_uploads(
+                uploaded_files, processor, model, index,
+                on_progress=lambda count: status.write(f"Encoded {count} pages..."),
+            )
+            clear_cache()
+            st.success(f"Images added to index ({added} new pages).")
 
     elif tab == "🔍 Query Index":
         st.header("Query Index")
@@ -151,77 +232,22 @@ def main():
                 query_embedding = model(**batch_query)
             query_embedding_cpu = query_embedding.cpu().to(torch.float32).numpy()[0]
 
-            # Retrieve image embeddings from database
-            conn = get_db_connection()
-            c = conn.cursor()
-            c.execute('SELECT image_base64, embedding FROM embeddings')
-            rows = c.fetchall()
-            conn.close()
-
-            if not rows:
+            if len(index) == 0:
                 st.warning("No images found in the index. Please add images first.")
                 return
 
-            # Set fixed sequence length
-            fixed_seq_len = 620  # Adjust based on your embeddings
-
-            image_embeddings_list = []
-            image_base64_list = []
-
-            for row in rows:
-                image_base64, embedding_bytes = row
-                embedding = pickle.loads(embedding_bytes)
-                seq_len, embedding_dim = embedding.shape
-
-                # Adjust to fixed sequence length
-                if seq_len < fixed_seq_len:
-                    padding = np.zeros((fixed_seq_len - seq_len, embedding_dim), dtype=embedding.dtype)
-                    embedding_fixed = np.concatenate([embedding, padding], axis=0)
-                elif seq_len > fixed_seq_len:
-                    embedding_fixed = embedding[:fixed_seq_len, :]
-                else:
-                    embedding_fixed = embedding  # No adjustment needed
-
-                image_embeddings_list.append(embedding_fixed)
-                image_base64_list.append(image_base64)
-
-            # Stack embeddings
-            retrieved_image_embeddings = np.stack(image_embeddings_list)
-
-            # Adjust query embedding
-            seq_len_q, embedding_dim_q = query_embedding_cpu.shape
-
-            if seq_len_q < fixed_seq_len:
-                padding = np.zeros((fixed_seq_len - seq_len_q, embedding_dim_q), dtype=query_embedding_cpu.dtype)
-                query_embedding_fixed = np.concatenate([query_embedding_cpu, padding], axis=0)
-            elif seq_len_q > fixed_seq_len:
-                query_embedding_fixed = query_embedding_cpu[:fixed_seq_len, :]
-            else:
-                query_embedding_fixed = query_embedding_cpu
-
-            # Convert to tensors
-            query_embedding_tensor = torch.from_numpy(query_embedding_fixed).to(model.device).unsqueeze(0)
-            retrieved_image_embeddings_tensor = torch.from_numpy(retrieved_image_embeddings).to(model.device)
-
-            # Compute similarity scores
-            with torch.no_grad():
-                scores = processor.score_multi_vector(query_embedding_tensor, retrieved_image_embeddings_tensor)
-            scores_np = scores.cpu().numpy().flatten()
-            del query_embedding_tensor, retrieved_image_embeddings_tensor, scores  # Free up memory
+            # MaxSim over the memory-mapped token embeddings; only the best page's image is loaded
+            hits = index.search(query_embedding_cpu, top_k=1)
+            del query_embedding
             clear_cache()
 
-            # Combine images and scores
-            similarities = list(zip(image_base64_list, scores_np))
-
-            # Sort by similarity
-            similarities.sort(key=lambda x: x[1], reverse=True)
+            images = get_page_images([image_hash for image_hash, _ in hits])
+            similarities = [(images[image_hash], score) for image_hash, score in hits if image_hash in images]
 
             if similarities:
                 st.write("Most similar image:")
-                img_str, score = similarities[0]
+                img_data, score = similarities[0]
                 st.write(f"Similarity Score: {score:.4f}")
-                # Decode image from base64
-                img_data = base64.b64decode(img_str)
                 image = Image.open(io.BytesIO(img_data))
                 st.image(image)
             else:
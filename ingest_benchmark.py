@@ -0,0 +1,106 @@
+"""Benchmark the rag_ingest pipeline against a stub embedding model and a stub index.
+
+Simulates network latency for embedding and upsert calls so the effect of
+batching and concurrency can be measured without touching OpenAI or Pinecone.
+
+    python ingest_benchmark.py --pages 300 --embed-latency 0.25 --upsert-latency 0.08
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from rag_ingest import IngestPipeline
+
+WORDS = "invoice pinecone vector namespace chunk embedding retrieval flask upload query answer model".split()
+
+
+class StubEmbeddings:
+    """Deterministic fake embeddings with a fixed per-call plus per-text latency."""
+
+    def __init__(self, dim=1536, latency=0.25, per_text_latency=0.001):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text):
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        return [rng.random() for _ in range(8)] + [0.0] * (self.dim - 8)
+
+
+class StubIndex:
+    """In-memory stand-in for a Pinecone index that fails a fraction of upserts."""
+
+    def __init__(self, latency=0.08, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.vectors = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace=None):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError("stub upsert failure")
+        with self._lock:
+            for vector_id, values, metadata in vectors:
+                self.vectors[(namespace, vector_id)] = (values, metadata)
+
+
+def make_pages(count, words_per_page):
+    rng = random.Random(0)
+    for page in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(words_per_page))
+        yield Document(page_content=text, metadata={"source": "bench.pdf", "page": page})
+
+
+def run(label, args, **pipeline_kwargs):
+    embeddings = StubEmbeddings(latency=args.embed_latency)
+    index = StubIndex(latency=args.upsert_latency, failure_rate=args.failure_rate)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    pipeline = IngestPipeline(embeddings, index, splitter, **pipeline_kwargs)
+    stats, _ = pipeline.run(make_pages(args.pages, args.words_per_page), "bench", "bench", "bench.pdf")
+    assert len(index.vectors) == stats.chunks, "stub index is missing chunks"
+    print(
+        f"{label:<34} chunks={stats.chunks:<6} time={stats.elapsed:7.2f}s "
+        f"rate={stats.chunks_per_sec:8.1f} chunks/s embed_calls={embeddings.calls:<4} retries={stats.retries}"
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--words-per-page", type=int, default=450)
+    parser.add_argument("--embed-latency", type=float, default=0.25)
+    parser.add_argument("--upsert-latency", type=float, default=0.08)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"pages={args.pages} embed_latency={args.embed_latency}s upsert_latency={args.upsert_latency}s")
+    # Roughly what vector_store.add_documents did: sequential embedding and upserts.
+    run("sequential (batch=1000, 1 worker)", args,
+        embed_batch_size=1000, embed_concurrency=1, upsert_batch_size=32, upsert_concurrency=1)
+    run("batched (batch=128, 1 worker)", args,
+        embed_batch_size=128, embed_concurrency=1, upsert_batch_size=100, upsert_concurrency=1)
+    run("concurrent (batch=64, 4+4 workers)", args,
+        embed_batch_size=64, embed_concurrency=4, upsert_batch_size=100, upsert_concurrency=4)
+    run("concurrent (batch=32, 8+8 workers)", args,
+        embed_batch_size=32, embed_concurrency=8, upsert_batch_size=100, upsert_concurrency=8)
+
+
+if __name__ == "__main__":
+    main()
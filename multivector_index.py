@@ -0,0 +1,282 @@
+"""Persistent multi-vector (late-interaction) index for ColQwen2/ColPali page embeddings.
+
+Token embeddings of every page are appended, unpadded, as float16 to a single
+memory-mapped file, with an offsets table mapping page -> (start, length).
+Queries are scored with a vectorized MaxSim that walks the token file in
+chunks, so memory stays bounded no matter how large the corpus gets.
+
+An optional PLAID-style prefilter clusters token embeddings into centroids;
+at query time only pages sharing a nearby centroid with the query are
+ranked by a centroid approximation, and just the best of those are scored
+exactly.
+
+Layout of an index directory:
+    tokens.f16     float16 [n_tokens, dim]
+    offsets.i64    int64 [n_pages, 2] (start token, token count)
+    keys.txt       one page key (e.g. image hash) per line
+    centroids.npy  float32 [n_centroids, dim]       (after build_centroids)
+    codes.i32      int32 [n_tokens] centroid per token (after build_centroids)
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class MultiVectorIndex:
+    def __init__(self, path: str, dim: int = 128):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._tokens_path = os.path.join(path, "tokens.f16")
+        self._offsets_path = os.path.join(path, "offsets.i64")
+        self._keys_path = os.path.join(path, "keys.txt")
+        self._codes_path = os.path.join(path, "codes.i32")
+        self._centroids_path = os.path.join(path, "centroids.npy")
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"dim": dim}, f)
+
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self._offsets_path):
+            with open(self._offsets_path, "rb") as f:
+                raw = f.read()
+            self.offsets = np.frombuffer(raw[: len(raw) // 16 * 16], dtype=np.int64).reshape(-1, 2).copy()
+        else:
+            self.offsets = np.zeros((0, 2), dtype=np.int64)
+        self.keys: List[str] = []
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path) as f:
+                # A last line without its newline was cut off mid-write
+                self.keys = [line[:-1] for line in f if line.endswith("\n")][: len(self.offsets)]
+        self.centroids = np.load(self._centroids_path) if os.path.exists(self._centroids_path) else None
+
+        # Keep only the pages whose rows and token (and code) bytes all made it to disk
+        n_pages = min(len(self.offsets), len(self.keys))
+        stored_tokens = _file_size(self._tokens_path) // (self.dim * 2)
+        if self.centroids is not None:
+            stored_tokens = min(stored_tokens, _file_size(self._codes_path) // 4)
+        while n_pages and self.offsets[n_pages - 1].sum() > stored_tokens:
+            n_pages -= 1
+        self.offsets = self.offsets[:n_pages]
+        self.keys = self.keys[:n_pages]
+        self.key_to_doc: Dict[str, int] = {key: i for i, key in enumerate(self.keys)}
+        self.n_tokens = int(self.offsets[-1].sum()) if len(self.offsets) else 0
+        self._truncate()
+        self._tokens = None
+        self._codes = None
+        self._inverted = None
+
+    def _truncate(self):
+        """Cut every file back to the pages in memory, so a torn write never shifts later appends."""
+        for path, size in (
+            (self._tokens_path, self.n_tokens * self.dim * 2),
+            (self._offsets_path, len(self.offsets) * 16),
+            (self._codes_path, self.n_tokens * 4 if self.centroids is not None else None),
+        ):
+            if size is not None and _file_size(path) > size:
+                os.truncate(path, size)
+        if os.path.exists(self._keys_path) and _file_size(self._keys_path) > sum(len(k.encode("utf-8")) + 1 for k in self.keys):
+            with open(self._keys_path + ".tmp", "w") as f:
+                f.writelines(key + "\n" for key in self.keys)
+            os.replace(self._keys_path + ".tmp", self._keys_path)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.key_to_doc
+
+    @property
+    def tokens(self) -> np.ndarray:
+        if self._tokens is None or len(self._tokens) != self.n_tokens:
+            if self.n_tokens == 0:
+                return np.zeros((0, self.dim), dtype=np.float16)
+            self._tokens = np.memmap(self._tokens_path, dtype=np.float16, mode="r", shape=(self.n_tokens, self.dim))
+        return self._tokens
+
+    @property
+    def codes(self) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+        if self._codes is None or len(self._codes) != self.n_tokens:
+            self._codes = np.memmap(self._codes_path, dtype=np.int32, mode="r", shape=(self.n_tokens,))
+        return self._codes
+
+    def add(self, key: str, embedding: np.ndarray) -> bool:
+        """Append one page's token embeddings [n_tokens, dim]. Returns False if the key exists."""
+        return self.add_many([(key, embedding)]) == 1
+
+    def add_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> int:
+        added = 0
+        with self._lock:
+            new_offsets, done = [], False
+            try:
+                with open(self._tokens_path, "ab") as tokens_f, open(self._offsets_path, "ab") as offsets_f, \
+                        open(self._keys_path, "a") as keys_f:
+                    codes_f = open(self._codes_path, "ab") if self.centroids is not None else None
+                    try:
+                        for key, embedding in items:
+                            if key in self.key_to_doc:
+                                continue
+                            embedding = np.asarray(embedding, dtype=np.float32).reshape(-1, self.dim)
+                            codes = self._assign(embedding).astype(np.int32) if codes_f is not None else None
+                            # Payload first, then the offsets row and key that make the page visible
+                            tokens_f.write(embedding.astype(np.float16).tobytes())
+                            if codes_f is not None:
+                                codes_f.write(codes.tobytes())
+                            new_offsets.append((self.n_tokens, len(embedding)))
+                            offsets_f.write(np.array(new_offsets[-1], dtype=np.int64).tobytes())
+                            keys_f.write(key + "\n")
+                            self.key_to_doc[key] = len(self.keys)
+                            self.keys.append(key)
+                            self.n_tokens += len(embedding)
+                            added += 1
+                    finally:
+                        if codes_f is not None:
+                            codes_f.close()
+                done = True
+            finally:
+                if new_offsets:
+                    self.offsets = np.concatenate([self.offsets, np.array(new_offsets, dtype=np.int64)])
+                    self._inverted = None
+                if not done:
+                    # Drop whatever part of the failing page reached disk before the error propagates
+                    self._truncate()
+        return added
+
+    # Exact scoring
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 5,
+        chunk_tokens: int = 1 << 18,
+        prefilter: bool = True,
+        nprobe: int = 4,
+        rerank: int = 256,
+    ) -> List[Tuple[str, float]]:
+        """Return the top_k (key, MaxSim score) pages for a query [q_tokens, dim]."""
+        if len(self) == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(-1, self.dim)
+        if prefilter and self.centroids is not None:
+            candidates = self._candidates(query, nprobe=nprobe, rerank=rerank)
+            scores = self._score_docs(query, candidates)
+            docs = candidates
+        else:
+            scores = self._score_all(query, chunk_tokens)
+            docs = np.arange(len(self))
+        order = np.argsort(-scores)[:top_k]
+        return [(self.keys[docs[i]], float(scores[i])) for i in order]
+
+    def _score_all(self, query: np.ndarray, chunk_tokens: int) -> np.ndarray:
+        """MaxSim for every page, walking the token file in doc-aligned chunks."""
+        scores = np.empty(len(self), dtype=np.float32)
+        starts = self.offsets[:, 0]
+        ends = starts + self.offsets[:, 1]
+        doc = 0
+        while doc < len(self):
+            # Take as many whole pages as fit in the chunk (at least one)
+            last = max(doc + 1, int(np.searchsorted(ends, starts[doc] + chunk_tokens, side="right")))
+            last = min(last, len(self))
+            block = np.asarray(self.tokens[starts[doc]:ends[last - 1]], dtype=np.float32)
+            sim = block @ query.T  # [block_tokens, q_tokens]
+            local_starts = starts[doc:last] - starts[doc]
+            scores[doc:last] = np.maximum.reduceat(sim, local_starts, axis=0).sum(axis=1)
+            doc = last
+        return scores
+
+    def _score_docs(self, query: np.ndarray, docs: np.ndarray) -> np.ndarray:
+        if len(docs) == 0:
+            return np.zeros(0, dtype=np.float32)
+        blocks, local_starts, position = [], [], 0
+        for doc in docs:
+            start, length = self.offsets[doc]
+            blocks.append(self.tokens[start:start + length])
+            local_starts.append(position)
+            position += length
+        sim = np.asarray(np.concatenate(blocks), dtype=np.float32) @ query.T
+        return np.maximum.reduceat(sim, np.array(local_starts), axis=0).sum(axis=1)
+
+    # Centroid prefilter
+
+    def build_centroids(self, n_centroids: int = 1024, sample_tokens: int = 200_000, iterations: int = 10, seed: int = 0):
+        """Cluster a sample of token embeddings and assign every stored token to its nearest centroid."""
+        rng = np.random.default_rng(seed)
+        n_centroids = min(n_centroids, self.n_tokens)
+        sample_idx = np.sort(rng.choice(self.n_tokens, size=min(sample_tokens, self.n_tokens), replace=False))
+        sample = np.asarray(self.tokens[sample_idx], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = _nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_centroids)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+        with self._lock:
+            with open(self._codes_path + ".tmp", "wb") as f:
+                for start in range(0, self.n_tokens, 1 << 18):
+                    block = np.asarray(self.tokens[start:start + (1 << 18)], dtype=np.float32)
+                    f.write(_nearest(block, centroids).astype(np.int32).tobytes())
+            os.replace(self._codes_path + ".tmp", self._codes_path)
+            np.save(self._centroids_path, centroids)
+            self.centroids = centroids
+            self._codes = None
+            self._inverted = None
+
+    def _assign(self, embedding: np.ndarray) -> np.ndarray:
+        return _nearest(embedding, self.centroids)
+
+    def _inverted_lists(self):
+        """Per-page unique centroid codes as flat (doc, code) arrays plus a centroid -> docs map."""
+        if self._inverted is None:
+            codes = np.asarray(self.codes)
+            doc_of_token = np.repeat(np.arange(len(self)), self.offsets[:, 1])
+            pairs = np.unique(doc_of_token.astype(np.int64) * len(self.centroids) + codes)
+            pair_docs = pairs // len(self.centroids)
+            pair_codes = (pairs % len(self.centroids)).astype(np.int32)
+            by_code = np.argsort(pair_codes, kind="stable")
+            code_bounds = np.searchsorted(pair_codes[by_code], np.arange(len(self.centroids) + 1))
+            self._inverted = (pair_docs, pair_codes, pair_docs[by_code], code_bounds)
+        return self._inverted
+
+    def _candidates(self, query: np.ndarray, nprobe: int, rerank: int) -> np.ndarray:
+        pair_docs, pair_codes, docs_by_code, code_bounds = self._inverted_lists()
+        centroid_scores = query @ self.centroids.T  # [q_tokens, n_centroids]
+        probes = np.unique(np.argpartition(-centroid_scores, min(nprobe, centroid_scores.shape[1] - 1), axis=1)[:, :nprobe])
+        candidates = np.unique(np.concatenate([docs_by_code[code_bounds[c]:code_bounds[c + 1]] for c in probes]))
+        if len(candidates) <= rerank:
+            return candidates
+
+        # Approximate MaxSim: each page is represented by the set of centroids its tokens fall in
+        mask = np.isin(pair_docs, candidates)
+        docs, codes = pair_docs[mask], pair_codes[mask]
+        doc_starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+        approx = np.maximum.reduceat(centroid_scores[:, codes].T, doc_starts, axis=0).sum(axis=1)
+        best = np.argpartition(-approx, rerank - 1)[:rerank]
+        return docs[doc_starts[best]]
+
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid (by inner product) for each vector."""
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), 65536):
+        out[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+    return out
@@ -0,0 +1,185 @@
+"""Resumable, streaming copy/move of a Pinecone namespace.
+
+Vector ids are paged out of the source with `list_paginated`, their values
+fetched in bounded batches and upserted to the destination with a limited
+number of requests in flight. After every page the pagination token is
+checkpointed to disk, so an interrupted copy resumes where it stopped. A
+move only deletes the source once every source vector is accounted for by the
+copy and index stats show the destination has caught up.
+"""
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from rag_ingest import with_retry
+
+DEFAULT_CHECKPOINT_DIR = os.getenv("NAMESPACE_COPY_CHECKPOINTS", "namespace_copies")
+
+
+class CopyVerificationError(Exception):
+    """The copy did not account for every source vector, or the destination never showed them."""
+
+
+class NamespaceCopier:
+    def __init__(
+        self,
+        index,
+        page_size: int = 100,
+        fetch_batch_size: int = 100,
+        upsert_batch_size: int = 100,
+        max_in_flight: int = 4,
+        checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR,
+        verify_timeout: float = 60.0,
+        on_progress: Optional[Callable[[dict], None]] = None,
+    ):
+        self.index = index
+        self.page_size = page_size
+        self.fetch_batch_size = fetch_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_in_flight = max_in_flight
+        self.checkpoint_dir = checkpoint_dir
+        self.verify_timeout = verify_timeout
+        self.on_progress = on_progress
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def copy(self, source: str, destination: str) -> dict:
+        """Copy every vector of `source` into `destination`, resuming a previous attempt if any."""
+        state = self._copy(source, destination)
+        self._clear_checkpoint(source, destination)
+        return state
+
+    def move(self, source: str, destination: str) -> dict:
+        """Copy `source` to `destination`, then delete `source` once the copy is verified."""
+        state = self._copy(source, destination)
+        self.index.delete(delete_all=True, namespace=source)
+        state["phase"] = "done"
+        state["finished_at"] = time.time()
+        self._clear_checkpoint(source, destination)
+        return state
+
+    def _copy(self, source: str, destination: str) -> dict:
+        state = self._load_checkpoint(source, destination)
+        if state["phase"] == "copying":
+            self._copy_pages(source, destination, state)
+            state["phase"] = "copied"
+            self._save_checkpoint(state)
+        if state["phase"] == "copied":
+            try:
+                self._verify(source, destination, state)
+            except CopyVerificationError:
+                if state["copied"] != state["source_count"]:
+                    # The source changed under the copy: start over on the next attempt (upserts are idempotent)
+                    self._save_checkpoint(self._new_state(source, destination))
+                raise
+            state["phase"] = "verified"
+            self._save_checkpoint(state)
+        return state
+
+    def _copy_pages(self, source: str, destination: str, state: dict):
+        # Pages are submitted in order and their upserts overlap; the checkpoint only
+        # advances past a page once it and every page before it are fully copied.
+        in_flight = deque()  # (pagination token after the page, [futures])
+
+        def settle(block: bool):
+            while in_flight and (block or all(f.done() for f in in_flight[0][1])):
+                token, futures = in_flight.popleft()
+                state["copied"] += sum(f.result() for f in futures)
+                state["pagination_token"] = token
+                state["pages"] += 1
+                self._save_checkpoint(state)
+                if self.on_progress is not None:
+                    self.on_progress(state)
+                block = False
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="ns-copy") as pool:
+            token = state["pagination_token"]
+            while True:
+                kwargs = {"namespace": source, "limit": self.page_size}
+                if token:
+                    kwargs["pagination_token"] = token
+                page = with_retry(self.index.list_paginated, **kwargs)
+                ids = [vector.id for vector in (page.vectors or [])]
+                pagination = getattr(page, "pagination", None)
+                token = pagination.next if pagination else None
+
+                futures = [
+                    pool.submit(self._copy_batch, source, destination, ids[i:i + self.fetch_batch_size])
+                    for i in range(0, len(ids), self.fetch_batch_size)
+                ]
+                in_flight.append((token, futures))
+                settle(block=False)
+                while sum(len(f) for _, f in in_flight) >= self.max_in_flight:
+                    settle(block=True)
+                if not token:
+                    break
+            while in_flight:
+                settle(block=True)
+
+    def _copy_batch(self, source: str, destination: str, ids) -> int:
+        fetched = with_retry(self.index.fetch, ids=list(ids), namespace=source)
+        records = [
+            (vector_id, vector.values, vector.metadata or {})
+            for vector_id, vector in fetched.vectors.items()
+        ]
+        for start in range(0, len(records), self.upsert_batch_size):
+            with_retry(self.index.upsert, vectors=records[start:start + self.upsert_batch_size], namespace=destination)
+        return len(records)
+
+    def _verify(self, source: str, destination: str, state: dict):
+        """Wait until the copy accounts for every source vector and index stats show them in the destination.
+
+        The destination may already have held vectors, so its count alone
+        proves nothing: the number of vectors copied must equal the source count.
+        """
+        deadline = time.time() + self.verify_timeout
+        while True:
+            namespaces = self.index.describe_index_stats().namespaces
+            source_count = namespaces[source].vector_count if source in namespaces else 0
+            destination_count = namespaces[destination].vector_count if destination in namespaces else 0
+            state["source_count"], state["destination_count"] = source_count, destination_count
+            if state["copied"] == source_count and destination_count >= source_count:
+                return
+            if time.time() > deadline:
+                raise CopyVerificationError(
+                    f"Copied {state['copied']} of {source_count} vectors and namespace '{destination}' has "
+                    f"{destination_count}; source '{source}' was left in place, retry to resume"
+                )
+            time.sleep(2)
+
+    def _checkpoint_path(self, source: str, destination: str) -> str:
+        name = re.sub(r"[^\w.-]", "_", f"{source}__{destination}")
+        return os.path.join(self.checkpoint_dir, f"{name}.json")
+
+    def _load_checkpoint(self, source: str, destination: str) -> dict:
+        path = self._checkpoint_path(source, destination)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return self._new_state(source, destination)
+
+    def _new_state(self, source: str, destination: str) -> dict:
+        return {
+            "source": source,
+            "destination": destination,
+            "phase": "copying",
+            "pagination_token": None,
+            "pages": 0,
+            "copied": 0,
+            "started_at": time.time(),
+        }
+
+    def _save_checkpoint(self, state: dict):
+        path = self._checkpoint_path(state["source"], state["destination"])
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def _clear_checkpoint(self, source: str, destination: str):
+        try:
+            os.remove(self._checkpoint_path(source, destination))
+        except OSError:
+            pass
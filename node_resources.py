@@ -0,0 +1,150 @@
+"""Shared, instrumented resources for the nodes of a LangGraph agent.
+
+Graph nodes run on every request, so anything they build per call (chat model
+clients, structured-output wrappers, tool-bound models, prompts pulled from the
+LangChain hub) is set-up cost paid again and again. NodeResources builds each
+resource once, on first use, and shares it across nodes and graph runs. It
+records how long each set-up took and how often the result was reused, and it
+times every node wrapped with `timed`:
+
+    resources = NodeResources()
+    model = resources.get("gpt-4o", lambda: ChatOpenAI(model_name="gpt-4o", temperature=0))
+
+    @resources.timed("generate")
+    def generate(state): ...
+
+    resources.stats()  # per node latency, per resource set-up time and time saved by reuse
+
+PromptStore keeps hub prompts on disk (PROMPT_CACHE_DIR), so a restart does
+not go back to the network. A prompt can be pinned to a hub commit with
+"owner/name:commit"; unpinned prompts are refreshed after PROMPT_CACHE_TTL
+seconds, and the stale copy is used if the hub cannot be reached.
+"""
+import functools
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+DEFAULT_PROMPT_CACHE_DIR = os.getenv("PROMPT_CACHE_DIR", "prompt_cache")
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", 24 * 3600))
+
+
+class NodeResources:
+    """Thread-safe registry of lazily built resources plus per-node latency stats."""
+
+    def __init__(self):
+        self._resources: Dict[str, Any] = {}
+        self._setup_seconds: Dict[str, float] = {}
+        self._reuses: Dict[str, int] = defaultdict(int)
+        self._node_calls: Dict[str, list] = defaultdict(lambda: [0, 0.0, 0.0])  # calls, total, last
+        self._lock = threading.RLock()  # Factories may fetch other resources
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Return the resource called `name`, building it with `factory` the first time."""
+        with self._lock:
+            if name in self._resources:
+                self._reuses[name] += 1
+                return self._resources[name]
+            started = time.perf_counter()
+            resource = factory()
+            self._setup_seconds[name] = time.perf_counter() - started
+            self._resources[name] = resource
+            return resource
+
+    def timed(self, node: str):
+        """Decorator recording the latency of a graph node (or edge function)."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - started
+                    with self._lock:
+                        calls = self._node_calls[node]
+                        calls[0] += 1
+                        calls[1] += elapsed
+                        calls[2] = elapsed
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                "nodes": {
+                    node: {"calls": calls, "mean_ms": round(1000 * total / calls, 1), "last_ms": round(1000 * last, 1)}
+                    for node, (calls, total, last) in self._node_calls.items()
+                },
+                "resources": {
+                    name: {
+                        "setup_ms": round(1000 * seconds, 1),
+                        "reuses": self._reuses[name],
+                        "saved_ms": round(1000 * seconds * self._reuses[name], 1),
+                    }
+                    for name, seconds in self._setup_seconds.items()
+                },
+            }
+
+
+class PromptStore:
+    """Hub prompts cached in memory and on disk, optionally pinned to a hub commit."""
+
+    def __init__(self, cache_dir: str = DEFAULT_PROMPT_CACHE_DIR, ttl: float = PROMPT_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._prompts: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, ref: str) -> str:
+        name, _, version = ref.partition(":")
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        return os.path.join(self.cache_dir, f"{safe_name}@{version or 'latest'}.json")
+
+    def get(self, ref: str):
+        """Return the prompt for "owner/name" or "owner/name:commit"."""
+        with self._lock:
+            if ref not in self._prompts:
+                self._prompts[ref] = self._load(ref)
+            return self._prompts[ref]
+
+    def _load(self, ref: str):
+        from langchain_core.load import dumps, loads
+
+        path = self._path(ref)
+        pinned = ":" in ref
+        cached = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                cached = loads(fh.read())
+            if pinned or time.time() - os.path.getmtime(path) < self.ttl:
+                return cached
+
+        from langchain import hub
+
+        try:
+            prompt = hub.pull(ref)
+        except Exception as e:
+            if cached is None:
+                raise
+            print(f"Could not refresh prompt {ref}, using the cached copy: {e}")
+            return cached
+        with open(path + ".tmp", "w", encoding="utf-8") as fh:
+            fh.write(dumps(prompt))
+        os.replace(path + ".tmp", path)
+        return prompt
+
+    def versions(self) -> Dict[str, str]:
+        """Cached prompt files and when they were fetched."""
+        return {
+            name[: -len(".json")]: time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(os.path.join(self.cache_dir, name))))
+            for name in sorted(os.listdir(self.cache_dir))
+            if name.endswith(".json")
+        }
@@ -1,5 +1,3 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain.chat_models import init_chat_model
 from langchain_openai import OpenAIEmbeddings
 from langchain import hub
@@ -8,13 +6,24 @@ from langchain_pinecone import PineconeVectorStore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langgraph.graph import MessagesState, StateGraph
 from langchain_core.tools import tool
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END
 from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
-from flask import Flask, request, jsonify, send_file
+from bounded_checkpointer import BoundedCheckpointer, trim_thread_messages
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
-import os, uuid
+from rag_ingest import IngestPipeline, load_pages, print_progress
+from rag_jobs import JobQueue, QueueFullError
+from embedding_cache import CachedEmbeddings
+from doc_registry import DocumentRegistry, delete_ids
+from namespace_copy import CopyVerificationError, NamespaceCopier
+from answer_cache import SemanticAnswerCache
+from hybrid_retrieval import HybridRetriever, SparseIndex
+from doc_grader import CrossEncoderGrader
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os, uuid, threading, time, json
 from dotenv import load_dotenv
 load_dotenv('.env')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
@@ -24,26 +33,119 @@ LANGCHAIN_TRACING_V2 = os.getenv('LANGCHAIN_TRACING_V2')
 LANGCHAIN_API_KEY = os.getenv('LANGCHAIN_API_KEY')
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads/'
+app.config['JOB_SPOOL_FOLDER'] = 'jobs/'
+app.config['DOC_REGISTRY_PATH'] = os.getenv('DOC_REGISTRY_PATH', 'doc_registry.db')
+app.config['NAMESPACE_COPY_CONCURRENCY'] = int(os.getenv('NAMESPACE_COPY_CONCURRENCY', 4))
+app.config['NAMESPACE_CACHE_TTL'] = float(os.getenv('NAMESPACE_CACHE_TTL', 30))
+app.config['NAMESPACE_MISS_TTL'] = float(os.getenv('NAMESPACE_MISS_TTL', 5))  # Min age of the list before a miss refetches it
+app.config['NAMESPACE_ERROR_TTL'] = float(os.getenv('NAMESPACE_ERROR_TTL', 5))  # Serve the stale list this long after a failed fetch
+app.config['CHECKPOINT_DB'] = os.getenv('CHECKPOINT_DB')
+app.config['MAX_THREADS'] = int(os.getenv('MAX_THREADS', 10000))
+app.config['THREAD_TTL'] = float(os.getenv('THREAD_TTL', 7 * 24 * 3600))
+app.config['MAX_CHECKPOINTS_PER_THREAD'] = int(os.getenv('MAX_CHECKPOINTS_PER_THREAD', 50))
+app.config['MAX_MESSAGES_PER_THREAD'] = int(os.getenv('MAX_MESSAGES_PER_THREAD', 40))
+app.config['IMPROVE_WORKERS'] = int(os.getenv('IMPROVE_WORKERS', 2))
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['EMBED_BATCH_SIZE'] = int(os.getenv('EMBED_BATCH_SIZE', 128))
+app.config['EMBED_CONCURRENCY'] = int(os.getenv('EMBED_CONCURRENCY', 4))
+app.config['UPSERT_BATCH_SIZE'] = int(os.getenv('UPSERT_BATCH_SIZE', 100))
+app.config['UPSERT_CONCURRENCY'] = int(os.getenv('UPSERT_CONCURRENCY', 4))
+app.config['INGEST_WORKERS'] = int(os.getenv('INGEST_WORKERS', 2))
+app.config['INGEST_QUEUE_DEPTH'] = int(os.getenv('INGEST_QUEUE_DEPTH', 16))
+app.config['ANSWER_CACHE_THRESHOLD'] = float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.95))
+app.config['ANSWER_CACHE_TTL'] = float(os.getenv('ANSWER_CACHE_TTL', 3600))
+app.config['ANSWER_CACHE_MAX_ENTRIES'] = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 10000))
+app.config['SPARSE_INDEX_PATH'] = os.getenv('SPARSE_INDEX_PATH', 'sparse_index.db')
+app.config['RETRIEVE_DENSE_K'] = int(os.getenv('RETRIEVE_DENSE_K', 10))
+app.config['RETRIEVE_SPARSE_K'] = int(os.getenv('RETRIEVE_SPARSE_K', 10))
+app.config['RETRIEVE_MAX_TOKENS'] = int(os.getenv('RETRIEVE_MAX_TOKENS', 1000))
+app.config['RERANK_MODEL'] = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')  # Empty to disable
 ALLOWED_EXTENSIONS = {'pdf', 'txt'}
 
 # Initialize Pinecone
 pc = Pinecone(api_key=PINECONE_API_KEY)
 llm = init_chat_model("gpt-4o-mini", model_provider="openai")
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
 index = pc.Index("testing")
+document_registry = DocumentRegistry(app.config['DOC_REGISTRY_PATH'])
+namespace_copier = NamespaceCopier(index, max_in_flight=app.config['NAMESPACE_COPY_CONCURRENCY'])
+# Answers to near-duplicate first questions, per namespace; dropped whenever a namespace's documents change
+answer_cache = SemanticAnswerCache(
+    embeddings,
+    threshold=app.config['ANSWER_CACHE_THRESHOLD'],
+    ttl=app.config['ANSWER_CACHE_TTL'],
+    max_entries=app.config['ANSWER_CACHE_MAX_ENTRIES'],
+)
 
-# Define a global variable to store the current namespace
-current_namespace = "default_namespace"
-
-def get_all_namespaces():
-    """Get all existing namespaces from Pinecone index"""
-    try:
-        stats = index.describe_index_stats()
-        return list(stats.namespaces.keys())
-    except Exception as e:
-        return []
+# Local BM25 index kept alongside every namespace, for exact-term matches dense search misses
+sparse_index = SparseIndex(app.config['SPARSE_INDEX_PATH'])
+
+def register_chunks(namespace, records):
+    document_registry.add_chunks(namespace, records)
+    sparse_index.add_chunks(namespace, records)
+
+# Namespace list from describe_index_stats(), cached for a few seconds
+_namespace_cache = {"namespaces": [], "fetched_at": 0.0, "invalidated_at": 0.0, "failed_at": 0.0}
+_namespace_lock = threading.Lock()
+_namespace_fetch_lock = threading.Lock()  # One describe_index_stats() in flight; other callers wait for its result
+
+def get_all_namespaces(max_age=None):
+    """Get all existing namespaces from Pinecone index, at most `max_age` seconds old"""
+    if max_age is None:
+        max_age = app.config['NAMESPACE_CACHE_TTL']
+
+    def cached():
+        """The cached list if it is recent enough, or if Pinecone just failed; else None"""
+        now = time.time()
+        if (now - _namespace_cache["fetched_at"] <= max_age
+                or now - _namespace_cache["failed_at"] <= app.config['NAMESPACE_ERROR_TTL']):
+            return list(_namespace_cache["namespaces"])
+        return None
+
+    with _namespace_lock:
+        namespaces = cached()
+    if namespaces is not None:
+        return namespaces
+    with _namespace_fetch_lock:
+        with _namespace_lock:
+            # Refreshed, or failed, by another request while this one waited
+            namespaces = cached()
+        if namespaces is not None:
+            return namespaces
+        started = time.time()
+        try:
+            namespaces = list(index.describe_index_stats().namespaces.keys())
+        except Exception as e:
+            print(f"Could not list namespaces, serving the cached list: {e}")
+            with _namespace_lock:
+                _namespace_cache["failed_at"] = time.time()
+                return list(_namespace_cache["namespaces"])
+        with _namespace_lock:
+            _namespace_cache["namespaces"] = namespaces
+            _namespace_cache["failed_at"] = 0.0
+            # A namespace created while the stats were in flight may be missing from them
+            if _namespace_cache["invalidated_at"] < started:
+                _namespace_cache["fetched_at"] = time.time()
+        return list(namespaces)
+
+def namespace_exists(namespace):
+    """Check the cached namespace list; a miss refetches it unless it is only a few seconds old"""
+    return namespace in get_all_namespaces() or namespace in get_all_namespaces(max_age=app.config['NAMESPACE_MISS_TTL'])
+
+def invalidate_namespaces():
+    with _namespace_lock:
+        _namespace_cache["fetched_at"] = 0.0
+        _namespace_cache["invalidated_at"] = time.time()
+
+# One vector store handle per namespace, shared by all requests
+_vector_stores = {}
+_vector_store_lock = threading.Lock()
+
+def get_vector_store(namespace):
+    with _vector_store_lock:
+        if namespace not in _vector_stores:
+            _vector_stores[namespace] = PineconeVectorStore(index=index, embedding=embeddings, namespace=namespace)
+        return _vector_stores[namespace]
 
 @app.route('/namespaces', methods=['GET'])
 def list_namespaces():
@@ -51,12 +153,99 @@ def list_namespaces():
     namespaces = get_all_namespaces()
     return jsonify({"namespaces": namespaces}), 200
 
+@app.route('/embedding-cache', methods=['GET'])
+def embedding_cache_stats():
+    """Hit/miss counters and size of the shared embedding cache"""
+    return jsonify(embeddings.cache.stats()), 200
+
+@app.route('/answer-cache', methods=['GET'])
+def answer_cache_stats():
+    """Hit rate, size and evictions of the semantic answer cache"""
+    return jsonify(answer_cache.stats()), 200
+
+@app.route('/answer-cache', methods=['DELETE'])
+def clear_answer_cache():
+    """Drop cached answers of one namespace (?namespace=...) or of all of them"""
+    namespace = request.args.get('namespace')
+    if namespace:
+        return jsonify({"namespace": namespace, "dropped": answer_cache.invalidate(namespace)}), 200
+    answer_cache.clear()
+    return jsonify({"message": "Answer cache cleared"}), 200
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def ensure_registered(namespace):
+    """Rebuild the registry for a namespace the index has vectors for but the registry doesn't know"""
+    if document_registry.list_documents(namespace, limit=1)[0] > 0:
+        return
+    stats = index.describe_index_stats()
+    if namespace in stats.namespaces and stats.namespaces[namespace].vector_count > 0:
+        document_registry.reconcile(index, namespace)
+
+def run_ingest_job(job, update):
+    """Worker-side ingestion of one spooled upload."""
+    payload = job['payload']
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, 
+        chunk_overlap=200
+    )
+
+    def report(stats):
+        print_progress(stats)
+        update(progress=stats.as_dict())
+
+    # Stream pages out of the loader and embed/upsert them in concurrent batches
+    pipeline = IngestPipeline(
+        embeddings,
+        index,
+        text_splitter,
+        embed_batch_size=app.config['EMBED_BATCH_SIZE'],
+        embed_concurrency=app.config['EMBED_CONCURRENCY'],
+        upsert_batch_size=app.config['UPSERT_BATCH_SIZE'],
+        upsert_concurrency=app.config['UPSERT_CONCURRENCY'],
+        on_progress=report,
+        progress_every=5,
+        on_upserted=register_chunks,
+    )
+    update(stage='indexing')
+    # Chunk ids are seeded by the job id so a resumed job overwrites its partial upserts
+    try:
+        stats, chunks_metadata = pipeline.run(
+            load_pages(job['filepath'], payload['extension']),
+            payload['namespace'],
+            payload['doc_title'],
+            job['filename'],
+            id_seed=job['id'],
+        )
+    finally:
+        # Even a failed job may have upserted some chunks
+        answer_cache.invalidate(payload['namespace'])
+    if stats.chunks == 0:
+        raise ValueError("Document contains no text to embed.")
+    invalidate_namespaces()
+
+    return {
+        "message": f"Successfully uploaded and indexed {stats.chunks} chunks",
+        "document_title": payload['doc_title'],
+        "filename": job['filename'],
+        "namespace": payload['namespace'],
+        "total_chunks": stats.chunks,
+        "chunks": chunks_metadata,
+        "stats": stats.as_dict()
+    }
+
+ingest_jobs = JobQueue(
+    app.config['JOB_SPOOL_FOLDER'],
+    run_ingest_job,
+    workers=app.config['INGEST_WORKERS'],
+    max_depth=app.config['INGEST_QUEUE_DEPTH'],
+)
+
 @app.route('/documents', methods=['POST'])
 def upload_document():
+    """Spool an upload and queue it for ingestion, returning a job id immediately"""
     try:
         namespace = request.form.get('namespace')
         create_new = request.form.get('create_new', 'false').lower() == 'true'
@@ -64,11 +253,9 @@ def upload_document():
         if not namespace:
             return jsonify({"error": "Namespace is required"}), 400
             
-        if not create_new and namespace not in get_all_namespaces():
+        if not create_new and not namespace_exists(namespace):
             return jsonify({"error": "Namespace does not exist"}), 400
         
-        vector_store = PineconeVectorStore(embedding=embeddings, index=index, namespace=namespace)
-        
         if 'file' not in request.files:
             return jsonify({"error": "No file part"}), 400
         
@@ -76,62 +263,35 @@ def upload_document():
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Store original filename without extension as title
-            doc_title = os.path.splitext(filename)[0]
-            
-            # Load document based on file type
-            extension = filename.rsplit('.', 1)[1].lower()
-            if extension == 'pdf':
-                loader = PyPDFLoader(filepath)
-            elif extension == 'txt':
-                loader = TextLoader(filepath)
-                
-            docs = loader.load()
-            
-            # Split and index documents
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000, 
-                chunk_overlap=200
-            )
-            splits = text_splitter.split_documents(docs)
-            
-            # Add unique IDs and document title to metadata
-            chunks_metadata = []
-            for split in splits:
-                chunk_id = str(uuid.uuid4())
-                split.metadata.update({
-                    'doc_id': chunk_id,
-                    'doc_title': doc_title,
-                    'original_filename': filename,
-                    'chunk_index': len(chunks_metadata) + 1,
-                    'total_chunks': len(splits)
-                })
-                chunks_metadata.append({
-                    'id': chunk_id,
-                    'title': doc_title,
-                    'chunk_index': split.metadata['chunk_index']
-                })
-            
-            if not splits:
-                return jsonify({"error": "Document contains no text to embed."}), 400
-
-            vector_store.add_documents(splits)
+        if not allowed_file(file.filename):
+            return jsonify({"error": "File type not allowed"}), 400
 
-    finally:
-        os.remove(filepath)  # Clean up uploaded file
-        
+        filename = secure_filename(file.filename)
+        job = ingest_jobs.submit(file, filename, {
+            # Store original filename without extension as title
+            'doc_title': os.path.splitext(filename)[0],
+            'extension': filename.rsplit('.', 1)[1].lower(),
+            'namespace': namespace,
+        })
         return jsonify({
-            "message": f"Successfully uploaded and indexed {len(splits)} chunks",
-            "document_title": doc_title,
-            "filename": filename,
-            "total_chunks": len(splits),
-            "chunks": chunks_metadata
-        }), 201
+            "message": f"Document '{filename}' queued for indexing",
+            "job_id": job['id'],
+            "status_url": f"/jobs/{job['id']}",
+            "job": job
+        }), 202
+
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "30"}
+    except Exception as e:
+        return jsonify({"error": f"Failed to queue document: {str(e)}"}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report stage, chunk counts and timings of an ingestion job"""
+    job = ingest_jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found"}), 404
+    return jsonify(job), 200
 
 @app.route('/namespace', methods=['PUT'])
 def update_namespace():
@@ -143,49 +303,65 @@ def update_namespace():
     if not old_namespace or not new_namespace:
         return jsonify({"error": "Both old and new namespace names are required"}), 400
         
-    if old_namespace not in get_all_namespaces():
+    if not namespace_exists(old_namespace):
         return jsonify({"error": "Original namespace does not exist"}), 404
         
     try:
-        # Get all vectors from old namespace
-        vector_store = PineconeVectorStore.from_existing_index(
-            embedding=embeddings, 
-            index_name="testing", 
-            namespace=old_namespace
-        )
-        
-        # Fetch all vectors (you might want to do this in batches for large datasets)
-        results = index.query(
-            namespace=old_namespace,
-            vector=[0]*1536,  # dummy vector
-            top_k=10000,
-            include_metadata=True,
-            include_values=True
-        )
-        
-        if results.matches:
-            # Create new namespace with existing vectors
-            index.upsert(
-                vectors=[(m.id, m.values, m.metadata) for m in results.matches],
-                namespace=new_namespace
-            )
-            
-            # Delete old namespace
-            index.delete(delete_all=True, namespace=old_namespace)
-            
-        return jsonify({"message": f"Namespace updated from {old_namespace} to {new_namespace}"}), 200
-        
+        # Stream the vectors across page by page; an interrupted rename resumes from its checkpoint
+        state = namespace_copier.move(old_namespace, new_namespace)
+        document_registry.rename_namespace(old_namespace, new_namespace)
+        sparse_index.rename_namespace(old_namespace, new_namespace)
+        invalidate_namespaces()
+        answer_cache.invalidate(old_namespace)
+        answer_cache.invalidate(new_namespace)
+
+        return jsonify({
+            "message": f"Namespace updated from {old_namespace} to {new_namespace}",
+            "vectors_copied": state['copied']
+        }), 200
+
+    except CopyVerificationError as e:
+        return jsonify({"error": str(e)}), 409
     except Exception as e:
         return jsonify({"error": f"Failed to update namespace: {str(e)}"}), 500
 
+@app.route('/namespace/<namespace>/copy', methods=['POST'])
+def copy_namespace(namespace):
+    """Copy every vector of a namespace into another one"""
+    new_namespace = (request.json or {}).get('new_namespace')
+    if not new_namespace:
+        return jsonify({"error": "new_namespace is required"}), 400
+
+    if not namespace_exists(namespace):
+        return jsonify({"error": f"Namespace '{namespace}' does not exist"}), 404
+
+    try:
+        state = namespace_copier.copy(namespace, new_namespace)
+        document_registry.copy_namespace(namespace, new_namespace)
+        sparse_index.copy_namespace(namespace, new_namespace)
+        invalidate_namespaces()
+        answer_cache.invalidate(new_namespace)
+        return jsonify({
+            "message": f"Namespace {namespace} copied to {new_namespace}",
+            "vectors_copied": state['copied']
+        }), 200
+    except CopyVerificationError as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"error": f"Failed to copy namespace: {str(e)}"}), 500
+
 @app.route('/namespace/<namespace>', methods=['DELETE'])
 def delete_namespace(namespace):
     """Delete an entire namespace"""
-    if namespace not in get_all_namespaces():
+    if not namespace_exists(namespace):
         return jsonify({"error": f"Namespace '{namespace}' does not exist"}), 404
     
     try:
         index.delete(delete_all=True, namespace=namespace)
+        document_registry.delete_namespace(namespace)
+        sparse_index.delete_namespace(namespace)
+        invalidate_namespaces()
+        answer_cache.invalidate(namespace)
         return jsonify({"message": f"Namespace '{namespace}' deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -193,11 +369,15 @@ def delete_namespace(namespace):
 @app.route('/namespace/<namespace>/documents', methods=['DELETE'])
 def delete_all_documents(namespace):
     """Delete all documents in a namespace but keep the namespace"""
-    if namespace not in get_all_namespaces():
+    if not namespace_exists(namespace):
         return jsonify({"error": f"Namespace '{namespace}' does not exist"}), 404
     
     try:
         index.delete(delete_all=True, namespace=namespace)
+        document_registry.delete_namespace(namespace)
+        sparse_index.delete_namespace(namespace)
+        invalidate_namespaces()
+        answer_cache.invalidate(namespace)
         return jsonify({"message": f"All documents in namespace '{namespace}' deleted"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -205,7 +385,7 @@ def delete_all_documents(namespace):
 @app.route('/namespace/<namespace>/document', methods=['DELETE'])
 def delete_document(namespace):
     """Delete a specific document by ID or title"""
-    if namespace not in get_all_namespaces():
+    if not namespace_exists(namespace):
         return jsonify({"error": f"Namespace '{namespace}' does not exist"}), 404
     
     data = request.json
@@ -219,31 +399,27 @@ def delete_document(namespace):
         if doc_id:
             # Delete by ID
             index.delete(ids=[doc_id], namespace=namespace)
+            document_registry.delete_chunks(namespace, [doc_id])
+            sparse_index.delete_chunks(namespace, [doc_id])
+            answer_cache.invalidate(namespace)
             return jsonify({"message": f"Document with ID '{doc_id}' deleted from namespace '{namespace}'"}), 200
         
         elif doc_title:
-            # Delete by title - first find all chunks with this title
-            results = index.query(
-                namespace=namespace,
-                vector=[0]*1536,  # dummy vector
-                top_k=10000,
-                include_metadata=True
-            )
-            
-            # Filter matches by document title
-            doc_ids = [
-                match.id for match in results.matches 
-                if match.metadata.get('doc_title') == doc_title
-            ]
+            # Delete by title - look up the chunk ids in the registry
+            ensure_registered(namespace)
+            deleted = 0
+            for ids in document_registry.iter_chunk_ids(namespace, doc_title=doc_title):
+                deleted += delete_ids(index, namespace, ids)
             
-            if not doc_ids:
+            if not deleted:
                 return jsonify({"error": f"No document with title '{doc_title}' found in namespace '{namespace}'"}), 404
             
-            # Delete all chunks of this document
-            index.delete(ids=doc_ids, namespace=namespace)
+            document_registry.delete_document(namespace, doc_title)
+            sparse_index.delete_document(namespace, doc_title)
+            answer_cache.invalidate(namespace)
             return jsonify({
                 "message": f"Document '{doc_title}' deleted from namespace '{namespace}'",
-                "chunks_deleted": len(doc_ids)
+                "chunks_deleted": deleted
             }), 200
 
     except Exception as e:
@@ -253,26 +429,43 @@ def delete_document(namespace):
 prompt = hub.pull("rlm/rag-prompt")
 graph_builder = StateGraph(MessagesState)
 
+def load_reranker():
+    if not app.config['RERANK_MODEL']:
+        return None
+    try:
+        return CrossEncoderGrader(app.config['RERANK_MODEL'])
+    except Exception as e:
+        print(f"Reranking disabled, could not load {app.config['RERANK_MODEL']}: {e}")
+        return None
+
+# Dense + BM25 results fused with RRF, reranked on CPU and trimmed to a token budget
+hybrid_retriever = HybridRetriever(
+    get_vector_store,
+    sparse_index,
+    reranker=load_reranker(),
+    dense_k=app.config['RETRIEVE_DENSE_K'],
+    sparse_k=app.config['RETRIEVE_SPARSE_K'],
+    max_tokens=app.config['RETRIEVE_MAX_TOKENS'],
+)
+
 @tool(response_format="content_and_artifact")
-def retrieve(query: str, namespace: str = None):
+def retrieve(query: str, config: RunnableConfig):
     """Retrieve information related to a query."""
-    # Use the global namespace if none is provided
-    search_namespace = namespace if namespace else current_namespace
+    # The namespace comes from the request's graph config, never from shared module state
+    search_namespace = config.get("configurable", {}).get("namespace", "default_namespace")
     
-    vector_store = PineconeVectorStore.from_existing_index(
-        embedding=embeddings, index_name="testing", namespace=search_namespace
-    )
-    retrieved_docs = vector_store.similarity_search(query, k=2)
+    retrieved_docs, _ = hybrid_retriever.retrieve(search_namespace, query)
     serialized = "\n\n".join(
         (f"Source: {doc.metadata}\n" f"Content: {doc.page_content}")
         for doc in retrieved_docs
     )
     return serialized, retrieved_docs
 
+llm_with_tools = llm.bind_tools([retrieve])
+
 # Step 1: Generate an AIMessage that may include a tool-call to be sent.
 def query_or_respond(state: MessagesState):
     """Generate tool call for retrieval or respond."""
-    llm_with_tools = llm.bind_tools([retrieve])
     response = llm_with_tools.invoke(state["messages"])
     # MessagesState appends messages to state instead of overwriting
     return {"messages": [response]}
@@ -362,7 +555,22 @@ def improve(state: MessagesState):
     improved_response = llm.invoke(improvement_prompt)
     return {"messages": [improved_response]}
 
-memory = MemorySaver()
+def route_after_generate(state: MessagesState, config: RunnableConfig):
+    """Only run reflect/improve inline for quality=full requests."""
+    if config.get("configurable", {}).get("quality", "full") == "full":
+        return "reflect"
+    return END
+
+# Bounded, evicting conversation memory; set CHECKPOINT_DB to keep threads across restarts
+checkpoint_limits = dict(
+    max_threads=app.config['MAX_THREADS'],
+    ttl_sec=app.config['THREAD_TTL'],
+    max_checkpoints_per_thread=app.config['MAX_CHECKPOINTS_PER_THREAD'],
+)
+if app.config['CHECKPOINT_DB']:
+    memory = BoundedCheckpointer.sqlite(app.config['CHECKPOINT_DB'], **checkpoint_limits)
+else:
+    memory = BoundedCheckpointer(**checkpoint_limits)
 graph_builder.add_node(query_or_respond)
 graph_builder.add_node(tools)
 graph_builder.add_node(generate)
@@ -376,7 +584,11 @@ graph_builder.add_conditional_edges(
     {END: END, "tools": "tools"},
 )
 graph_builder.add_edge("tools", "generate")
-graph_builder.add_edge("generate", "reflect")
+graph_builder.add_conditional_edges(
+    "generate",
+    route_after_generate,
+    {END: END, "reflect": "reflect"},
+)
 graph_builder.add_edge("reflect", "improve")
 graph_builder.add_edge("improve", END)
 
@@ -400,86 +612,259 @@ except Exception as e:
     def show_diagram():
         return jsonify({"error": "Flow diagram generation failed. The service is still functional."}), 503
 
+@app.route('/checkpointer', methods=['GET'])
+def checkpointer_metrics():
+    """Resident threads, approximate bytes and evictions of the conversation memory"""
+    return jsonify(memory.metrics()), 200
+
+QUALITY_MODES = ("fast", "full", "background")
+# Nodes whose tokens make up an answer the user should see
+ANSWER_NODES = ("query_or_respond", "generate", "improve")
+
+def final_answer(messages):
+    for message in reversed(messages):
+        if message.type == "ai" and not message.tool_calls and message.content:
+            return message.content
+    return None
+
+def run_chat_graph(input_message, config):
+    """Run the graph, yielding ("token", node, text), ("stage", node, seconds) and ("answer", text) events."""
+    started = last = time.perf_counter()
+    answer = None
+    for mode, payload in graph.stream(
+        {"messages": [{"role": "user", "content": input_message}]},
+        stream_mode=["messages", "updates"],
+        config=config,
+    ):
+        if mode == "messages":
+            chunk, metadata = payload
+            node = metadata.get("langgraph_node")
+            if node in ANSWER_NODES and chunk.content:
+                yield ("token", node, chunk.content)
+        else:
+            # Nodes run one after another, so the gap between updates is the stage latency
+            now = time.perf_counter()
+            for node, update in payload.items():
+                yield ("stage", node, round(now - last, 3))
+                answer = final_answer((update or {}).get("messages", [])) or answer
+            last = now
+    yield ("stage", "total", round(time.perf_counter() - started, 3))
+    yield ("answer", answer or "No response generated")
+
+# Turns and background improvements of one conversation thread must not interleave
+_thread_locks = {}  # thread_id -> [lock, number of holders and waiters]
+_thread_locks_guard = threading.Lock()
+
+@contextmanager
+def thread_lock(thread_id):
+    with _thread_locks_guard:
+        entry = _thread_locks.setdefault(thread_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _thread_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _thread_locks[thread_id]
+
+def improve_in_background(config, base):
+    """Run reflect/improve on a finished fast answer and store the result in the thread.
+
+    `base` is the thread's state snapshot the answer was given in. The LLM calls
+    run without holding the thread; the result is only stored if no newer turn
+    has been checkpointed since. Returns (improved answer or None, timings).
+    """
+    started = time.perf_counter()
+    reflection = reflect(base.values)
+    reflected = time.perf_counter()
+    improved = improve({"messages": base.values["messages"] + reflection["messages"]})
+    timings = {
+        "reflect": round(reflected - started, 3),
+        "improve": round(time.perf_counter() - reflected, 3),
+    }
+    thread_id = config["configurable"]["thread_id"]
+    with thread_lock(thread_id):
+        latest = graph.get_state(config).config["configurable"].get("checkpoint_id")
+        if latest != base.config["configurable"].get("checkpoint_id"):
+            print(f"Skipping improvement of thread {thread_id}: a newer turn has started")
+            return None, timings
+        graph.update_state(config, {"messages": reflection["messages"] + improved["messages"]}, as_node="improve")
+        maintain_thread(config)
+    return improved["messages"][-1].content, timings
+
+improvement_pool = ThreadPoolExecutor(max_workers=app.config['IMPROVE_WORKERS'], thread_name_prefix="improve")
+
+def submit_improvement(config, base):
+    def run():
+        try:
+            improve_in_background(config, base)
+        except Exception as e:
+            print(f"Background improvement of thread {config['configurable']['thread_id']} failed: {e}")
+    improvement_pool.submit(run)
+
+def maintain_thread(config):
+    """Keep a finished thread within its message and checkpoint limits."""
+    trim_thread_messages(graph, config, app.config['MAX_MESSAGES_PER_THREAD'])
+    memory.compact(config["configurable"]["thread_id"])
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def lookup_cached_answer(input_message, config):
+    """Look the first question of a thread up in the answer cache.
+
+    Returns (hit, key): hit is (CachedAnswer, similarity) or None, and key is what
+    remember_answer needs to cache the answer once it is generated. Follow-up
+    questions depend on the conversation, so they bypass the cache (key is None).
+    """
+    if graph.get_state(config).values.get("messages"):
+        return None, None
+    namespace, quality = config["configurable"]["namespace"], config["configurable"]["quality"]
+    try:
+        generation = answer_cache.generation(namespace)
+        vector = answer_cache.embed(input_message)
+        return answer_cache.lookup(namespace, quality, vector), (namespace, quality, vector, generation)
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+        return None, None
+
+def remember_answer(key, input_message, answer):
+    if key is not None and answer and answer != "No response generated":
+        namespace, quality, vector, generation = key
+        answer_cache.store(namespace, quality, input_message, vector, answer, generation)
+
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
     input_message = data.get("message", "")
     namespace = data.get("namespace", "default_namespace")
     thread_id = data.get("thread_id", str(uuid.uuid4())) 
+    quality = data.get("quality", "full")
+    stream = data.get("stream", False) or "text/event-stream" in request.headers.get("Accept", "")
     
+    if quality not in QUALITY_MODES:
+        return jsonify({"error": f"quality must be one of {', '.join(QUALITY_MODES)}"}), 400
+
     # Validate namespace exists
-    if namespace not in get_all_namespaces():
+    if not namespace_exists(namespace):
         return jsonify({"error": f"Namespace '{namespace}' does not exist"}), 404
     
-    # Set the global namespace for this request
-    global current_namespace
-    current_namespace = namespace
-    
-    config = {"configurable": {"thread_id": thread_id}}
-    response_messages = []
-    
-    for step in graph.stream(
-        {"messages": [{"role": "user", "content": input_message}]},
-        stream_mode="values",
-        config=config,
-    ):
-        if step["messages"][-1].type == "ai" and not step["messages"][-1].tool_calls:
-            response_messages.append(step["messages"][-1].content)
-
-    # Get the final response
-    final_response = response_messages[-1] if response_messages else "No response generated"
+    # The retrieve tool reads the namespace from this request's config
+    config = {"configurable": {
+        "thread_id": thread_id,
+        "namespace": namespace,
+        "quality": "full" if quality == "full" else "fast",
+    }}
+    meta = {"thread_id": thread_id, "namespace": namespace, "query": input_message, "quality": quality}
+
+    # Near-duplicates of an earlier first question are answered from the cache
+    lookup_started = time.perf_counter()
+    hit, cache_key = lookup_cached_answer(input_message, config) if data.get("cache", True) else (None, None)
+    cache_seconds = round(time.perf_counter() - lookup_started, 3)
+    if hit is not None:
+        cached, similarity = hit
+        # Keep the exchange in the thread so follow-up questions have their context
+        with thread_lock(thread_id):
+            graph.update_state(config, {"messages": [HumanMessage(input_message), AIMessage(cached.answer)]}, as_node="improve")
+        result = {
+            "response": cached.answer,
+            **meta,
+            "cached": {"query": cached.query, "similarity": round(similarity, 4)},
+            "timings": {"answer_cache": cache_seconds},
+        }
+        if stream:
+            return sse_response(iter([sse("answer", result), sse("done", {"thread_id": thread_id})]))
+        return jsonify(result), 200
+
+    if stream:
+        def events():
+            timings = {"answer_cache": cache_seconds}
+            first_token = None
+            started = time.perf_counter()
+            with thread_lock(thread_id):
+                for event in run_chat_graph(input_message, config):
+                    if event[0] == "token":
+                        if first_token is None:
+                            first_token = timings["first_token"] = round(time.perf_counter() - started, 3)
+                        yield sse("token", {"node": event[1], "text": event[2]})
+                    elif event[0] == "stage":
+                        timings[event[1]] = event[2]
+                        yield sse("stage", {"node": event[1], "seconds": event[2]})
+                    else:
+                        remember_answer(cache_key, input_message, event[1])
+                        yield sse("answer", {**meta, "response": event[1], "timings": timings})
+                maintain_thread(config)
+                base = graph.get_state(config)
+            if quality == "background":
+                try:
+                    improved, improve_timings = improve_in_background(config, base)
+                except Exception as e:
+                    print(f"Improvement of thread {thread_id} failed: {e}")
+                    improved = None
+                if improved is not None:
+                    yield sse("improved", {**meta, "response": improved, "timings": improve_timings})
+            yield sse("done", {"thread_id": thread_id})
+
+        return sse_response(events())
+
+    timings = {"answer_cache": cache_seconds}
+    final_response = None
+    with thread_lock(thread_id):
+        for event in run_chat_graph(input_message, config):
+            if event[0] == "stage":
+                timings[event[1]] = event[2]
+            elif event[0] == "answer":
+                final_response = event[1]
+        maintain_thread(config)
+        base = graph.get_state(config)
+    remember_answer(cache_key, input_message, final_response)
+
+    if quality == "background":
+        # The improved answer lands in the thread's history once it is ready, unless a newer turn came first
+        submit_improvement(config, base)
 
     return jsonify({
         "response": final_response,
-        "thread_id": thread_id,
-        "namespace": namespace,
-        "query": input_message
+        **meta,
+        "timings": timings
     }), 200
 
 # Add a new endpoint to list documents by title in a namespace
 @app.route('/namespace/<namespace>/documents', methods=['GET'])
 def list_documents(namespace):
     """List all documents in a namespace grouped by title"""
-    if namespace not in get_all_namespaces():
+    if not namespace_exists(namespace):
         return jsonify({"error": f"Namespace '{namespace}' does not exist"}), 404
     
     try:
-        # Query with dummy vector to get metadata
-        results = index.query(
-            namespace=namespace,
-            vector=[0]*1536,  # dummy vector
-            top_k=10000,
-            include_metadata=True
-        )
-        
-        # Group chunks by document title
-        documents = {}
-        for match in results.matches:
-            title = match.metadata.get('doc_title')
-            if not title:
-                continue
-                
-            if title not in documents:
-                documents[title] = {
-                    'title': title,
-                    'filename': match.metadata.get('original_filename'),
-                    'total_chunks': match.metadata.get('total_chunks'),
-                    'chunks': []
-                }
-            documents[title]['chunks'].append({
-                'id': match.id,
-                'chunk_index': match.metadata.get('chunk_index')
-            })
+        ensure_registered(namespace)
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        offset = int(request.args.get('offset', 0))
+        include_chunks = request.args.get('include_chunks', 'true').lower() == 'true'
+
+        total, documents = document_registry.list_documents(namespace, limit=limit, offset=offset)
+        if include_chunks:
+            for document in documents:
+                document['chunks'] = document_registry.chunks(namespace, document['title'])
             
         return jsonify({
             "namespace": namespace,
-            "document_count": len(documents),
-            "documents": list(documents.values())
+            "document_count": total,
+            "limit": limit,
+            "offset": offset,
+            "documents": documents
         }), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # The reloader would start a second process draining the same job spool
+    app.run(debug=True, port=5000, use_reloader=False)
 
@@ -0,0 +1,229 @@
+"""Streaming, batched ingestion of documents into a Pinecone namespace.
+
+Pages are pulled lazily from a LangChain loader, split one page at a time,
+embedded in size-bounded batches on a small thread pool and upserted to the
+index in parallel batches with retry/backoff. Nothing holds the whole
+document (or all of its vectors) in memory at once.
+"""
+import random
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class IngestStats:
+    """Progress counters for a single ingestion run."""
+    pages: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    upserted: int = 0
+    embed_batches: int = 0
+    upsert_batches: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    @property
+    def chunks_per_sec(self) -> float:
+        elapsed = self.elapsed
+        return self.upserted / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "embedded": self.embedded,
+            "upserted": self.upserted,
+            "embed_batches": self.embed_batches,
+            "upsert_batches": self.upsert_batches,
+            "retries": self.retries,
+            "elapsed_sec": round(self.elapsed, 3),
+            "chunks_per_sec": round(self.chunks_per_sec, 2),
+        }
+
+
+def with_retry(fn, *args, attempts=5, base_delay=0.5, max_delay=20.0, on_retry=None, **kwargs):
+    """Call fn, retrying with exponential backoff and full jitter on any exception."""
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            if on_retry is not None:
+                on_retry()
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(random.uniform(0, delay))
+
+
+class IngestPipeline:
+    """Embed and upsert chunks of a document with bounded memory and concurrency.
+
+    `embeddings` is any object with `embed_documents(texts)` (e.g. OpenAIEmbeddings)
+    and `index` is a Pinecone index (anything with `upsert(vectors=..., namespace=...)`).
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        index,
+        text_splitter,
+        embed_batch_size: int = 128,
+        embed_batch_chars: int = 200_000,
+        embed_concurrency: int = 4,
+        upsert_batch_size: int = 100,
+        upsert_concurrency: int = 4,
+        max_retries: int = 5,
+        text_key: str = "text",
+        on_progress: Optional[Callable[[IngestStats], None]] = None,
+        progress_every: int = 1,
+        on_upserted: Optional[Callable[[str, list], None]] = None,
+    ):
+        self.embeddings = embeddings
+        self.index = index
+        self.text_splitter = text_splitter
+        self.embed_batch_size = embed_batch_size
+        self.embed_batch_chars = embed_batch_chars
+        self.embed_concurrency = embed_concurrency
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_concurrency = upsert_concurrency
+        self.max_retries = max_retries
+        self.text_key = text_key
+        self.on_progress = on_progress
+        self.progress_every = progress_every
+        self.on_upserted = on_upserted
+
+    def run(
+        self, pages: Iterable, namespace: str, doc_title: str, filename: str, id_seed: Optional[str] = None
+    ) -> Tuple[IngestStats, List[dict]]:
+        """Ingest `pages` (an iterable of Documents) into `namespace`.
+
+        If `id_seed` is given chunk ids are derived from it and the chunk index, so
+        re-running the same ingestion overwrites its vectors instead of duplicating them.
+        Returns the final stats and a list of {id, title, chunk_index} for every chunk written.
+        """
+        stats = IngestStats()
+        chunks_metadata: List[dict] = []
+        batch, batch_chars = [], 0
+
+        embed_pool = ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix="embed")
+        upsert_pool = ThreadPoolExecutor(max_workers=self.upsert_concurrency, thread_name_prefix="upsert")
+        embed_futures, upsert_futures = set(), set()
+
+        def count_retry():
+            stats.retries += 1
+
+        def embed(chunks):
+            texts = [chunk.page_content for chunk in chunks]
+            vectors = with_retry(self.embeddings.embed_documents, texts,
+                                 attempts=self.max_retries, on_retry=count_retry)
+            return chunks, vectors
+
+        def upsert(records):
+            with_retry(self.index.upsert, vectors=records, namespace=namespace,
+                       attempts=self.max_retries, on_retry=count_retry)
+            if self.on_upserted is not None:
+                self.on_upserted(namespace, records)
+            return len(records)
+
+        def collect(done):
+            for future in done:
+                if future in embed_futures:
+                    embed_futures.discard(future)
+                    chunks, vectors = future.result()
+                    stats.embedded += len(chunks)
+                    records = [
+                        (chunk.metadata["doc_id"], vector, {**chunk.metadata, self.text_key: chunk.page_content})
+                        for chunk, vector in zip(chunks, vectors)
+                    ]
+                    for start in range(0, len(records), self.upsert_batch_size):
+                        upsert_futures.add(upsert_pool.submit(upsert, records[start:start + self.upsert_batch_size]))
+                else:
+                    upsert_futures.discard(future)
+                    stats.upserted += future.result()
+                    stats.upsert_batches += 1
+                    self._report(stats)
+
+        def drain(max_pending: int):
+            """Collect finished work, blocking while more than `max_pending` batches are in flight."""
+            collect({f for f in embed_futures | upsert_futures if f.done()})
+            while len(embed_futures) + len(upsert_futures) > max_pending:
+                done, _ = wait(embed_futures | upsert_futures, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        def flush():
+            nonlocal batch, batch_chars
+            if batch:
+                embed_futures.add(embed_pool.submit(embed, batch))
+                stats.embed_batches += 1
+                batch, batch_chars = [], 0
+            drain(max_pending=self.embed_concurrency + self.upsert_concurrency)
+
+        try:
+            for page in pages:
+                stats.pages += 1
+                for split in self.text_splitter.split_documents([page]):
+                    stats.chunks += 1
+                    if id_seed is None:
+                        chunk_id = str(uuid.uuid4())
+                    else:
+                        chunk_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{id_seed}:{stats.chunks}"))
+                    split.metadata.update({
+                        'doc_id': chunk_id,
+                        'doc_title': doc_title,
+                        'original_filename': filename,
+                        'chunk_index': stats.chunks,
+                    })
+                    chunks_metadata.append({
+                        'id': chunk_id,
+                        'title': doc_title,
+                        'chunk_index': stats.chunks
+                    })
+                    batch.append(split)
+                    batch_chars += len(split.page_content)
+                    if len(batch) >= self.embed_batch_size or batch_chars >= self.embed_batch_chars:
+                        flush()
+            flush()
+            drain(max_pending=0)
+        finally:
+            embed_pool.shutdown(wait=True, cancel_futures=True)
+            upsert_pool.shutdown(wait=True, cancel_futures=True)
+            stats.finished_at = time.time()
+
+        self._report(stats, force=True)
+        return stats, chunks_metadata
+
+    def _report(self, stats: IngestStats, force: bool = False):
+        if self.on_progress is None:
+            return
+        if force or stats.upsert_batches % max(1, self.progress_every) == 0:
+            self.on_progress(stats)
+
+
+def load_pages(filepath: str, extension: str):
+    """Lazily yield pages of a PDF or text file as LangChain Documents."""
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+
+    if extension == 'pdf':
+        loader = PyPDFLoader(filepath)
+    elif extension == 'txt':
+        loader = TextLoader(filepath)
+    else:
+        raise ValueError(f"Unsupported file type: {extension}")
+    return loader.lazy_load()
+
+
+def print_progress(stats: IngestStats):
+    print(
+        f"[ingest] pages={stats.pages} chunks={stats.chunks} embedded={stats.embedded} "
+        f"upserted={stats.upserted} retries={stats.retries} "
+        f"rate={stats.chunks_per_sec:.1f} chunks/s"
+    )
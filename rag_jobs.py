@@ -0,0 +1,194 @@
+"""Durable background job queue for document ingestion.
+
+Every job lives in its own directory under the spool folder: the uploaded
+file plus a `job.json` describing its state. Jobs are handed to a fixed pool
+of worker threads through a bounded queue, and anything still queued or
+running when the process stopped is picked up again on the next start.
+"""
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the queue is at capacity and cannot accept another job."""
+
+
+class JobQueue:
+    """A bounded worker pool backed by an on-disk job spool.
+
+    `handler(job, update)` does the actual work; `update(**fields)` merges
+    fields into the job record and persists it, so progress survives restarts.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        handler: Callable[[dict, Callable[..., None]], Optional[dict]],
+        workers: int = 2,
+        max_depth: int = 16,
+        retention_sec: float = 24 * 3600,
+    ):
+        self.spool_dir = spool_dir
+        self.handler = handler
+        self.max_depth = max_depth
+        self.retention_sec = retention_sec
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        os.makedirs(spool_dir, exist_ok=True)
+
+        self._recover()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True).start()
+
+    def submit(self, upload, filename: str, payload: dict) -> dict:
+        """Spool `upload` (a werkzeug FileStorage) to disk and enqueue it."""
+        self._expire()
+        with self._lock:
+            if self.depth() >= self.max_depth:
+                raise QueueFullError(f"Ingestion queue is full ({self.max_depth} jobs pending)")
+            job_id = str(uuid.uuid4())
+            job_dir = os.path.join(self.spool_dir, job_id)
+            os.makedirs(job_dir)
+            job = {
+                "id": job_id,
+                "status": QUEUED,
+                "stage": QUEUED,
+                "filename": filename,
+                "filepath": os.path.join(job_dir, filename),
+                "payload": payload,
+                "attempts": 0,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": {},
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job_id] = job
+        try:
+            upload.save(job["filepath"])
+            self._persist(job)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        self._queue.put(job_id)
+        return self.status(job_id)
+
+    def depth(self) -> int:
+        """Number of jobs that are queued or running."""
+        return sum(1 for job in self._jobs.values() if job["status"] in (QUEUED, RUNNING))
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Public view of a job, or None if it is unknown."""
+        self._expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        now = time.time()
+        started, finished = job["started_at"], job["finished_at"]
+        job["timings"] = {
+            "queued_sec": round((started or now) - job["created_at"], 3),
+            "running_sec": round((finished or now) - started, 3) if started else None,
+            "total_sec": round((finished or now) - job["created_at"], 3),
+        }
+        job.pop("filepath", None)
+        return job
+
+    def _expired(self, job: dict, now: float) -> bool:
+        return job["status"] in (DONE, FAILED) and now - (job["finished_at"] or 0) > self.retention_sec
+
+    def _expire(self):
+        """Forget finished jobs older than the retention period and delete their spool directories."""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if self._expired(job, now)]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            snapshot = dict(job)
+        self._persist(snapshot)
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+            self._expire()
+
+    def _run(self, job_id: str):
+        job = self._jobs[job_id]
+        self._update(job_id, status=RUNNING, stage="starting", started_at=time.time(),
+                     attempts=job["attempts"] + 1, error=None)
+        try:
+            result = self.handler(dict(job), lambda **fields: self._update(job_id, **fields))
+            self._update(job_id, status=DONE, stage=DONE, result=result, finished_at=time.time())
+        except Exception as e:
+            self._update(job_id, status=FAILED, stage=FAILED, error=str(e), finished_at=time.time())
+        finally:
+            # The upload is only needed while the job can still run
+            try:
+                os.remove(job["filepath"])
+            except OSError:
+                pass
+
+    def _persist(self, job: dict):
+        path = os.path.join(self.spool_dir, job["id"], "job.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def _recover(self):
+        """Reload the spool, re-queue unfinished jobs and prune expired finished ones."""
+        pending = []
+        for job_id in os.listdir(self.spool_dir):
+            job_dir = os.path.join(self.spool_dir, job_id)
+            try:
+                with open(os.path.join(job_dir, "job.json")) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                shutil.rmtree(job_dir, ignore_errors=True)
+                continue
+
+            if job["status"] in (DONE, FAILED):
+                if self._expired(job, time.time()):
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    continue
+            elif not os.path.exists(job["filepath"]):
+                job.update(status=FAILED, stage=FAILED, error="Uploaded file lost from spool",
+                           finished_at=time.time())
+                self._persist(job)
+            else:
+                # Interrupted mid-run: start it over from the spooled upload
+                job.update(status=QUEUED, stage=QUEUED)
+                self._persist(job)
+                pending.append(job)
+
+            self._jobs[job["id"]] = job
+
+        for job in sorted(pending, key=lambda j: j["created_at"]):
+            self._queue.put(job["id"])
@@ -12,6 +12,9 @@ from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
 from llama_index.readers.file import PandasExcelReader
 from llama_index.core.node_parser import MarkdownNodeParser, SentenceSplitter
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from embedding_cache import get_embedding_cache
 from dotenv import load_dotenv
 import streamlit as st
 
@@ -43,6 +46,36 @@ def load_llm():
     )
     return llm
 
+class CachedEmbedding(BaseEmbedding):
+    """Route a llama-index embedding model through the shared embedding cache."""
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: object = PrivateAttr()
+
+    def __init__(self, inner, cache, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._cache = cache
+
+    def _get_query_embedding(self, query):
+        # BGE embeds queries with an instruction prefix, so they get their own keys
+        return self._cache.get_or_compute(
+            f"{self.model_name}::query", [query], lambda queries: [self._inner.get_query_embedding(queries[0])]
+        )[0]
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._cache.get_or_compute(self.model_name, texts, self._inner.get_text_embedding_batch)
+
+@st.cache_resource
+def load_embed_model():
+    embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-large-en-v1.5", trust_remote_code=True)
+    return CachedEmbedding(embed_model, get_embedding_cache())
+
 def reset_chat():
     st.session_state.messages = []
     st.session_state.context = None
@@ -100,12 +133,13 @@ with st.sidebar:
             if os.path.exists(index_persist_dir):
                 st.sidebar.info("Found existing index. Loading...")
                 # Load the existing index
-                storage_context = StorageContext.from_defaults(persist_dir=index_persist_dir)
-                index = load_index_from_storage(storage_context)
-                
-                # Get LLM
+                # Get LLM and the same embedding model the index was built with
                 llm = load_llm()
                 Settings.llm = llm
+                Settings.embed_model = load_embed_model()
+
+                storage_context = StorageContext.from_defaults(persist_dir=index_persist_dir)
+                index = load_index_from_storage(storage_context)
                 
                 # Create query engine
                 query_engine = index.as_query_engine(
@@ -168,8 +202,7 @@ with st.sidebar:
 
                     # Setup LLM & embedding model
                     llm = load_llm()
-                    embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-large-en-v1.5", trust_remote_code=True)
-        
+                    embed_model = load_embed_model()
                     
                     # Configure settings
                     Settings.embed_model = embed_model
@@ -0,0 +1,486 @@
+"""asyncio variant of SimpleTextBrowser, for hosting many concurrent browsing sessions in one process.
+
+AsyncTextBrowser keeps SimpleTextBrowser's viewport, history, find-on-page
+and caching behaviour, but fetches over a shared httpx.AsyncClient instead of
+blocking a thread per request. Markdown conversion, PDF decoding, search
+indexing and disk I/O (the page cache, downloads) block, so they run on an
+executor (a shared thread pool by default) and never stall the event loop.
+Navigation methods are coroutines:
+
+    async with AsyncTextBrowser(downloads_folder="./downloads", serpapi_key=key) as browser:
+        await browser.visit_page("https://python.org")
+        await browser.page_down()
+        header, content = browser._state()
+
+The tools below mirror the synchronous ones with `async def forward`. PageUpTool,
+FindNextTool and PageCountTool only touch computed state and can be used as is.
+"""
+import asyncio
+import functools
+import io
+import mimetypes
+import os
+import pathlib
+import time
+import weakref
+from collections import defaultdict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Optional
+from urllib.parse import unquote, urlparse
+
+import httpx
+from serpapi import GoogleSearch
+
+from smolagents import Tool
+
+from cookies import COOKIES
+from downloads import SNIFF_BYTES, DownloadTooLarge
+from http_session import HTTP2, HTTP_RETRIES, HTTP_TIMEOUT, POOL_HOSTS, POOL_PER_HOST
+from mdconvert import FileConversionException, UnsupportedFormatException
+from text_web_browser import SimpleTextBrowser
+
+# CPU-bound work (conversion, PDF decoding, search indexing) shared by every async browser in the process
+CONVERSION_WORKERS = int(os.getenv("BROWSER_CONVERSION_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+_conversion_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_conversion_executor() -> ThreadPoolExecutor:
+    global _conversion_executor
+    if _conversion_executor is None:
+        _conversion_executor = ThreadPoolExecutor(max_workers=CONVERSION_WORKERS, thread_name_prefix="convert")
+    return _conversion_executor
+
+
+class AsyncHTTP:
+    """One pooled httpx.AsyncClient per event loop, with at most POOL_PER_HOST requests in flight per host."""
+
+    def __init__(self):
+        http2 = HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError as e:
+                print(f"HTTP/2 unavailable, using HTTP/1.1: {e}")
+                http2 = False
+        transport = httpx.AsyncHTTPTransport(
+            http2=http2,
+            limits=httpx.Limits(max_connections=POOL_HOSTS * POOL_PER_HOST, max_keepalive_connections=POOL_HOSTS * POOL_PER_HOST),
+            retries=HTTP_RETRIES,  # Only retries failed connects
+        )
+        self.client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(HTTP_TIMEOUT[1], connect=HTTP_TIMEOUT[0]),
+            cookies=COOKIES,
+            follow_redirects=True,
+        )
+        self.host_slots = defaultdict(lambda: asyncio.Semaphore(POOL_PER_HOST))
+
+    def stream(self, url: str, **kwargs):
+        return _HostLimitedStream(self, url, kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        async with self.host_slots[urlparse(url).netloc]:
+            return await self.client.get(url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class _HostLimitedStream:
+    """`async with` a streamed GET while holding one of the host's slots."""
+
+    def __init__(self, http: AsyncHTTP, url: str, kwargs):
+        self.slot = http.host_slots[urlparse(url).netloc]
+        self.context = http.client.stream("GET", url, **kwargs)
+
+    async def __aenter__(self) -> httpx.Response:
+        await self.slot.acquire()
+        try:
+            return await self.context.__aenter__()
+        except BaseException:
+            self.slot.release()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        try:
+            return await self.context.__aexit__(*exc_info)
+        finally:
+            self.slot.release()
+
+
+_loop_http: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHTTP]" = weakref.WeakKeyDictionary()
+
+
+def get_async_http() -> AsyncHTTP:
+    """Return the AsyncHTTP of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    if loop not in _loop_http:
+        _loop_http[loop] = AsyncHTTP()
+    return _loop_http[loop]
+
+
+class AsyncTextBrowser(SimpleTextBrowser):
+    """SimpleTextBrowser with coroutine navigation; see the module docstring."""
+
+    def __init__(
+        self,
+        start_page: Optional[str] = None,
+        http: Optional[AsyncHTTP] = None,
+        executor: Optional[Executor] = None,
+        **kwargs: Any,
+    ):
+        kwargs.pop("prefetch_results", None)  # Thread-based prefetching does not apply here
+        self._http = http
+        self._executor = executor if executor is not None else get_conversion_executor()
+        super().__init__(start_page=start_page, **kwargs)
+
+    def _open_start_page(self) -> None:
+        # Fetching needs a running event loop, so a real start page is opened by `start` / `async with`
+        SimpleTextBrowser.set_address(self, "about:blank")
+
+    async def start(self) -> "AsyncTextBrowser":
+        if self.start_page != "about:blank":
+            await self.set_address(self.start_page)
+        return self
+
+    async def __aenter__(self) -> "AsyncTextBrowser":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._set_page_content("")  # Releases any PDF still being decoded
+
+    @property
+    def http(self) -> AsyncHTTP:
+        return self._http if self._http is not None else get_async_http()
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run CPU-bound or blocking I/O work on the executor."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    # Navigation
+
+    async def set_address(self, uri_or_path: str, filter_year: Optional[int] = None) -> None:
+        self.history.append((uri_or_path, time.time()))
+
+        # Handle special URIs
+        if uri_or_path == "about:blank":
+            self._set_page_content("")
+        elif uri_or_path.startswith("google:"):
+            await self._serpapi_search(uri_or_path[len("google:") :].strip(), filter_year=filter_year)
+        else:
+            await self._fetch_page(self._qualify_address(uri_or_path))
+
+        self._reset_viewport()
+
+    async def visit_page(self, path_or_uri: str, filter_year: Optional[int] = None) -> str:
+        """Update the address, visit the page, and return the content of the viewport."""
+        await self.set_address(path_or_uri, filter_year=filter_year)
+        return self.viewport
+
+    async def page_down(self) -> None:
+        # Split (and for PDFs, decode) the next viewport off the event loop
+        await self._run(self._ensure_viewports, self.viewport_current_page + 1)
+        super().page_down()
+
+    async def find_on_page(self, query: str) -> Optional[str]:
+        return await self._run(super().find_on_page, query)
+
+    async def _serpapi_search(self, query: str, filter_year: Optional[int] = None) -> None:
+        params = self._serpapi_params(query, filter_year)
+        results = await self._run(lambda: GoogleSearch(params).get_dict())
+        self._show_search_results(query, filter_year, results)
+
+    async def _fetch_page(self, url: str) -> None:
+        download_path = ""
+        try:
+            if url.startswith("file://"):
+                download_path = os.path.normcase(os.path.normpath(unquote(url[7:])))
+                if self.stream_pdfs and os.path.splitext(download_path)[1].lower() == ".pdf":
+                    pdf_stream = await self._run(self._mdconvert.stream_pdf, download_path)
+                    self.page_title = None
+                    await self._run(self._set_page_content, "", pdf_stream)
+                    return
+                res = await self._run(self._mdconvert.convert_local, download_path)
+                self.page_title = res.title
+                self._set_page_content(res.text_content)
+                return
+
+            # Serve text pages from the cache while fresh, otherwise revalidate them
+            headers = dict(self.request_kwargs.get("headers", {}))
+            cached = await self._run(self._page_cache.lookup, url) if self._page_cache is not None else None
+            if cached is not None and "text/" not in cached.content_type.lower():
+                cached = None
+            if cached is not None and cached.fresh and await self._run(self._show_cached_page, cached):
+                return
+            if cached is not None:
+                headers.update(cached.conditional_headers())
+
+            async with self.http.stream(url, headers=headers) as response:
+                if response.status_code != 304 or cached is None:
+                    return await self._show_response(url, response)
+                await self._run(self._page_cache.revalidated, url, response.headers)
+            if await self._run(self._show_cached_page, cached):
+                return
+            # The cached body is gone: fetch it again, unconditionally
+            async with self.http.stream(url, headers=self.request_kwargs.get("headers", {})) as response:
+                await self._show_response(url, response)
+
+        except UnsupportedFormatException as e:
+            print(e)
+            self.page_title = ("Download complete.",)
+            self._set_page_content(f"# Download complete\n\nSaved file to '{download_path}'")
+        except FileConversionException as e:
+            print(e)
+            self.page_title = ("Download complete.",)
+            self._set_page_content(f"# Download complete\n\nSaved file to '{download_path}'")
+        except DownloadTooLarge as e:
+            print(e)
+            self.page_title = "Download too large"
+            self._set_page_content(f"# Download too large\n\n{e}")
+        except FileNotFoundError:
+            self.page_title = "Error 404"
+            self._set_page_content(f"## Error 404\n\nFile not found: {download_path}")
+        except httpx.HTTPError as e:
+            self.page_title = "Error"
+            self._set_page_content(f"## Error\n\n{str(e)}")
+
+    async def _show_response(self, url: str, response: httpx.Response) -> None:
+        content_type = response.headers.get("content-type", "")
+
+        # Errors: render the (size-limited) body, as HTML if it is HTML
+        if response.status_code >= 400:
+            body = await self._read_limited(response, SNIFF_BYTES * 128)
+            self.page_title = f"Error {response.status_code}"
+            if "text/html" in content_type.lower():
+                res = await self._run(self._mdconvert.convert_stream, io.BytesIO(body), file_extension=".html")
+                text = res.text_content
+            else:
+                text = body.decode(response.encoding or "utf-8", errors="replace")
+            self._set_page_content(f"## Error {response.status_code}\n\n{text}")
+            return
+
+        # Text or HTML
+        if "text/" in content_type.lower():
+            body = await self._read_limited(response, self.downloader.max_bytes)
+            if self._page_cache is not None:
+                stored = await self._run(self._page_cache.store_response, url, str(response.url), response.headers, body)
+                if await self._run(self._show_cached_page, stored):
+                    return
+            extension = mimetypes.guess_extension(content_type.split(";")[0])
+            res = await self._run(
+                self._mdconvert.convert_stream, io.BytesIO(body), file_extension=extension, url=str(response.url)
+            )
+            self.page_title = res.title
+            self._set_page_content(res.text_content)
+            return
+
+        # A download
+        download_path = await self._run(self._download_path, url, content_type)
+        head = await self._save_download(url, response, download_path)
+        if self.sniff_downloads and not self._mdconvert.can_convert(
+            [mimetypes.guess_extension(content_type.split(";")[0]), os.path.splitext(download_path)[1]], head
+        ):
+            self.page_title = "Download complete."
+            self._set_page_content(f"# Download complete\n\nSaved file to '{download_path}'")
+            return
+
+        # Render it
+        await self.set_address(pathlib.Path(download_path).as_uri())
+
+    async def _read_limited(self, response: httpx.Response, max_bytes: int) -> bytes:
+        chunks, size = [], 0
+        async for chunk in response.aiter_bytes(self.downloader.chunk_size):
+            chunks.append(chunk[: max_bytes - size])
+            size += len(chunks[-1])
+            if size >= max_bytes:
+                break
+        return b"".join(chunks)
+
+    async def _save_download(self, url: str, response: httpx.Response, path: str) -> bytes:
+        """Stream a download to `path` within the downloader's size cap; returns its first SNIFF_BYTES."""
+        length = response.headers.get("content-length", "")
+        if length.isdigit() and int(length) > self.downloader.max_bytes:
+            raise DownloadTooLarge(f"{url} is {length} bytes, more than the {self.downloader.max_bytes} byte limit")
+        part_path, head, size = path + ".part", b"", 0
+        fh = await self._run(open, part_path, "wb")
+        try:
+            try:
+                async for chunk in response.aiter_bytes(self.downloader.chunk_size):
+                    size += len(chunk)
+                    if size > self.downloader.max_bytes:
+                        raise DownloadTooLarge(f"{url} is more than the {self.downloader.max_bytes} byte limit")
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[: SNIFF_BYTES - len(head)]
+                    await self._run(fh.write, chunk)
+            finally:
+                await self._run(fh.close)
+        except BaseException:
+            await self._run(_remove_quietly, part_path)
+            raise
+        await self._run(os.replace, part_path, path)
+        return head
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _render(browser: SimpleTextBrowser) -> str:
+    header, content = browser._state()
+    return header.strip() + "\n=======================\n" + content
+
+
+class AsyncSearchInformationTool(Tool):
+    name = "web_search"
+    description = "Perform a web search query (think a google search) and returns the search results."
+    inputs = {"query": {"type": "string", "description": "The web search query to perform."}}
+    inputs["filter_year"] = {
+        "type": "string",
+        "description": "[Optional parameter]: filter the search results to only include pages from a specific year. For example, '2020' will only include pages from 2020. Make sure to use this parameter if you're trying to search for articles from a specific date!",
+        "nullable": True,
+    }
+    output_type = "string"
+
+    def __init__(self, browser: AsyncTextBrowser):
+        super().__init__()
+        self.browser = browser
+
+    async def forward(self, query: str, filter_year: Optional[int] = None) -> str:
+        await self.browser.visit_page(f"google: {query}", filter_year=filter_year)
+        return _render(self.browser)
+
+
+class AsyncVisitTool(Tool):
+    name = "visit_page"
+    description = "Visit a webpage at a given URL and return its text. Given a url to a YouTube video, this returns the transcript."
+    inputs = {"url": {"type": "string", "description": "The relative or absolute url of the webapge to visit."}}
+    output_type = "string"
+
+    def __init__(self, browser: AsyncTextBrowser):
+        super().__init__()
+        self.browser = browser
+
+    async def forward(self, url: str) -> str:
+        await self.browser.visit_page(url)
+        return _render(self.browser)
+
+
+class AsyncDownloadTool(Tool):
+    name = "download_file"
+    description = """
+Download a file at a given URL. The file should be of this format: [".xlsx", ".pptx", ".wav", ".mp3", ".png", ".docx"]
+After using this tool, for further inspection of this page you should return the download path to your manager via final_answer, and they will be able to inspect it.
+DO NOT use this tool for .pdf or .txt or .htm files: for these types of files use visit_page with the file url instead."""
+    inputs = {"url": {"type": "string", "description": "The relative or absolute url of the file to be downloaded."}}
+    output_type = "string"
+
+    def __init__(self, browser: AsyncTextBrowser):
+        super().__init__()
+        self.browser = browser
+
+    async def forward(self, url: str) -> str:
+        if "arxiv" in url:
+            url = url.replace("abs", "pdf")
+        async with self.browser.http.stream(url) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            extension = mimetypes.guess_extension(content_type.split(";")[0])
+            if extension and isinstance(extension, str):
+                new_path = f"./downloads/file{extension}"
+            else:
+                new_path = "./downloads/file.object"
+
+            if extension and ("pdf" in extension or "txt" in extension or "htm" in extension):
+                raise Exception("Do not use this tool for pdf or txt or html files: use visit_page instead.")
+
+            try:
+                await self.browser._save_download(url, response, new_path)
+            except DownloadTooLarge as e:
+                return f"File was not downloaded: {e}"
+
+        return f"File was downloaded and saved under path {new_path}."
+
+
+class AsyncArchiveSearchTool(Tool):
+    name = "find_archived_url"
+    description = "Given a url, searches the Wayback Machine and returns the archived version of the url that's closest in time to the desired date."
+    inputs = {
+        "url": {"type": "string", "description": "The url you need the archive for."},
+        "date": {
+            "type": "string",
+            "description": "The date that you want to find the archive for. Give this date in the format 'YYYYMMDD', for instance '27 June 2008' is written as '20080627'.",
+        },
+    }
+    output_type = "string"
+
+    def __init__(self, browser: AsyncTextBrowser):
+        super().__init__()
+        self.browser = browser
+
+    async def forward(self, url, date) -> str:
+        no_timestamp_url = f"https://archive.org/wayback/available?url={url}"
+        archive_url = no_timestamp_url + f"&timestamp={date}"
+        response, response_notimestamp = await asyncio.gather(
+            self.browser.http.get(archive_url), self.browser.http.get(no_timestamp_url)
+        )
+        response, response_notimestamp = response.json(), response_notimestamp.json()
+        if "archived_snapshots" in response and "closest" in response["archived_snapshots"]:
+            closest = response["archived_snapshots"]["closest"]
+            print("Archive found!", closest)
+
+        elif "archived_snapshots" in response_notimestamp and "closest" in response_notimestamp["archived_snapshots"]:
+            closest = response_notimestamp["archived_snapshots"]["closest"]
+            print("Archive found!", closest)
+        else:
+            raise Exception(f"Your {url=} was not archived on Wayback Machine, try a different url.")
+        target_url = closest["url"]
+        await self.browser.visit_page(target_url)
+        return f"Web archive for url {url}, snapshot taken at date {closest['timestamp'][:8]}:\n" + _render(self.browser)
+
+
+class AsyncPageDownTool(Tool):
+    name = "page_down"
+    description = (
+        "Scroll the viewport DOWN one page-length in the current webpage and return the new viewport content."
+    )
+    inputs = {}
+    output_type = "string"
+
+    def __init__(self, browser: AsyncTextBrowser):
+        super().__init__()
+        self.browser = browser
+
+    async def forward(self) -> str:
+        await self.browser.page_down()
+        return _render(self.browser)
+
+
+class AsyncFinderTool(Tool):
+    name = "find_on_page_ctrl_f"
+    description = "Scroll the viewport to the first occurrence of the search string. This is equivalent to Ctrl+F."
+    inputs = {
+        "search_string": {
+            "type": "string",
+            "description": "The string to search for on the page. This search string supports wildcards like '*'",
+        }
+    }
+    output_type = "string"
+
+    def __init__(self, browser: AsyncTextBrowser):
+        super().__init__()
+        self.browser = browser
+
+    async def forward(self, search_string: str) -> str:
+        find_result = await self.browser.find_on_page(search_string)
+        header, content = self.browser._state()
+
+        if find_result is None:
+            return (
+                header.strip()
+                + f"\n=======================\nThe search string '{search_string}' was not found on this page."
+            )
+        else:
+            return header.strip() + "\n=======================\n" + content
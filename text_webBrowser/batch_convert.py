@@ -0,0 +1,286 @@
+"""Convert many files or URLs to Markdown in parallel, e.g. to feed a RAG ingestion job.
+
+PDF and Office parsing is CPU-bound, so sources are fanned out over a process
+pool with one MarkdownConverter per worker. Results stream back as they
+complete; a failure or timeout only affects its own file. Every outcome is
+appended to a JSONL manifest, and a re-run with the same manifest skips the
+sources that already converted successfully.
+
+    python batch_convert.py docs/ --out markdown/ --workers 8 --timeout 120
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import signal
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from mdconvert import MarkdownConverter
+
+
+class ConversionOutcome:
+    """The result of converting one source: status is "ok", "error" or "timeout"."""
+
+    def __init__(
+        self,
+        source: str,
+        status: str,
+        format: str,
+        seconds: float = 0.0,
+        nbytes: int = 0,
+        title: Optional[str] = None,
+        text_content: Optional[str] = None,
+        output_path: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        self.source = source
+        self.status = status
+        self.format = format
+        self.seconds = seconds
+        self.nbytes = nbytes
+        self.title = title
+        self.text_content = text_content
+        self.output_path = output_path
+        self.error = error
+
+    def to_manifest(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "status": self.status,
+            "format": self.format,
+            "seconds": round(self.seconds, 3),
+            "bytes": self.nbytes,
+            "title": self.title,
+            "output_path": self.output_path,
+            "error": self.error,
+        }
+
+
+class ConversionTimeout(BaseException):
+    """Raised by the alarm handler; not an Exception, so per-converter `except Exception` blocks let it through."""
+
+
+def source_format(source: str) -> str:
+    path = urlparse(source).path if re.match(r"^(https?|file)://", source) else source
+    return os.path.splitext(path)[1].lower() or "unknown"
+
+
+def output_path_for(source: str, output_dir: str) -> str:
+    """A stable, collision-free Markdown file name for a source."""
+    base = re.sub(r"[^\w.-]", "_", os.path.splitext(os.path.basename(urlparse(source).path or source))[0])[:80]
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(output_dir, f"{base or 'document'}-{digest}.md")
+
+
+# Worker process side
+
+_converter: Optional[MarkdownConverter] = None
+
+
+def _init_worker(converter_kwargs: Dict[str, Any]) -> None:
+    global _converter
+    _converter = MarkdownConverter(**converter_kwargs)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Let the parent handle Ctrl+C
+
+
+def _on_alarm(signum, frame):
+    raise ConversionTimeout()
+
+
+def _convert_one(source: str, timeout: Optional[float], output_dir: Optional[str]) -> ConversionOutcome:
+    fmt = source_format(source)
+    started = time.time()
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        res = _converter.convert(source)
+        if res is None:
+            raise ValueError("converter returned no result")
+    except ConversionTimeout:
+        return ConversionOutcome(source, "timeout", fmt, time.time() - started, error=f"timed out after {timeout}s")
+    except BaseException as e:  # FileConversionException and friends derive from BaseException
+        if isinstance(e, (KeyboardInterrupt, SystemExit)):
+            raise
+        return ConversionOutcome(source, "error", fmt, time.time() - started, error=f"{type(e).__name__}: {e}"[:2000])
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    seconds = time.time() - started
+    nbytes = os.path.getsize(source) if os.path.exists(source) else len(res.text_content.encode("utf-8"))
+    if output_dir is None:
+        return ConversionOutcome(source, "ok", fmt, seconds, nbytes, res.title, res.text_content)
+    # Write from the worker so large documents are not shipped back to the parent
+    path = output_path_for(source, output_dir)
+    with open(path + ".tmp", "w", encoding="utf-8") as fh:
+        fh.write(res.text_content)
+    os.replace(path + ".tmp", path)
+    return ConversionOutcome(source, "ok", fmt, seconds, nbytes, res.title, output_path=path)
+
+
+# Parent side
+
+def load_manifest(manifest_path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest manifest entry per source (later lines win)."""
+    entries: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line torn by an interrupted run
+                entries[entry["source"]] = entry
+    return entries
+
+
+def convert_many(
+    sources: Iterable[str],
+    workers: Optional[int] = None,
+    timeout: Optional[float] = 120,
+    output_dir: Optional[str] = None,
+    manifest_path: Optional[str] = None,
+    converter_kwargs: Optional[Dict[str, Any]] = None,
+) -> Iterator[ConversionOutcome]:
+    """Convert `sources` (paths or URLs) on a process pool, yielding outcomes as they complete.
+
+    With `output_dir`, Markdown is written to files there and outcomes carry
+    `output_path` instead of `text_content`. With `manifest_path`, outcomes are
+    appended to it and sources already recorded as "ok" are skipped.
+    """
+    workers = workers or os.cpu_count() or 1
+    done = load_manifest(manifest_path) if manifest_path else {}
+    pending = [source for source in dict.fromkeys(sources) if done.get(source, {}).get("status") != "ok"]
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    manifest = open(manifest_path, "a", encoding="utf-8") if manifest_path else None
+
+    def record(outcome: ConversionOutcome) -> ConversionOutcome:
+        if manifest is not None:
+            manifest.write(json.dumps(outcome.to_manifest()) + "\n")
+            manifest.flush()
+        return outcome
+
+    pool = None
+    suspects: List[str] = []  # In flight when a worker crashed; rerun one at a time to find the culprit
+    try:
+        queue = list(reversed(pending))
+        in_flight = {}
+        while queue or in_flight or suspects:
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(converter_kwargs or {},))
+            isolated = bool(suspects)
+            if isolated:
+                if not in_flight:
+                    source = suspects.pop()
+                    in_flight[pool.submit(_convert_one, source, timeout, output_dir)] = source
+            else:
+                while queue and len(in_flight) < workers * 2:
+                    source = queue.pop()
+                    in_flight[pool.submit(_convert_one, source, timeout, output_dir)] = source
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            crashed = []
+            for future in finished:
+                source = in_flight.pop(future)
+                try:
+                    yield record(future.result())
+                except BrokenProcessPool:
+                    crashed.append(source)
+            if crashed:
+                # A worker died (e.g. a crash inside a native parser) and took the pool down with it
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = None
+                if isolated:
+                    yield record(ConversionOutcome(crashed[0], "error", source_format(crashed[0]), error="worker process crashed"))
+                else:
+                    suspects.extend(crashed + list(in_flight.values()))
+                in_flight = {}
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if manifest is not None:
+            manifest.close()
+
+
+class ThroughputReport:
+    """Per-format counts, bytes and conversion rates."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.by_format = defaultdict(lambda: {"ok": 0, "error": 0, "timeout": 0, "bytes": 0, "seconds": 0.0})
+
+    def add(self, outcome: ConversionOutcome) -> None:
+        stats = self.by_format[outcome.format]
+        stats[outcome.status] += 1
+        stats["bytes"] += outcome.nbytes
+        stats["seconds"] += outcome.seconds
+
+    def lines(self) -> List[str]:
+        wall = max(time.time() - self.started, 1e-9)
+        lines = [f"{'format':<10}{'ok':>7}{'error':>7}{'timeout':>9}{'MB':>9}{'cpu s':>9}{'files/s':>9}"]
+        total_files = 0
+        for fmt, stats in sorted(self.by_format.items()):
+            files = stats["ok"] + stats["error"] + stats["timeout"]
+            total_files += files
+            lines.append(
+                f"{fmt:<10}{stats['ok']:>7}{stats['error']:>7}{stats['timeout']:>9}"
+                f"{stats['bytes'] / 1e6:>9.1f}{stats['seconds']:>9.1f}{files / wall:>9.2f}"
+            )
+        lines.append(f"{total_files} files in {wall:.1f}s ({total_files / wall:.2f} files/s)")
+        return lines
+
+
+def expand_sources(inputs: Iterable[str], extensions: Optional[List[str]] = None) -> Iterator[str]:
+    """Yield URLs and files as given, and the files inside any directories (recursively)."""
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if extensions is None or os.path.splitext(name)[1].lower() in extensions:
+                        yield os.path.join(root, name)
+        else:
+            yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert files/URLs to Markdown in parallel.")
+    parser.add_argument("inputs", nargs="+", help="Files, directories or URLs")
+    parser.add_argument("--out", required=True, help="Directory for the Markdown files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", type=float, default=120, help="Per-file timeout in seconds")
+    parser.add_argument("--manifest", default=None, help="JSONL manifest for resuming (default: OUT/manifest.jsonl)")
+    parser.add_argument("--ext", nargs="*", default=[".pdf", ".docx", ".xlsx", ".xls", ".pptx", ".html", ".htm", ".txt", ".md"],
+                        help="Extensions to pick up from directories")
+    args = parser.parse_args()
+
+    manifest_path = args.manifest or os.path.join(args.out, "manifest.jsonl")
+    report = ThroughputReport()
+    failures = 0
+    for outcome in convert_many(
+        expand_sources(args.inputs, [ext.lower() for ext in args.ext]),
+        workers=args.workers,
+        timeout=args.timeout,
+        output_dir=args.out,
+        manifest_path=manifest_path,
+    ):
+        report.add(outcome)
+        if outcome.status != "ok":
+            failures += 1
+            print(f"[{outcome.status}] {outcome.source}: {outcome.error}", file=sys.stderr)
+        else:
+            print(f"[ok] {outcome.source} -> {outcome.output_path} ({outcome.seconds:.1f}s)")
+    print("\n".join(report.lines()))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Streaming file downloads for the text browser.
+
+Bodies are written in large chunks (BROWSER_DOWNLOAD_CHUNK_SIZE) and capped at
+BROWSER_MAX_DOWNLOAD_BYTES. A download goes to `<path>.part`, next to a small
+JSON file recording its URL and validators: if the connection drops, it is
+resumed with a Range request, and a later download of the same URL to the same
+path picks up where an interrupted one stopped. Large files on servers that
+accept ranges are fetched as several parallel ranges. `sniff` reads just the
+first few KB so callers can decide whether a file is worth converting before
+the rest arrives.
+"""
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+from http_session import get_session
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("BROWSER_DOWNLOAD_CHUNK_SIZE", 1024 * 1024))
+DEFAULT_MAX_BYTES = int(os.getenv("BROWSER_MAX_DOWNLOAD_BYTES", 1024**3))
+SNIFF_BYTES = 8 * 1024
+
+# Errors after which a download can be resumed from where it stopped
+_INTERRUPTED = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+class DownloadResult:
+    """A finished download: where it was saved and how it was fetched."""
+
+    def __init__(self, path: str, nbytes: int, seconds: float, resumed_from: int = 0, parts: int = 1):
+        self.path = path
+        self.nbytes = nbytes
+        self.seconds = seconds
+        self.resumed_from = resumed_from  # Bytes reused from an earlier, interrupted download
+        self.parts = parts  # Number of parallel ranged requests
+
+
+def read_limited(response: requests.Response, max_bytes: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> bytes:
+    """Read at most `max_bytes` of a streamed body, e.g. to show an error page."""
+    chunks, size = [], 0
+    for chunk in response.iter_content(chunk_size=min(chunk_size, max_bytes)):
+        chunks.append(chunk[: max_bytes - size])
+        size += len(chunks[-1])
+        if size >= max_bytes:
+            break
+    response.close()
+    return b"".join(chunks)
+
+
+def _total_size(response: requests.Response) -> Optional[int]:
+    """Full size of the resource, from Content-Range (206) or Content-Length (200)."""
+    content_range = response.headers.get("content-range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    if response.status_code == 200 and response.headers.get("content-length", "").isdigit():
+        if not response.headers.get("content-encoding"):  # Compressed lengths say nothing about the file size
+            return int(response.headers["content-length"])
+    return None
+
+
+def _validator(response: requests.Response) -> Optional[str]:
+    """A strong ETag or Last-Modified date, used as If-Range so a changed file is not resumed."""
+    etag = response.headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("last-modified")
+
+
+class Downloader:
+    def __init__(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        parallel_threshold: int = 64 * 1024 * 1024,
+        parallel_parts: int = 4,
+        retries: int = 3,
+        session: Optional[requests.Session] = None,
+    ):
+        self.session = session if session is not None else get_session()
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.parallel_threshold = parallel_threshold  # Files at least this big are fetched as parallel ranges
+        self.parallel_parts = parallel_parts
+        self.retries = retries  # Resume attempts after a dropped connection
+
+    def sniff(self, response: requests.Response, nbytes: int = SNIFF_BYTES) -> Tuple[bytes, Iterator[bytes]]:
+        """Read the first `nbytes` of a streamed body. Returns them and an iterator over the whole body."""
+        chunks = response.iter_content(chunk_size=self.chunk_size)
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= nbytes:
+                break
+        return head[:nbytes], itertools.chain([head], chunks)
+
+    def save(
+        self,
+        url: str,
+        path: str,
+        response: Optional[requests.Response] = None,
+        chunks: Optional[Iterable[bytes]] = None,
+        request_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> DownloadResult:
+        """Download `url` to `path`.
+
+        `response` may be a streamed response to `url` that is already open,
+        and `chunks` the body as returned by `sniff`. Raises DownloadTooLarge
+        (leaving nothing behind) if the file exceeds `max_bytes`; after other
+        failures the partial file is kept so the next call can resume it.
+        """
+        started = time.time()
+        request_kwargs = {key: value for key, value in (request_kwargs or {}).items() if key != "stream"}
+        part_path, meta_path = path + ".part", path + ".part.json"
+
+        # Pick up an interrupted download of the same URL
+        offset, validator = 0, None
+        if os.path.exists(part_path) and os.path.exists(meta_path):
+            try:
+                with open(meta_path, encoding="utf-8") as fh:
+                    meta = json.load(fh)
+                if meta.get("url") == url:
+                    offset, validator = os.path.getsize(part_path), meta.get("validator")
+            except (OSError, ValueError):
+                pass
+        resumed_from = offset
+
+        try:
+            if response is None or offset > 0:
+                if response is not None:
+                    response.close()
+                response, chunks = self._request(url, request_kwargs, offset, validator), None
+                if response.status_code == 416:
+                    response.close()
+                    response = self._request(url, request_kwargs)
+                if response.status_code != 206:
+                    offset = resumed_from = 0  # The server ignored the range, or the file changed
+            response.raise_for_status()
+
+            total = _total_size(response)
+            if total is not None and total > self.max_bytes:
+                raise DownloadTooLarge(f"{url} is {total} bytes, more than the {self.max_bytes} byte limit")
+            validator = _validator(response) or validator
+            with open(meta_path, "w", encoding="utf-8") as fh:
+                json.dump({"url": url, "validator": validator, "total": total}, fh)
+
+            parts = 1
+            if (
+                offset == 0
+                and total is not None
+                and total >= self.parallel_threshold
+                and self.parallel_parts > 1
+                and response.headers.get("accept-ranges", "").lower() == "bytes"
+            ):
+                response.close()
+                self._fetch_parallel(url, part_path, total, validator, request_kwargs)
+                parts = self.parallel_parts
+            else:
+                self._stream(url, part_path, response, chunks, offset, validator, request_kwargs)
+        except DownloadTooLarge:
+            for leftover in (part_path, meta_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+        os.replace(part_path, path)
+        os.remove(meta_path)
+        return DownloadResult(path, os.path.getsize(path), time.time() - started, resumed_from, parts)
+
+    def _request(self, url, request_kwargs, offset=0, validator=None, end=None) -> requests.Response:
+        headers = dict(request_kwargs.get("headers", {}))
+        if offset > 0 or end is not None:
+            headers["Range"] = f"bytes={offset}-{'' if end is None else end}"
+            if validator:
+                headers["If-Range"] = validator
+        return self.session.get(url, **{**request_kwargs, "headers": headers, "stream": True})
+
+    def _stream(self, url, part_path, response, chunks, offset, validator, request_kwargs) -> None:
+        """Append the body to `part_path` from `offset`, resuming with a Range request if the connection drops."""
+        retries = self.retries
+        try:
+            with open(part_path, "r+b" if offset > 0 else "wb") as fh:
+                fh.seek(offset)
+                fh.truncate()
+                while True:
+                    try:
+                        for chunk in chunks if chunks is not None else response.iter_content(chunk_size=self.chunk_size):
+                            offset += len(chunk)
+                            if offset > self.max_bytes:
+                                raise DownloadTooLarge(f"{url} is more than the {self.max_bytes} byte limit")
+                            fh.write(chunk)
+                        return
+                    except _INTERRUPTED:
+                        if retries == 0:
+                            raise
+                        retries -= 1
+                    response.close()
+                    response, chunks = self._request(url, request_kwargs, offset, validator), None
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        offset = 0  # No range support: start over
+                        fh.seek(0)
+                        fh.truncate()
+        finally:
+            response.close()
+
+    def _fetch_parallel(self, url, part_path, total, validator, request_kwargs) -> None:
+        """Fetch `total` bytes as `parallel_parts` concurrent ranges, each written at its own offset."""
+        with open(part_path, "wb") as fh:
+            fh.truncate(total)
+        bounds = [total * i // self.parallel_parts for i in range(self.parallel_parts + 1)]
+
+        def fetch(start: int, end: int) -> None:
+            # Each range resumes from its own progress if its connection drops
+            position, retries = start, self.retries
+            with open(part_path, "r+b") as fh:
+                while position < end:
+                    response = self._request(url, request_kwargs, position, validator, end - 1)
+                    try:
+                        if response.status_code != 206:
+                            raise requests.exceptions.HTTPError(f"Range request for {url} returned {response.status_code}")
+                        fh.seek(position)
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            chunk = chunk[: end - position]
+                            fh.write(chunk)
+                            position += len(chunk)
+                    except _INTERRUPTED:
+                        pass
+                    finally:
+                        response.close()
+                    if position < end:
+                        if retries == 0:
+                            raise requests.exceptions.ConnectionError(f"Range {start}-{end - 1} of {url} was cut short")
+                        retries -= 1
+
+        with ThreadPoolExecutor(max_workers=self.parallel_parts, thread_name_prefix="download") as pool:
+            for future in [pool.submit(fetch, start, end) for start, end in zip(bounds, bounds[1:]) if end > start]:
+                future.result()
@@ -0,0 +1,113 @@
+"""Benchmark find-on-page on a multi-megabyte page: per-call regex scan vs. PageSearchIndex.
+
+Simulates an agent that runs find_on_page followed by a number of find_next
+steps, for a literal phrase and a wildcard query.
+
+    python find_benchmark.py --megabytes 8 --steps 20
+"""
+import argparse
+import random
+import re
+import time
+
+from page_search import PageSearchIndex, normalize_query
+
+WORDS = (
+    "the of and to in is was for on that with as by at from his her an were which are this be has had "
+    "it not or first new one their also after two its who been they other into more all when than "
+    "paris london river war city university album season church team county party film village "
+).split()
+
+
+def make_document(megabytes: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30)))
+        if rng.random() < 0.002:
+            sentence += " the eiffel tower was completed in 1889"
+        paragraph = sentence.capitalize() + ".\n\n"
+        paragraphs.append(paragraph)
+        size += len(paragraph)
+    return "".join(paragraphs)
+
+
+def split_pages(content: str, viewport_size: int):
+    """Viewport bounds as SimpleTextBrowser computes them: extend each page to end on whitespace."""
+    space = re.compile(r"[ \t\r\n]")
+    pages, start = [], 0
+    while start < len(content):
+        end = min(start + viewport_size, len(content))
+        match = space.search(content, end - 1) if end < len(content) else None
+        if end < len(content):
+            end = match.start() + 1 if match else len(content)
+        pages.append((start, end))
+        start = end
+    return pages
+
+
+def legacy_find(content, viewport_pages, query, starting_viewport):
+    """The original SimpleTextBrowser._find_next_viewport."""
+    nquery = normalize_query(query)
+    if nquery is None:
+        return None
+    idxs = list(range(starting_viewport, len(viewport_pages))) + list(range(0, starting_viewport))
+    for i in idxs:
+        bounds = viewport_pages[i]
+        ncontent = " " + (" ".join(re.split(r"\W+", content[bounds[0]:bounds[1]]))).strip().lower() + " "
+        if re.search(nquery, ncontent):
+            return i
+    return None
+
+
+def run_legacy(content, viewport_pages, query, steps):
+    visited, current = [], 0
+    for _ in range(steps):
+        match = legacy_find(content, viewport_pages, query, current)
+        if match is None:
+            break
+        visited.append(match)
+        current = (match + 1) % len(viewport_pages)
+    return visited
+
+
+def run_indexed(index, query, steps):
+    matches = index.search(query)
+    return [matches[i % len(matches)] for i in range(steps)] if matches else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=8)
+    parser.add_argument("--viewport-size", type=int, default=1024 * 8)
+    parser.add_argument("--steps", type=int, default=20, help="find_on_page + find_next calls per query")
+    args = parser.parse_args()
+
+    content = make_document(args.megabytes)
+    viewport_pages = split_pages(content, args.viewport_size)
+    print(f"{len(content) / 1e6:.1f} MB, {len(viewport_pages)} viewports")
+
+    started = time.perf_counter()
+    index = PageSearchIndex(content, viewport_pages)
+    index.search("warmup")  # Forces the one-off build
+    build_sec = time.perf_counter() - started
+    print(f"index build (once per page): {build_sec:.2f}s")
+
+    legacy_total, indexed_total = 0.0, build_sec
+    for query in ["eiffel tower", "completed in 18*", "zeppelin", "river war*", "album season"]:
+        started = time.perf_counter()
+        legacy = run_legacy(content, viewport_pages, query, args.steps)
+        legacy_sec = time.perf_counter() - started
+
+        started = time.perf_counter()
+        indexed = run_indexed(index, query, args.steps)
+        indexed_sec = time.perf_counter() - started
+
+        assert legacy == indexed, (legacy[:5], indexed[:5])
+        legacy_total += legacy_sec
+        indexed_total += indexed_sec
+        print(f"{query!r:>20}: {len(legacy):3d} steps, legacy {legacy_sec * 1000:7.1f} ms, indexed {indexed_sec * 1000:7.1f} ms")
+    print(f"session total: legacy {legacy_total:.2f}s, indexed {indexed_total:.2f}s (build included)")
+
+if __name__ == "__main__":
+    main()
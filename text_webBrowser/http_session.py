@@ -0,0 +1,237 @@
+"""Shared, connection-pooled HTTP session for the text browser and MarkdownConverter.
+
+Every browser, prefetch thread, download and converter in a process shares one
+requests.Session (see get_session), so repeated requests to a host reuse
+kept-alive connections instead of paying DNS, TCP and TLS set-up each time.
+Pool sizes, retries and timeouts come from the environment:
+
+    BROWSER_POOL_HOSTS      hosts whose connections are kept (default 32)
+    BROWSER_POOL_PER_HOST   connections kept per host (default 8)
+    BROWSER_HTTP_RETRIES    retries on connection errors, 429 and 5xx (default 3)
+    BROWSER_HTTP_TIMEOUT    read timeout in seconds (default 60; connect timeout 10)
+    BROWSER_HTTP2           "1" to speak HTTP/2 via urllib3's experimental support;
+                            needs the h2 package and only suits hosts that offer HTTP/2
+
+Retries back off exponentially with random jitter and honour Retry-After. Each
+response carries a `timing` (RequestTiming: DNS, connect, TLS, time to first
+byte, download) and the session keeps per-host aggregates in `stats()`.
+"""
+import os
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.retry import Retry
+
+POOL_HOSTS = int(os.getenv("BROWSER_POOL_HOSTS", 32))
+POOL_PER_HOST = int(os.getenv("BROWSER_POOL_PER_HOST", 8))
+HTTP_RETRIES = int(os.getenv("BROWSER_HTTP_RETRIES", 3))
+HTTP_TIMEOUT = (10, float(os.getenv("BROWSER_HTTP_TIMEOUT", 60)))
+HTTP2 = os.getenv("BROWSER_HTTP2", "0") == "1"
+
+_connection_timing = threading.local()  # Set-up phases of a connection opened by the current thread
+
+
+class RequestTiming:
+    """Phases of one request, in seconds. dns/connect/tls are 0 when a kept-alive connection was reused."""
+
+    def __init__(self, url: str, dns: float, connect: float, tls: float, ttfb: float, reused: bool):
+        self.url = url
+        self.dns = dns
+        self.connect = connect
+        self.tls = tls
+        self.ttfb = ttfb  # From sending the request to receiving the response headers
+        self.download: Optional[float] = None  # Reading the body; None until it has been read
+        self.reused = reused
+
+    @property
+    def total(self) -> float:
+        return self.dns + self.connect + self.tls + self.ttfb + (self.download or 0.0)
+
+
+class _TimedConnectionMixin:
+    """Records DNS and TCP connect times of new connections in _connection_timing."""
+
+    def _new_conn(self):
+        dns_host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            addresses = []  # Let urllib3 raise its usual error below
+        resolved = time.perf_counter()
+        try:
+            if addresses:
+                self._dns_host = addresses[0][4][0]  # Connect to the address just resolved (host is used for TLS/Host)
+            try:
+                sock = super()._new_conn()
+            except ConnectTimeoutError:
+                if len(addresses) < 2:
+                    raise
+                self._dns_host = dns_host  # Let urllib3 try every address
+                sock = super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+        _connection_timing.dns = resolved - started
+        _connection_timing.connect = time.perf_counter() - resolved
+        return sock
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _connection_timing.tls = time.perf_counter() - started - _connection_timing.dns - _connection_timing.connect
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with timed connections and a default timeout."""
+
+    def __init__(self, timeout=HTTP_TIMEOUT, http2: bool = False, **kwargs):
+        self.timeout = timeout
+        self.http2 = http2
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            # HTTP/2 connections come from urllib3's own HTTPS pool, so only their TTFB/download are timed
+            "https": HTTPSConnectionPool if self.http2 else _TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        _connection_timing.dns = _connection_timing.connect = _connection_timing.tls = None
+        started = time.perf_counter()
+        response = super().send(request, stream=stream, timeout=self.timeout if timeout is None else timeout, **kwargs)
+        elapsed = time.perf_counter() - started
+        dns, connect, tls = (getattr(_connection_timing, phase, None) for phase in ("dns", "connect", "tls"))
+        reused = dns is None
+        setup = (dns or 0.0) + (connect or 0.0) + (tls or 0.0)
+        response.timing = RequestTiming(request.url, dns or 0.0, connect or 0.0, tls or 0.0, max(elapsed - setup, 0.0), reused)
+        return response
+
+
+class PooledSession(requests.Session):
+    """requests.Session over PooledHTTPAdapter that records the timing of every response."""
+
+    def __init__(
+        self,
+        pool_hosts: int = POOL_HOSTS,
+        pool_per_host: int = POOL_PER_HOST,
+        retries: int = HTTP_RETRIES,
+        timeout=HTTP_TIMEOUT,
+        http2: bool = HTTP2,
+        keep_timings: int = 1000,
+    ):
+        super().__init__()
+        if http2:
+            http2 = _enable_http2()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.5,
+            backoff_jitter=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Hand the last response back to the caller as before
+        )
+        adapter = PooledHTTPAdapter(
+            timeout=timeout, http2=http2, pool_connections=pool_hosts, pool_maxsize=pool_per_host, max_retries=retry
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.timings: Deque[RequestTiming] = deque(maxlen=keep_timings)
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        timing = getattr(response, "timing", None)
+        if timing is None or (self.timings and self.timings[-1] is timing):
+            return response  # Not ours, or the end of a redirect chain already recorded by the nested send
+        self.timings.append(timing)
+        if not kwargs.get("stream"):
+            # requests has already read the body
+            timing.download = max(time.perf_counter() - started - timing.total, 0.0)
+        else:
+            iter_content = response.iter_content
+
+            def timed_iter_content(*args, **kwargs):
+                body_started = time.perf_counter()
+                yield from iter_content(*args, **kwargs)
+                timing.download = (timing.download or 0.0) + time.perf_counter() - body_started
+
+            response.iter_content = timed_iter_content
+        return response
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host request counts, connection reuse and mean phase times (ms) over the recent requests."""
+        by_host = defaultdict(list)
+        for timing in list(self.timings):
+            by_host[urlparse(timing.url).netloc].append(timing)
+        stats = {}
+        for host, timings in by_host.items():
+            fresh = [t for t in timings if not t.reused]
+            stats[host] = {
+                "requests": len(timings),
+                "reused": sum(t.reused for t in timings) / len(timings),
+                "dns_ms": _mean_ms([t.dns for t in fresh]),
+                "connect_ms": _mean_ms([t.connect for t in fresh]),
+                "tls_ms": _mean_ms([t.tls for t in fresh]),
+                "ttfb_ms": _mean_ms([t.ttfb for t in timings]),
+                "download_ms": _mean_ms([t.download for t in timings if t.download is not None]),
+            }
+        return stats
+
+
+def _mean_ms(seconds) -> Optional[float]:
+    return 1000 * sum(seconds) / len(seconds) if seconds else None
+
+
+def _enable_http2() -> bool:
+    """Switch urllib3's HTTPS connections to HTTP/2, if the h2 package is installed."""
+    try:
+        import urllib3.http2
+
+        urllib3.http2.inject_into_urllib3()
+        return True
+    except (ImportError, AttributeError) as e:
+        print(f"HTTP/2 unavailable, using HTTP/1.1: {e}")
+        return False
+
+
+_shared_session: Optional[PooledSession] = None
+_shared_lock = threading.Lock()
+
+
+def get_session() -> PooledSession:
+    """Return the process-wide pooled session, creating it on first use."""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = PooledSession()
+        return _shared_session
@@ -2,8 +2,9 @@
 # Thanks to Microsoft researchers for open-sourcing this!
 # type: ignore
 import base64
-import copy
 import html
+import io
+import itertools
 import json
 import mimetypes
 import os
@@ -13,7 +14,7 @@ import subprocess
 import sys
 import tempfile
 import traceback
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
 from urllib.parse import parse_qs, quote, unquote, urlparse, urlunparse
 
 import mammoth
@@ -21,6 +22,13 @@ import markdownify
 import pandas as pd
 import pdfminer
 import pdfminer.high_level
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
 import pptx
 
 # File-format detection
@@ -32,6 +40,22 @@ from bs4 import BeautifulSoup
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api.formatters import SRTFormatter
 
+from http_session import get_session
+
+# Bump whenever converter output changes, so cached conversions are not reused
+CONVERTER_VERSION = "1"
+
+# Payloads up to this size are converted from memory when the format allows it
+IN_MEMORY_LIMIT = 32 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _conversion_version(pages: Optional[Iterable[int]]) -> str:
+    """Converter version for cache keys, qualified by the page selection of a partial conversion."""
+    if pages is None:
+        return CONVERTER_VERSION
+    return f"{CONVERTER_VERSION}:pages={','.join(map(str, sorted(set(pages))))}"
+
 
 class _CustomMarkdownify(markdownify.MarkdownConverter):
     """
@@ -108,6 +132,28 @@ class _CustomMarkdownify(markdownify.MarkdownConverter):
         return super().convert_soup(soup)  # type: ignore
 
 
+def _read_text(source: Any) -> str:
+    """Read a path or an in-memory binary stream as UTF-8 text."""
+    if isinstance(source, str):
+        with open(source, "rt", encoding="utf-8") as fh:
+            return fh.read()
+    source.seek(0)
+    return source.read().decode("utf-8")
+
+
+def _rewind(source: Any) -> Any:
+    """Return a path unchanged, or an in-memory stream seeked back to its start."""
+    if not isinstance(source, str):
+        source.seek(0)
+    return source
+
+
+def _normalize_markdown(text: str) -> str:
+    """Strip trailing whitespace from every line and collapse runs of blank lines."""
+    text = "\n".join([line.rstrip() for line in re.split(r"\r?\n", text)])
+    return re.sub(r"\n{3,}", "\n\n", text)
+
+
 class DocumentConverterResult:
     """The result of converting a document to text."""
 
@@ -117,7 +163,15 @@ class DocumentConverterResult:
 
 
 class DocumentConverter:
-    """Abstract superclass of all DocumentConverters."""
+    """Abstract superclass of all DocumentConverters.
+
+    `extensions` lists the file extensions a converter handles (None means any) and is
+    used to dispatch straight to candidate converters. Converters with `in_memory` set
+    also accept a binary stream (e.g. BytesIO) in place of `local_path`.
+    """
+
+    extensions: Optional[List[str]] = None
+    in_memory: bool = False
 
     def convert(self, local_path: str, **kwargs: Any) -> Union[None, DocumentConverterResult]:
         raise NotImplementedError()
@@ -126,6 +180,8 @@ class DocumentConverter:
 class PlainTextConverter(DocumentConverter):
     """Anything with content type text/plain"""
 
+    in_memory = True
+
     def convert(self, local_path: str, **kwargs: Any) -> Union[None, DocumentConverterResult]:
         # Guess the content type from any file extension that might be around
         content_type, _ = mimetypes.guess_type("__placeholder" + kwargs.get("file_extension", ""))
@@ -136,9 +192,7 @@ class PlainTextConverter(DocumentConverter):
         # elif "text/" not in content_type.lower():
         #     return None
 
-        text_content = ""
-        with open(local_path, "rt", encoding="utf-8") as fh:
-            text_content = fh.read()
+        text_content = _read_text(local_path)
         return DocumentConverterResult(
             title=None,
             text_content=text_content,
@@ -148,17 +202,16 @@ class PlainTextConverter(DocumentConverter):
 class HtmlConverter(DocumentConverter):
     """Anything with content type text/html"""
 
+    extensions = [".html", ".htm"]
+    in_memory = True
+
     def convert(self, local_path: str, **kwargs: Any) -> Union[None, DocumentConverterResult]:
         # Bail if not html
         extension = kwargs.get("file_extension", "")
         if extension.lower() not in [".html", ".htm"]:
             return None
 
-        result = None
-        with open(local_path, "rt", encoding="utf-8") as fh:
-            result = self._convert(fh.read())
-
-        return result
+        return self._convert(_read_text(local_path))
 
     def _convert(self, html_content: str) -> Union[None, DocumentConverterResult]:
         """Helper function that converts and HTML string."""
@@ -188,6 +241,9 @@ class HtmlConverter(DocumentConverter):
 class WikipediaConverter(DocumentConverter):
     """Handle Wikipedia pages separately, focusing only on the main document content."""
 
+    extensions = [".html", ".htm"]
+    in_memory = True
+
     def convert(self, local_path: str, **kwargs: Any) -> Union[None, DocumentConverterResult]:
         # Bail if not Wikipedia
         extension = kwargs.get("file_extension", "")
@@ -198,9 +254,7 @@ class WikipediaConverter(DocumentConverter):
             return None
 
         # Parse the file
-        soup = None
-        with open(local_path, "rt", encoding="utf-8") as fh:
-            soup = BeautifulSoup(fh.read(), "html.parser")
+        soup = BeautifulSoup(_read_text(local_path), "html.parser")
 
         # Remove javascript and style blocks
         for script in soup(["script", "style"]):
@@ -233,6 +287,9 @@ class WikipediaConverter(DocumentConverter):
 class YouTubeConverter(DocumentConverter):
     """Handle YouTube specially, focusing on the video title, description, and transcript."""
 
+    extensions = [".html", ".htm"]
+    in_memory = True
+
     def convert(self, local_path: str, **kwargs: Any) -> Union[None, DocumentConverterResult]:
         # Bail if not YouTube
         extension = kwargs.get("file_extension", "")
@@ -243,9 +300,7 @@ class YouTubeConverter(DocumentConverter):
             return None
 
         # Parse the file
-        soup = None
-        with open(local_path, "rt", encoding="utf-8") as fh:
-            soup = BeautifulSoup(fh.read(), "html.parser")
+        soup = BeautifulSoup(_read_text(local_path), "html.parser")
 
         # Read the meta tags
         assert soup.title is not None and soup.title.string is not None
@@ -355,16 +410,62 @@ class PdfConverter(DocumentConverter):
     Converts PDFs to Markdown. Most style information is ignored, so the results are essentially plain-text.
     """
 
+    extensions = [".pdf"]
+    in_memory = True
+
     def convert(self, local_path, **kwargs) -> Union[None, DocumentConverterResult]:
         # Bail if not a PDF
         extension = kwargs.get("file_extension", "")
         if extension.lower() != ".pdf":
             return None
 
-        return DocumentConverterResult(
-            title=None,
-            text_content=pdfminer.high_level.extract_text(local_path),
-        )
+        pages = kwargs.get("pages")
+        if pages is None:
+            text_content = pdfminer.high_level.extract_text(_rewind(local_path))
+        else:
+            text_content = "".join(self.iter_pages(local_path, pages))
+        return DocumentConverterResult(title=None, text_content=text_content)
+
+    @staticmethod
+    def count_pages(local_path) -> Optional[int]:
+        """Number of pages, read from the page tree without decoding any page."""
+        fh = open(local_path, "rb") if isinstance(local_path, str) else _rewind(local_path)
+        try:
+            return int(resolve1(PDFDocument(PDFParser(fh)).catalog["Pages"])["Count"])
+        except Exception:
+            return None
+        finally:
+            if isinstance(local_path, str):
+                fh.close()
+
+    def iter_pages(self, local_path, pages: Optional[Iterable[int]] = None) -> Iterator[str]:
+        """Yield the text of each page as it is decoded; `pages` selects 1-based page numbers.
+
+        Nothing is parsed until the first page is requested, and pages after the
+        last selected one are never parsed. Joining every page gives the same
+        text as converting the whole file.
+        """
+        wanted = None if pages is None else set(pages)
+        if wanted is not None and not wanted:
+            return
+        last = max(wanted) if wanted is not None else None
+        fh = open(local_path, "rb") if isinstance(local_path, str) else _rewind(local_path)
+        try:
+            resources = PDFResourceManager(caching=True)
+            output = io.StringIO()
+            interpreter = PDFPageInterpreter(resources, TextConverter(resources, output, laparams=LAParams()))
+            for number, page in enumerate(PDFPage.create_pages(PDFDocument(PDFParser(fh))), start=1):
+                if last is not None and number > last:
+                    break
+                if wanted is not None and number not in wanted:
+                    continue
+                interpreter.process_page(page)
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        finally:
+            if isinstance(local_path, str):
+                fh.close()
 
 
 class DocxConverter(HtmlConverter):
@@ -372,19 +473,20 @@ class DocxConverter(HtmlConverter):
     Converts DOCX files to Markdown. Style information (e.g.m headings) and tables are preserved where possible.
     """
 
+    extensions = [".docx"]
+
     def convert(self, local_path, **kwargs) -> Union[None, DocumentConverterResult]:
         # Bail if not a DOCX
         extension = kwargs.get("file_extension", "")
         if extension.lower() != ".docx":
             return None
 
-        result = None
-        with open(local_path, "rb") as docx_file:
-            result = mammoth.convert_to_html(docx_file)
-            html_content = result.value
-            result = self._convert(html_content)
-
-        return result
+        if isinstance(local_path, str):
+            with open(local_path, "rb") as docx_file:
+                html_content = mammoth.convert_to_html(docx_file).value
+        else:
+            html_content = mammoth.convert_to_html(_rewind(local_path)).value
+        return self._convert(html_content)
 
 
 class XlsxConverter(HtmlConverter):
@@ -392,13 +494,15 @@ class XlsxConverter(HtmlConverter):
     Converts XLSX files to Markdown, with each sheet presented as a separate Markdown table.
     """
 
+    extensions = [".xlsx", ".xls"]
+
     def convert(self, local_path, **kwargs) -> Union[None, DocumentConverterResult]:
         # Bail if not a XLSX
         extension = kwargs.get("file_extension", "")
         if extension.lower() not in [".xlsx", ".xls"]:
             return None
 
-        sheets = pd.read_excel(local_path, sheet_name=None)
+        sheets = pd.read_excel(_rewind(local_path), sheet_name=None)
         md_content = ""
         for s in sheets:
             md_content += f"## {s}\n"
@@ -416,6 +520,8 @@ class PptxConverter(HtmlConverter):
     Converts PPTX files to Markdown. Supports heading, tables and images with alt text.
     """
 
+    extensions = [".pptx"]
+
     def convert(self, local_path, **kwargs) -> Union[None, DocumentConverterResult]:
         # Bail if not a PPTX
         extension = kwargs.get("file_extension", "")
@@ -424,7 +530,7 @@ class PptxConverter(HtmlConverter):
 
         md_content = ""
 
-        presentation = pptx.Presentation(local_path)
+        presentation = pptx.Presentation(_rewind(local_path))
         slide_num = 0
         for slide in presentation.slides:
             slide_num += 1
@@ -519,6 +625,8 @@ class WavConverter(MediaConverter):
     Converts WAV files to markdown via extraction of metadata (if `exiftool` is installed), and speech transcription (if `speech_recognition` is installed).
     """
 
+    extensions = [".wav"]
+
     def convert(self, local_path, **kwargs) -> Union[None, DocumentConverterResult]:
         # Bail if not a XLSX
         extension = kwargs.get("file_extension", "")
@@ -569,6 +677,8 @@ class Mp3Converter(WavConverter):
     Converts MP3 files to markdown via extraction of metadata (if `exiftool` is installed), and speech transcription (if `speech_recognition` AND `pydub` are installed).
     """
 
+    extensions = [".mp3"]
+
     def convert(self, local_path, **kwargs) -> Union[None, DocumentConverterResult]:
         # Bail if not a MP3
         extension = kwargs.get("file_extension", "")
@@ -629,6 +739,8 @@ class ImageConverter(MediaConverter):
     Converts images to markdown via extraction of metadata (if `exiftool` is installed), OCR (if `easyocr` is installed), and description via a multimodal LLM (if an mlm_client is configured).
     """
 
+    extensions = [".jpg", ".jpeg", ".png"]
+
     def convert(self, local_path, **kwargs) -> Union[None, DocumentConverterResult]:
         # Bail if not a XLSX
         extension = kwargs.get("file_extension", "")
@@ -705,6 +817,81 @@ class ImageConverter(MediaConverter):
         return response.choices[0].message.content
 
 
+class PdfPageStream:
+    """Markdown of a PDF, decoded one page at a time as it is iterated.
+
+    Once every page has been decoded the full text is stored in the page
+    cache, and a PDF that is already cached is yielded as a single chunk.
+    """
+
+    def __init__(self, converter: PdfConverter, source, pages=None, page_cache=None, cache_key: Optional[str] = None):
+        self.source = source
+        page_count = converter.count_pages(source)
+        if pages is not None:
+            pages = sorted(set(pages))
+            page_count = len([p for p in pages if page_count is None or p <= page_count])
+        self.total_pages = page_count  # None if the page tree could not be read
+        self.pages_decoded = 0
+        self.chars_decoded = 0
+        self._page_cache = page_cache
+        self._cache_key = cache_key
+        self._carry = ""  # Text after the last line break, continued by the next page
+        self._held_newlines = 0  # Trailing line breaks, held back until the length of the run is known
+        self._pages = self._generate(converter, pages)
+
+    def _generate(self, converter: PdfConverter, pages) -> Iterator[str]:
+        if self._page_cache is not None:
+            cached = self._page_cache.get_conversion(self._cache_key)
+            if cached is not None:
+                self.pages_decoded = self.total_pages or 1
+                self.chars_decoded = len(cached[1])
+                yield cached[1]
+                return
+        parts = []
+        for text in converter.iter_pages(self.source, pages):
+            text = self._normalize(text)
+            parts.append(text)
+            self.pages_decoded += 1
+            self.chars_decoded += len(text)
+            yield text
+        text = self._normalize(self._carry.rstrip(), final=True)
+        parts.append(text)
+        yield text
+        if self._page_cache is not None:
+            self._page_cache.put_conversion(self._cache_key, None, "".join(parts))
+
+    def _normalize(self, text: str, final: bool = False) -> str:
+        """_normalize_markdown, applied incrementally so that joining the pages matches the whole text."""
+        if not final:
+            lines = re.split(r"\r?\n", self._carry + text)
+            self._carry = lines.pop()
+            if not lines:
+                return ""
+            text = "\n".join([line.rstrip() for line in lines]) + "\n"
+        text = "\n" * self._held_newlines + text
+        if not final:
+            core = text.rstrip("\n")
+            self._held_newlines = len(text) - len(core)
+            text = core
+        return re.sub(r"\n{3,}", "\n\n", text)
+
+    def __iter__(self) -> "PdfPageStream":
+        return self
+
+    def __next__(self) -> str:
+        return next(self._pages)
+
+    def close(self) -> None:
+        """Stop decoding and release the file."""
+        self._pages.close()
+
+    def remaining_chars_estimate(self) -> int:
+        """Characters still to come, extrapolated from the pages decoded so far."""
+        if not self.pages_decoded or self.total_pages is None:
+            return 0
+        return self.chars_decoded * max(self.total_pages - self.pages_decoded, 0) // self.pages_decoded
+
+
 class FileConversionException(BaseException):
     pass
 
@@ -722,16 +909,19 @@ class MarkdownConverter:
         requests_session: Optional[requests.Session] = None,
         mlm_client: Optional[Any] = None,
         mlm_model: Optional[Any] = None,
+        page_cache: Optional[Any] = None,
     ):
         if requests_session is None:
-            self._requests_session = requests.Session()
+            self._requests_session = get_session()  # Shared, connection-pooled
         else:
             self._requests_session = requests_session
 
         self._mlm_client = mlm_client
         self._mlm_model = mlm_model
+        self._page_cache = page_cache  # Optional page_cache.PageCache for reusing conversions
 
         self._page_converters: List[DocumentConverter] = []
+        self._dispatch: Dict[Union[str, None], List[DocumentConverter]] = {}
 
         # Register converters for successful browsing operations
         # Later registrations are tried first / take higher priority than earlier registrations
@@ -778,7 +968,7 @@ class MarkdownConverter:
         self._append_ext(extensions, self._guess_ext_magic(path))
 
         # Convert
-        return self._convert(path, extensions, **kwargs)
+        return self._convert_cached(path, extensions, **kwargs)
 
     # TODO what should stream's type be?
     def convert_stream(self, stream: Any, **kwargs: Any) -> DocumentConverterResult:  # TODO: deal with kwargs
@@ -786,33 +976,15 @@ class MarkdownConverter:
         ext = kwargs.get("file_extension")
         extensions = [ext] if ext is not None else []
 
-        # Save the file locally to a temporary file. It will be deleted before this method exits
-        handle, temp_path = tempfile.mkstemp()
-        fh = os.fdopen(handle, "wb")
-        result = None
-        try:
-            # Write to the temporary file
-            content = stream.read()
-            if isinstance(content, str):
-                fh.write(content.encode("utf-8"))
-            else:
-                fh.write(content)
-            fh.close()
+        content = stream.read()
+        if isinstance(content, str):
+            content = content.encode("utf-8")
 
-            # Use puremagic to check for more extension options
-            self._append_ext(extensions, self._guess_ext_magic(temp_path))
-
-            # Convert
-            result = self._convert(temp_path, extensions, **kwargs)
-        # Clean up
-        finally:
-            try:
-                fh.close()
-            except Exception:
-                pass
-            os.unlink(temp_path)
+        # Use puremagic to check for more extension options
+        self._append_ext(extensions, self._guess_ext_magic(content))
 
-        return result
+        # Convert
+        return self._convert_bytes(content, extensions, **kwargs)
 
     def convert_url(self, url: str, **kwargs: Any) -> DocumentConverterResult:  # TODO: fix kwargs type
         # Send a HTTP request to the URL
@@ -843,55 +1015,108 @@ class MarkdownConverter:
         base, ext = os.path.splitext(urlparse(response.url).path)
         self._append_ext(extensions, ext)
 
-        # Save the file locally to a temporary file. It will be deleted before this method exits
-        handle, temp_path = tempfile.mkstemp()
-        fh = os.fdopen(handle, "wb")
         result = None
         try:
-            # Download the file
-            for chunk in response.iter_content(chunk_size=512):
-                fh.write(chunk)
-            fh.close()
-
-            # Use puremagic to check for more extension options
-            self._append_ext(extensions, self._guess_ext_magic(temp_path))
-
-            # Convert
-            result = self._convert(temp_path, extensions, url=response.url)
+            chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+            content_length = response.headers.get("content-length", "")
+            if (not content_length.isdigit() or int(content_length) <= IN_MEMORY_LIMIT) and self._in_memory_ok(extensions):
+                # Small payloads of formats that can be parsed from memory never touch the disk. Without a
+                # Content-Length the size is unknown, so buffer at most IN_MEMORY_LIMIT and spool the rest.
+                head, size = [], 0
+                for chunk in chunks:
+                    head.append(chunk)
+                    size += len(chunk)
+                    if size > IN_MEMORY_LIMIT:
+                        break
+                if size > IN_MEMORY_LIMIT:
+                    result = self._convert_spooled(itertools.chain(head, chunks), extensions, url=response.url)
+                else:
+                    content = b"".join(head)
+                    self._append_ext(extensions, self._guess_ext_magic(content))
+                    result = self._convert_bytes(content, extensions, url=response.url)
+            else:
+                result = self._convert_spooled(chunks, extensions, url=response.url)
         except Exception as e:
             print(f"Error in converting: {e}")
 
-        # Clean up
+        return result
+
+    def _convert_bytes(self, content: bytes, extensions: List[Union[str, None]], **kwargs) -> DocumentConverterResult:
+        """Convert from a BytesIO when every candidate converter supports it, else via a temporary file."""
+        if len(content) <= IN_MEMORY_LIMIT and self._in_memory_ok(extensions):
+            return self._convert_cached(io.BytesIO(content), extensions, **kwargs)
+        return self._convert_spooled([content], extensions, **kwargs)
+
+    def _convert_spooled(self, chunks, extensions: List[Union[str, None]], **kwargs) -> DocumentConverterResult:
+        """Write `chunks` to a temporary file, deleted before this method exits, and convert that."""
+        handle, temp_path = tempfile.mkstemp()
+        try:
+            with os.fdopen(handle, "wb", buffering=DOWNLOAD_CHUNK_SIZE) as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+
+            # Use puremagic to check for more extension options
+            self._append_ext(extensions, self._guess_ext_magic(temp_path))
+            return self._convert_cached(temp_path, extensions, **kwargs)
         finally:
-            try:
-                fh.close()
-            except Exception:
-                pass
             os.unlink(temp_path)
 
-        return result
+    def _convert_cached(self, local_path: Any, extensions: List[Union[str, None]], **kwargs) -> DocumentConverterResult:
+        """Like _convert, but reuses a cached conversion of the same bytes from the same url, if any."""
+        if self._page_cache is None:
+            return self._convert(local_path, extensions, **kwargs)
+        key = self._page_cache.conversion_key(local_path, kwargs.get("url"), _conversion_version(kwargs.get("pages")))
+        cached = self._page_cache.get_conversion(key)
+        if cached is not None:
+            return DocumentConverterResult(title=cached[0], text_content=cached[1])
+        res = self._convert(local_path, extensions, **kwargs)
+        self._page_cache.put_conversion(key, res.title, res.text_content)
+        return res
+
+    def stream_pdf(self, source: Any, pages: Optional[Iterable[int]] = None, url: Optional[str] = None) -> PdfPageStream:
+        """Convert a PDF (a path or binary stream) lazily, page by page; see PdfPageStream.
+
+        `pages` selects 1-based page numbers, e.g. range(1, 11) for the first ten.
+        """
+        converter = next(c for c in self._page_converters if isinstance(c, PdfConverter))
+        cache_key = None
+        if self._page_cache is not None:
+            cache_key = self._page_cache.conversion_key(source, url, _conversion_version(pages))
+        try:
+            return PdfPageStream(converter, source, pages, self._page_cache, cache_key)
+        except Exception:
+            raise FileConversionException(
+                f"Could not convert '{source}' to Markdown:\n\n{traceback.format_exc().strip()}"
+            )
 
-    def _convert(self, local_path: str, extensions: List[Union[str, None]], **kwargs) -> DocumentConverterResult:
+    def _convert(self, local_path: Any, extensions: List[Union[str, None]], **kwargs) -> DocumentConverterResult:
         error_trace = ""
+        tried = set()
         for ext in extensions + [None]:  # Try last with no extension
-            for converter in self._page_converters:
-                _kwargs = copy.deepcopy(kwargs)
+            ext = ext.lower() if ext else None
+            if ext in tried:
+                continue  # Converters are deterministic; a repeated extension cannot succeed the second time
+            tried.add(ext)
 
-                # Overwrite file_extension appropriately
-                if ext is None:
-                    if "file_extension" in _kwargs:
-                        del _kwargs["file_extension"]
-                else:
-                    _kwargs.update({"file_extension": ext})
+            _kwargs = dict(kwargs)
 
-                # Copy any additional global options
-                if "mlm_client" not in _kwargs and self._mlm_client is not None:
-                    _kwargs["mlm_client"] = self._mlm_client
+            # Overwrite file_extension appropriately
+            if ext is None:
+                if "file_extension" in _kwargs:
+                    del _kwargs["file_extension"]
+            else:
+                _kwargs.update({"file_extension": ext})
+
+            # Copy any additional global options
+            if "mlm_client" not in _kwargs and self._mlm_client is not None:
+                _kwargs["mlm_client"] = self._mlm_client
 
-                if "mlm_model" not in _kwargs and self._mlm_model is not None:
-                    _kwargs["mlm_model"] = self._mlm_model
+            if "mlm_model" not in _kwargs and self._mlm_model is not None:
+                _kwargs["mlm_model"] = self._mlm_model
 
+            for converter in self._converters_for(ext):
                 # If we hit an error log it and keep trying
+                res = None
                 try:
                     res = converter.convert(local_path, **_kwargs)
                 except Exception:
@@ -899,8 +1124,7 @@ class MarkdownConverter:
 
                 if res is not None:
                     # Normalize the content
-                    res.text_content = "\n".join([line.rstrip() for line in re.split(r"\r?\n", res.text_content)])
-                    res.text_content = re.sub(r"\n{3,}", "\n\n", res.text_content)
+                    res.text_content = _normalize_markdown(res.text_content)
 
                     # Todo
                     return res
@@ -927,11 +1151,49 @@ class MarkdownConverter:
         if True:
             extensions.append(ext)
 
+    def _converters_for(self, ext: Union[str, None]) -> List[DocumentConverter]:
+        """Converters that may handle `ext`, highest priority first (memoized; the table is reset on registration)."""
+        dispatch = self._dispatch  # A registration on another thread swaps in a new table
+        converters = dispatch.get(ext)
+        if converters is None:
+            converters = dispatch[ext] = [
+                converter
+                for converter in list(self._page_converters)
+                if converter.extensions is None or (ext is not None and ext in converter.extensions)
+            ]
+        return converters
+
+    def can_convert(self, extensions: List[Union[str, None]], head: bytes = b"") -> bool:
+        """Whether a format-specific converter exists for any of `extensions` or the format sniffed from `head`.
+
+        The plain-text fallback, which accepts anything, does not count.
+        """
+        extensions = list(extensions)
+        if head:
+            self._append_ext(extensions, self._guess_ext_magic(head))
+        return any(
+            converter.extensions is not None
+            for ext in extensions
+            if ext
+            for converter in self._converters_for(ext.lower())
+        )
+
+    def _in_memory_ok(self, extensions: List[Union[str, None]]) -> bool:
+        """Whether every converter that could be tried for `extensions` accepts an in-memory stream."""
+        return all(
+            converter.in_memory
+            for ext in extensions + [None]
+            for converter in self._converters_for(ext.lower() if ext else None)
+        )
+
     def _guess_ext_magic(self, path):
-        """Use puremagic (a Python implementation of libmagic) to guess a file's extension based on the first few bytes."""
+        """Use puremagic (a Python implementation of libmagic) to guess a file's extension based on the first few bytes.
+
+        `path` may also be the content itself, as bytes.
+        """
         # Use puremagic to guess
         try:
-            guesses = puremagic.magic_file(path)
+            guesses = puremagic.magic_string(path) if isinstance(path, bytes) else puremagic.magic_file(path)
             if len(guesses) > 0:
                 ext = guesses[0].extension.strip()
                 if len(ext) > 0:
@@ -942,8 +1204,11 @@ class MarkdownConverter:
             pass
         except PermissionError:
             pass
+        except (puremagic.PureError, ValueError):
+            pass  # Unrecognized or empty content
         return None
 
     def register_page_converter(self, converter: DocumentConverter) -> None:
-        """Register a page text converter."""
-        self._page_converters.insert(0, converter)
\ No newline at end of file
+        """Register a page text converter; it is used for every extension from the next conversion on."""
+        self._page_converters = [converter, *self._page_converters]
+        self._dispatch = {}
\ No newline at end of file
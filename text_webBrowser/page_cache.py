@@ -0,0 +1,320 @@
+"""On-disk cache of fetched pages and their Markdown conversions.
+
+Response bodies and converted Markdown are stored as content-addressed blob
+files; a SQLite index (WAL mode, so several browsers and processes can share
+one cache directory) maps each URL to its latest body together with its ETag
+and Last-Modified validators. Within `ttl_sec` a cached page is served without
+touching the network; after that it is revalidated with a conditional request
+(If-None-Match / If-Modified-Since). Conversions are keyed by body hash, source
+URL and converter version, so bumping `mdconvert.CONVERTER_VERSION` invalidates
+them. Entries unused for `max_age_sec` are dropped and the least recently used
+blobs are evicted once the cache grows past `max_bytes`.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "BROWSER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "text_webBrowser")
+)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CachedResponse:
+    """A cached HTTP response: validators, headers and the path of its body blob."""
+
+    def __init__(self, url: str, final_url: str, headers: Dict[str, str], body_hash: str, body_path: str, fetched_at: float, fresh: bool):
+        self.url = url
+        self.final_url = final_url
+        self.headers = headers
+        self.body_hash = body_hash
+        self.body_path = body_path
+        self.fetched_at = fetched_at
+        self.fresh = fresh
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("content-type", "")
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.headers.get("etag"):
+            headers["If-None-Match"] = self.headers["etag"]
+        if self.headers.get("last-modified"):
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+
+class PageCache:
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        ttl_sec: float = 3600,
+        max_age_sec: float = 7 * 24 * 3600,
+        max_bytes: int = 2 * 1024**3,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl_sec = ttl_sec
+        self.max_age_sec = max_age_sec
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.conversion_hits = 0
+        self.conversion_misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                final_url TEXT,
+                headers TEXT,
+                body_hash TEXT,
+                fetched_at REAL,
+                last_access REAL
+            );
+            CREATE TABLE IF NOT EXISTS conversions (
+                key TEXT PRIMARY KEY,
+                title TEXT,
+                markdown_hash TEXT,
+                last_access REAL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                nbytes INTEGER,
+                last_access REAL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access);
+            CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+            CREATE INDEX IF NOT EXISTS responses_body_hash ON responses (body_hash);
+            CREATE INDEX IF NOT EXISTS conversions_last_access ON conversions (last_access);
+            CREATE INDEX IF NOT EXISTS conversions_markdown_hash ON conversions (markdown_hash);
+            """
+        )
+        self._conn.commit()
+        # Running blob count/bytes, kept exact by triggers in the same transaction as every write,
+        # so eviction never sums the table. Seeded once for caches created without them.
+        self._conn.executescript(
+            """
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS blob_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                blobs INTEGER,
+                bytes INTEGER
+            );
+            INSERT OR IGNORE INTO blob_totals SELECT 0, COUNT(*), COALESCE(SUM(nbytes), 0) FROM blobs;
+            CREATE TRIGGER IF NOT EXISTS blobs_insert AFTER INSERT ON blobs BEGIN
+                UPDATE blob_totals SET blobs = blobs + 1, bytes = bytes + NEW.nbytes WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS blobs_delete AFTER DELETE ON blobs BEGIN
+                UPDATE blob_totals SET blobs = blobs - 1, bytes = bytes - OLD.nbytes WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS blobs_resize AFTER UPDATE OF nbytes ON blobs BEGIN
+                UPDATE blob_totals SET bytes = bytes - OLD.nbytes + NEW.nbytes WHERE id = 0;
+            END;
+            COMMIT;
+            """
+        )
+        self._next_sweep = 0.0
+
+    # Blobs
+
+    def blob_path(self, blob_hash: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", blob_hash[:2], blob_hash)
+
+    def _put_blob(self, data: bytes) -> str:
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(blob_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp_path, path)
+        self._conn.execute(
+            # An upsert (not INSERT OR REPLACE, which deletes without firing triggers) keeps the totals exact
+            "INSERT INTO blobs (hash, nbytes, last_access) VALUES (?, ?, ?) "
+            "ON CONFLICT (hash) DO UPDATE SET nbytes = excluded.nbytes, last_access = excluded.last_access",
+            (blob_hash, len(data), time.time()),
+        )
+        return blob_hash
+
+    def _touch_blob(self, blob_hash: str, now: float) -> bool:
+        """Mark a blob as used; False if another process evicted it."""
+        if not os.path.exists(self.blob_path(blob_hash)):
+            return False
+        self._conn.execute("UPDATE blobs SET last_access = ? WHERE hash = ?", (now, blob_hash))
+        return True
+
+    # Responses
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """Return the cached response for `url`, fresh or stale, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT final_url, headers, body_hash, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None or not self._touch_blob(row[2], now):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE url = ?", (now, url))
+            self._conn.commit()
+        final_url, headers, body_hash, fetched_at = row
+        fresh = now - fetched_at < self.ttl_sec
+        if fresh:
+            self.hits += 1
+        return CachedResponse(url, final_url, json.loads(headers), body_hash, self.blob_path(body_hash), fetched_at, fresh)
+
+    def store_response(self, url: str, final_url: str, headers, body: bytes) -> CachedResponse:
+        headers = {key.lower(): value for key, value in headers.items()}
+        now = time.time()
+        with self._lock:
+            body_hash = self._put_blob(body)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, final_url, headers, body_hash, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, final_url, json.dumps(headers), body_hash, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+        return CachedResponse(url, final_url, headers, body_hash, self.blob_path(body_hash), now, True)
+
+    def revalidated(self, url: str, headers) -> None:
+        """Record a 304 Not Modified: the cached body is fresh again, with any updated validators."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT headers FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+            merged = json.loads(row[0])
+            for key in ("etag", "last-modified", "cache-control", "expires"):
+                if key in headers:
+                    merged[key] = headers[key]
+            self._conn.execute(
+                "UPDATE responses SET headers = ?, fetched_at = ?, last_access = ? WHERE url = ?",
+                (json.dumps(merged), now, now, url),
+            )
+            self._conn.commit()
+            self.revalidations += 1
+
+    # Conversions
+
+    @staticmethod
+    def conversion_key(source, url: Optional[str], converter_version: str) -> str:
+        """Key a conversion of `source` (a path or an in-memory BytesIO) fetched from `url`."""
+        body_hash = file_sha256(source) if isinstance(source, str) else hashlib.sha256(source.getvalue()).hexdigest()
+        return hashlib.sha256(f"{converter_version}\0{body_hash}\0{url or ''}".encode("utf-8")).hexdigest()
+
+    def get_conversion(self, key: str) -> Optional[Tuple[Optional[str], str]]:
+        """Return (title, markdown) of a cached conversion, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT title, markdown_hash FROM conversions WHERE key = ?", (key,)).fetchone()
+            if row is None or not self._touch_blob(row[1], now):
+                self.conversion_misses += 1
+                return None
+            self._conn.execute("UPDATE conversions SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        try:
+            with open(self.blob_path(row[1]), "rb") as fh:
+                markdown = fh.read().decode("utf-8")
+        except FileNotFoundError:
+            self.conversion_misses += 1
+            return None
+        self.conversion_hits += 1
+        return row[0], markdown
+
+    def put_conversion(self, key: str, title: Optional[str], markdown: str) -> None:
+        with self._lock:
+            markdown_hash = self._put_blob(markdown.encode("utf-8"))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversions (key, title, markdown_hash, last_access) VALUES (?, ?, ?, ?)",
+                (key, title, markdown_hash, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    # Eviction
+
+    def _evict(self) -> None:
+        now = time.time()
+        victims = []
+        if now >= self._next_sweep:
+            # Expiry by age only needs to run now and then; each step is an index range scan
+            self._next_sweep = now + 60
+            cutoff = now - self.max_age_sec
+            self._conn.execute("DELETE FROM responses WHERE last_access < ?", (cutoff,))
+            self._conn.execute("DELETE FROM conversions WHERE last_access < ?", (cutoff,))
+            victims = [
+                blob_hash
+                for (blob_hash,) in self._conn.execute(
+                    "SELECT hash FROM blobs WHERE last_access < ? "
+                    "AND NOT EXISTS (SELECT 1 FROM responses WHERE body_hash = blobs.hash) "
+                    "AND NOT EXISTS (SELECT 1 FROM conversions WHERE markdown_hash = blobs.hash)",
+                    (cutoff,),
+                )
+            ]
+        (total,) = self._conn.execute("SELECT bytes FROM blob_totals WHERE id = 0").fetchone()
+        if total > self.max_bytes:
+            # Least recently used first, until a tenth below the limit so eviction is not run on every write
+            for blob_hash, nbytes in self._conn.execute("SELECT hash, nbytes FROM blobs ORDER BY last_access"):
+                if total <= self.max_bytes * 0.9:
+                    break
+                victims.append(blob_hash)
+                total -= nbytes
+        for blob_hash in victims:
+            self._conn.execute("DELETE FROM blobs WHERE hash = ?", (blob_hash,))
+            self._conn.execute("DELETE FROM responses WHERE body_hash = ?", (blob_hash,))
+            self._conn.execute("DELETE FROM conversions WHERE markdown_hash = ?", (blob_hash,))
+            try:
+                os.remove(self.blob_path(blob_hash))
+            except FileNotFoundError:
+                pass
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            (responses,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            (conversions,) = self._conn.execute("SELECT COUNT(*) FROM conversions").fetchone()
+            blobs, total = self._conn.execute("SELECT blobs, bytes FROM blob_totals WHERE id = 0").fetchone()
+        return {
+            "responses": responses,
+            "conversions": conversions,
+            "blobs": blobs,
+            "bytes": total,
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+            "conversion_hits": self.conversion_hits,
+            "conversion_misses": self.conversion_misses,
+            "evictions": self.evictions,
+        }
+
+
+_shared_caches: Dict[str, PageCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_page_cache(cache_dir: str = DEFAULT_CACHE_DIR) -> PageCache:
+    """Return the process-wide cache for `cache_dir`, creating it on first use."""
+    with _shared_lock:
+        if cache_dir not in _shared_caches:
+            _shared_caches[cache_dir] = PageCache(cache_dir)
+        return _shared_caches[cache_dir]
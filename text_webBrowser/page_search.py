@@ -0,0 +1,94 @@
+"""Per-page search index behind SimpleTextBrowser.find_on_page / find_next.
+
+Each viewport is normalized once (lowercased `\\w+` tokens separated by single
+spaces, the form the browser has always matched against) and the results are
+joined into one token stream, one viewport per line, with an offset -> viewport
+map. A query is compiled once and run over the whole stream in a single
+C-level scan: literal and wildcard patterns never contain a newline, so a
+match cannot straddle two viewports. Every matching viewport is returned at
+once and cached per query, so stepping through results does no searching.
+"""
+import bisect
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+def normalize_query(query: str) -> Optional[str]:
+    """Normalize a find-on-page query to the regex matched against normalized viewports."""
+    nquery = re.sub(r"\*", "__STAR__", query)
+    nquery = " " + (" ".join(re.split(r"\W+", nquery))).strip() + " "
+    nquery = nquery.replace(" __STAR__ ", "__STAR__ ")  # Merge isolated stars with prior word
+    nquery = nquery.replace("__STAR__", ".*").lower()
+    if nquery.strip() == "":
+        return None
+    return nquery
+
+
+_ASCII_NON_WORD = bytes(
+    c if c < 128 and (chr(c).isalnum() or chr(c) == "_") else ord(" ") for c in range(256)
+)
+
+
+def normalize_text(content: str) -> str:
+    return " " + (" ".join(re.split(r"\W+", content))).strip().lower() + " "
+
+
+class PageSearchIndex:
+    """Search index over one page's content split into `viewport_pages` (start, end) bounds.
+
+    Nothing is normalized until the first query, so pages that are never
+    searched cost nothing.
+    """
+
+    def __init__(self, content: str, viewport_pages: Sequence[Tuple[int, int]]):
+        self.content = content
+        self.viewport_pages = viewport_pages
+        self._stream: Optional[str] = None
+        self._offsets: List[int] = []  # Start of each viewport in the stream
+        self._results: Dict[str, List[int]] = {}
+
+    def _build(self) -> None:
+        if self.content.isascii():
+            # Fast path: map non-word bytes to spaces with a translate table, then collapse runs
+            content = self.content.lower().encode("ascii").translate(_ASCII_NON_WORD).decode("ascii")
+            stream = re.sub(r"  +", " ", "\n".join(" " + content[start:end] + " " for start, end in self.viewport_pages))
+        else:
+            stream = "\n".join(normalize_text(self.content[start:end]) for start, end in self.viewport_pages)
+        offsets = [0]
+        position = stream.find("\n")
+        while position != -1:
+            offsets.append(position + 1)
+            position = stream.find("\n", position + 1)
+        self._stream = stream
+        self._offsets = offsets
+
+    def search(self, query: str) -> List[int]:
+        """Return the sorted indices of all viewports matching `query`."""
+        nquery = normalize_query(query)
+        if nquery is None:
+            return []
+        if nquery not in self._results:
+            if self._stream is None:
+                self._build()
+            self._results[nquery] = self._scan(re.compile(nquery))
+        return self._results[nquery]
+
+    def _scan(self, pattern: "re.Pattern") -> List[int]:
+        matches = []
+        position = 0
+        while True:
+            match = pattern.search(self._stream, position)
+            if match is None:
+                return matches
+            viewport = bisect.bisect_right(self._offsets, match.start()) - 1
+            matches.append(viewport)
+            # One hit per viewport is enough; resume at the next one
+            if viewport + 1 >= len(self._offsets):
+                return matches
+            position = self._offsets[viewport + 1]
+
+    def normalized_viewport(self, i: int) -> str:
+        if self._stream is None:
+            self._build()
+        end = self._offsets[i + 1] - 1 if i + 1 < len(self._offsets) else len(self._stream)
+        return self._stream[self._offsets[i]:end]
@@ -1,11 +1,15 @@
 # Shamelessly stolen from Microsoft Autogen team: thanks to them for this great resource!
 # https://github.com/microsoft/autogen/blob/gaia_multiagent_v01_march_1st/autogen/browser_utils.py
+import bisect
+import io
 import mimetypes
 import os
 import pathlib
 import re
 import time
+import threading
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple, Union
 from urllib.parse import unquote, urljoin, urlparse
 
@@ -16,7 +20,14 @@ from serpapi import GoogleSearch
 from smolagents import Tool
 
 from cookies import COOKIES
-from mdconvert import FileConversionException, MarkdownConverter, UnsupportedFormatException
+from downloads import SNIFF_BYTES, Downloader, DownloadTooLarge, read_limited
+from http_session import get_session
+from mdconvert import FileConversionException, MarkdownConverter, PdfPageStream, UnsupportedFormatException
+from page_cache import CachedResponse, PageCache, get_page_cache
+from page_search import PageSearchIndex
+
+
+_WHITESPACE = re.compile(r"[ \t\r\n]")
 
 
 class SimpleTextBrowser:
@@ -29,29 +40,68 @@ class SimpleTextBrowser:
         downloads_folder: Optional[Union[str, None]] = None,
         serpapi_key: Optional[Union[str, None]] = None,
         request_kwargs: Optional[Union[Dict[str, Any], None]] = None,
+        viewport_max_extension: Optional[int] = 1024 * 2,
+        page_cache: Optional[PageCache] = None,
+        use_page_cache: bool = True,
+        prefetch_results: int = 0,
+        prefetch_workers: int = 4,
+        prefetch_per_host: int = 2,
+        stream_pdfs: bool = True,
+        downloader: Optional[Downloader] = None,
+        sniff_downloads: bool = True,
+        session: Optional[requests.Session] = None,
     ):
         self.start_page: str = start_page if start_page else "about:blank"
         self.viewport_size = viewport_size  # Applies only to the standard uri types
+        self.viewport_max_extension = viewport_max_extension  # How far a page may grow to end on whitespace
         self.downloads_folder = downloads_folder
         self.history: List[Tuple[str, float]] = list()
         self.page_title: Optional[str] = None
         self.viewport_current_page = 0
-        self.viewport_pages: List[Tuple[int, int]] = list()
-        self.set_address(self.start_page)
+        self._viewport_bounds: List[Tuple[int, int]] = list()  # Computed lazily, see _ensure_viewports
+        self._split_offset = 0
+        self._viewport_text: Optional[Tuple[Tuple[int, int], str]] = None
+        self._page_search: Optional[PageSearchIndex] = None
+        # Local PDFs are decoded page by page, as viewports are read (see _ensure_viewports)
+        self.stream_pdfs = stream_pdfs
+        self._pdf_stream: Optional[PdfPageStream] = None
+        # All requests share one connection-pooled session (keep-alive, retries, timings)
+        self.session = session if session is not None else get_session()
+        # Large-buffer, size-capped, resumable downloads; with sniff_downloads, only convertible files are converted
+        self.downloader = downloader if downloader is not None else Downloader(session=self.session)
+        self.sniff_downloads = sniff_downloads
+        # Shared on-disk cache of pages and conversions (BROWSER_CACHE_DIR), unless disabled
+        self._page_cache = page_cache if page_cache is not None else (get_page_cache() if use_page_cache else None)
+        self._open_start_page()
         self.serpapi_key = serpapi_key
         self.request_kwargs = request_kwargs if request_kwargs is not None else {}
         self.request_kwargs["cookies"] = COOKIES
-        self._mdconvert = MarkdownConverter()
+        self._mdconvert = MarkdownConverter(requests_session=self.session, page_cache=self._page_cache)
         self._page_content: str = ""
 
         self._find_on_page_query: Union[str, None] = None
         self._find_on_page_last_result: Union[int, None] = None  # Location of the last result
+        self._find_on_page_matches: List[int] = list()  # All viewports matching the query
+        self._find_on_page_match_idx: int = 0  # Position of the last result in _find_on_page_matches
+
+        # Background fetch + conversion of the top search results (disabled when prefetch_results is 0)
+        self.prefetch_results = prefetch_results
+        self.prefetch_per_host = prefetch_per_host
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="prefetch") if prefetch_results > 0 else None
+        self._prefetched: Dict[str, Future] = dict()
+        self._host_slots: Dict[str, threading.Semaphore] = dict()
+        self._prefetch_lock = threading.Lock()
+        self._prefetch_counts = {"submitted": 0, "hits": 0, "waited": 0, "failed": 0, "unused": 0}
+        self._prefetch_time_saved = 0.0
 
     @property
     def address(self) -> str:
         """Return the address of the current page."""
         return self.history[-1][0]
 
+    def _open_start_page(self) -> None:
+        self.set_address(self.start_page)
+
     def set_address(self, uri_or_path: str, filter_year: Optional[int] = None) -> None:
         # TODO: Handle anchors
         self.history.append((uri_or_path, time.time()))
@@ -62,18 +112,25 @@ class SimpleTextBrowser:
         elif uri_or_path.startswith("google:"):
             self._serpapi_search(uri_or_path[len("google:") :].strip(), filter_year=filter_year)
         else:
-            if (
-                not uri_or_path.startswith("http:")
-                and not uri_or_path.startswith("https:")
-                and not uri_or_path.startswith("file:")
-            ):
-                if len(self.history) > 1:
-                    prior_address = self.history[-2][0]
-                    uri_or_path = urljoin(prior_address, uri_or_path)
-                    # Update the address with the fully-qualified path
-                    self.history[-1] = (uri_or_path, self.history[-1][1])
-            self._fetch_page(uri_or_path)
-
+            self._fetch_page(self._qualify_address(uri_or_path))
+
+        self._reset_viewport()
+
+    def _qualify_address(self, uri_or_path: str) -> str:
+        """Resolve a relative address against the previous page, updating the history entry."""
+        if (
+            not uri_or_path.startswith("http:")
+            and not uri_or_path.startswith("https:")
+            and not uri_or_path.startswith("file:")
+        ):
+            if len(self.history) > 1:
+                prior_address = self.history[-2][0]
+                uri_or_path = urljoin(prior_address, uri_or_path)
+                # Update the address with the fully-qualified path
+                self.history[-1] = (uri_or_path, self.history[-1][1])
+        return uri_or_path
+
+    def _reset_viewport(self) -> None:
         self.viewport_current_page = 0
         self.find_on_page_query = None
         self.find_on_page_viewport = None
@@ -81,23 +138,65 @@ class SimpleTextBrowser:
     @property
     def viewport(self) -> str:
         """Return the content of the current viewport."""
-        bounds = self.viewport_pages[self.viewport_current_page]
-        return self.page_content[bounds[0] : bounds[1]]
+        self._ensure_viewports(self.viewport_current_page)
+        bounds = self._viewport_bounds[self.viewport_current_page]
+        if self._viewport_text is None or self._viewport_text[0] != bounds:
+            self._viewport_text = (bounds, self._page_content[bounds[0] : bounds[1]])
+        return self._viewport_text[1]
+
+    @property
+    def viewport_pages(self) -> List[Tuple[int, int]]:
+        """Return the (start, end) bounds of every viewport, splitting the rest of the page if needed."""
+        self._ensure_viewports()
+        return self._viewport_bounds
+
+    @property
+    def is_split(self) -> bool:
+        """Whether every viewport boundary of the current page has been computed."""
+        return self._pdf_stream is None and self._split_offset >= len(self._page_content)
+
+    def page_count(self, exact: bool = True) -> int:
+        """Number of viewports on the page. With exact=False, pages not split yet are estimated instead."""
+        if exact or self.is_split:
+            return len(self.viewport_pages)
+        remaining = len(self._page_content) - self._split_offset
+        if self._pdf_stream is not None:
+            remaining += self._pdf_stream.remaining_chars_estimate()
+        return len(self._viewport_bounds) + -(-remaining // self.viewport_size)  # type: ignore[operator]
 
     @property
     def page_content(self) -> str:
         """Return the full contents of the current page."""
+        while self._decode_more():
+            pass
         return self._page_content
 
-    def _set_page_content(self, content: str) -> None:
-        """Sets the text content of the current page."""
+    def _set_page_content(self, content: str, pdf_stream: Optional[PdfPageStream] = None) -> None:
+        """Sets the text content of the current page, which `pdf_stream` extends as viewports are read."""
+        if self._pdf_stream is not None:
+            self._pdf_stream.close()
+        self._pdf_stream = pdf_stream
         self._page_content = content
         self._split_pages()
-        if self.viewport_current_page >= len(self.viewport_pages):
-            self.viewport_current_page = len(self.viewport_pages) - 1
+        self._page_search = None
+        self._find_on_page_query = None
+        self._find_on_page_last_result = None
+        if self._pdf_stream is not None:
+            # Clamping would decode the new PDF up to the old page's index; a fresh stream starts at the top
+            self.viewport_current_page = 0
+        elif self._ensure_viewports(self.viewport_current_page) <= self.viewport_current_page:
+            self.viewport_current_page = len(self._viewport_bounds) - 1
+
+    @property
+    def _search_index(self) -> PageSearchIndex:
+        if self._page_search is None:
+            viewport_pages = self.viewport_pages  # Splits (and decodes) the whole page first
+            self._page_search = PageSearchIndex(self._page_content, viewport_pages)
+        return self._page_search
 
     def page_down(self) -> None:
-        self.viewport_current_page = min(self.viewport_current_page + 1, len(self.viewport_pages) - 1)
+        if self._ensure_viewports(self.viewport_current_page + 1) > self.viewport_current_page + 1:
+            self.viewport_current_page += 1
 
     def page_up(self) -> None:
         self.viewport_current_page = max(self.viewport_current_page - 1, 0)
@@ -112,67 +211,38 @@ class SimpleTextBrowser:
 
         # Ok it's a new search start from the current viewport
         self._find_on_page_query = query
-        viewport_match = self._find_next_viewport(query, self.viewport_current_page)
-        if viewport_match is None:
+        self._find_on_page_matches = self._search_index.search(query)
+        if not self._find_on_page_matches:
             self._find_on_page_last_result = None
             return None
-        else:
-            self.viewport_current_page = viewport_match
-            self._find_on_page_last_result = viewport_match
-            return self.viewport
+
+        # First match at or after the current viewport, wrapping to the first one
+        self._find_on_page_match_idx = bisect.bisect_left(self._find_on_page_matches, self.viewport_current_page)
+        if self._find_on_page_match_idx == len(self._find_on_page_matches):
+            self._find_on_page_match_idx = 0
+        return self._show_match()
 
     def find_next(self) -> Union[str, None]:
         """Scroll to the next viewport that matches the query"""
 
-        if self._find_on_page_query is None:
+        if self._find_on_page_query is None or not self._find_on_page_matches:
             return None
 
-        starting_viewport = self._find_on_page_last_result
-        if starting_viewport is None:
-            starting_viewport = 0
+        if self._find_on_page_last_result is None:
+            self._find_on_page_match_idx = 0
         else:
-            starting_viewport += 1
-            if starting_viewport >= len(self.viewport_pages):
-                starting_viewport = 0
-
-        viewport_match = self._find_next_viewport(self._find_on_page_query, starting_viewport)
-        if viewport_match is None:
-            self._find_on_page_last_result = None
-            return None
-        else:
-            self.viewport_current_page = viewport_match
-            self._find_on_page_last_result = viewport_match
-            return self.viewport
-
-    def _find_next_viewport(self, query: str, starting_viewport: int) -> Union[int, None]:
-        """Search for matches between the starting viewport looping when reaching the end."""
-
-        if query is None:
-            return None
-
-        # Normalize the query, and convert to a regular expression
-        nquery = re.sub(r"\*", "__STAR__", query)
-        nquery = " " + (" ".join(re.split(r"\W+", nquery))).strip() + " "
-        nquery = nquery.replace(" __STAR__ ", "__STAR__ ")  # Merge isolated stars with prior word
-        nquery = nquery.replace("__STAR__", ".*").lower()
-
-        if nquery.strip() == "":
-            return None
-
-        idxs = list()
-        idxs.extend(range(starting_viewport, len(self.viewport_pages)))
-        idxs.extend(range(0, starting_viewport))
-
-        for i in idxs:
-            bounds = self.viewport_pages[i]
-            content = self.page_content[bounds[0] : bounds[1]]
+            self._find_on_page_match_idx = (self._find_on_page_match_idx + 1) % len(self._find_on_page_matches)
+        return self._show_match()
 
-            # TODO: Remove markdown links and images
-            ncontent = " " + (" ".join(re.split(r"\W+", content))).strip().lower() + " "
-            if re.search(nquery, ncontent):
-                return i
+    def _show_match(self) -> str:
+        viewport_match = self._find_on_page_matches[self._find_on_page_match_idx]
+        self.viewport_current_page = viewport_match
+        self._find_on_page_last_result = viewport_match
+        return self.viewport
 
-        return None
+    def find_all(self, query: str) -> List[int]:
+        """Return the indices of every viewport matching the query."""
+        return self._search_index.search(query)
 
     def visit_page(self, path_or_uri: str, filter_year: Optional[int] = None) -> str:
         """Update the address, visit the page, and return the content of the viewport."""
@@ -180,28 +250,68 @@ class SimpleTextBrowser:
         return self.viewport
 
     def _split_pages(self) -> None:
+        """Reset the viewport split; bounds are computed on demand by _ensure_viewports."""
+        self._viewport_text = None
         # Do not split search results
         if self.address.startswith("google:"):
-            self.viewport_pages = [(0, len(self._page_content))]
+            self._viewport_bounds = [(0, len(self._page_content))]
+            self._split_offset = len(self._page_content)
             return
 
         # Handle empty pages
-        if len(self._page_content) == 0:
-            self.viewport_pages = [(0, 0)]
+        if len(self._page_content) == 0 and self._pdf_stream is None:
+            self._viewport_bounds = [(0, 0)]
+            self._split_offset = 0
             return
 
-        # Break the viewport into pages
-        self.viewport_pages = []
-        start_idx = 0
-        while start_idx < len(self._page_content):
-            end_idx = min(start_idx + self.viewport_size, len(self._page_content))  # type: ignore[operator]
-            # Adjust to end on a space
-            while end_idx < len(self._page_content) and self._page_content[end_idx - 1] not in [" ", "\t", "\r", "\n"]:
-                end_idx += 1
-            self.viewport_pages.append((start_idx, end_idx))
-            start_idx = end_idx
+        self._viewport_bounds = []
+        self._split_offset = 0
+
+    def _ensure_viewports(self, index: Optional[int] = None) -> int:
+        """Split the page up to viewport `index` (or to the end) and return the number of viewports known."""
+        while index is None or len(self._viewport_bounds) <= index:
+            content = self._page_content
+            start_idx = self._split_offset
+            end_idx = start_idx + self.viewport_size  # type: ignore[operator]
+            # A streaming PDF is decoded far enough that this viewport ends where it would on the full text
+            if self._pdf_stream is not None and end_idx + (self.viewport_max_extension or 0) >= len(content):
+                self._decode_more()
+                continue
+            if start_idx >= len(content):
+                break
+            end_idx = min(end_idx, len(content))
+            # Adjust to end on a space, extending the page by at most viewport_max_extension characters
+            if end_idx < len(content):
+                limit = len(content)
+                if self.viewport_max_extension is not None:
+                    limit = min(limit, end_idx + self.viewport_max_extension)
+                space = _WHITESPACE.search(content, end_idx - 1, limit)
+                end_idx = space.end() if space else limit
+            self._viewport_bounds.append((start_idx, end_idx))
+            self._split_offset = end_idx
+        if not self._viewport_bounds:
+            self._viewport_bounds.append((0, 0))  # A PDF without any text
+        return len(self._viewport_bounds)
+
+    def _decode_more(self) -> bool:
+        """Append the next page of a streaming PDF to the page content; False once it is fully decoded."""
+        if self._pdf_stream is None:
+            return False
+        try:
+            self._page_content += next(self._pdf_stream)
+        except StopIteration:
+            self._pdf_stream = None
+        except Exception as e:
+            print(f"Error decoding PDF: {e}")
+            self._page_content += f"\n\n[The rest of this PDF could not be decoded: {e}]"
+            self._pdf_stream = None
+        return True
 
     def _serpapi_search(self, query: str, filter_year: Optional[int] = None) -> None:
+        search = GoogleSearch(self._serpapi_params(query, filter_year))
+        self._show_search_results(query, filter_year, search.get_dict())
+
+    def _serpapi_params(self, query: str, filter_year: Optional[int] = None) -> Dict[str, str]:
         if self.serpapi_key is None:
             raise ValueError("Missing SerpAPI key.")
 
@@ -212,9 +322,9 @@ class SimpleTextBrowser:
         }
         if filter_year is not None:
             params["tbs"] = f"cdr:1,cd_min:01/01/{filter_year},cd_max:12/31/{filter_year}"
+        return params
 
-        search = GoogleSearch(params)
-        results = search.get_dict()
+    def _show_search_results(self, query: str, filter_year: Optional[int], results: Dict[str, Any]) -> None:
         self.page_title = f"{query} - Search"
         if "organic_results" not in results.keys():
             raise Exception(f"No results found for query: '{query}'. Use a less specific query.")
@@ -259,22 +369,128 @@ class SimpleTextBrowser:
         )
 
         self._set_page_content(content)
+        if self._prefetch_pool is not None:
+            self._prefetch([page["link"] for page in results["organic_results"][: self.prefetch_results] if "link" in page])
+
+    def _prefetch(self, urls: List[str]) -> None:
+        """Start fetching and converting `urls` in the background, dropping prefetches of the previous search."""
+        with self._prefetch_lock:
+            for url, future in self._prefetched.items():
+                if url not in urls:
+                    future.cancel()
+                    self._prefetch_counts["unused"] += 1
+            self._prefetched = {url: self._prefetched[url] for url in urls if url in self._prefetched}
+            for url in urls:
+                if url in self._prefetched:
+                    continue
+                if self._page_cache is not None:
+                    cached = self._page_cache.lookup(url)
+                    if cached is not None and cached.fresh:
+                        continue  # Already served instantly from the cache
+                self._prefetched[url] = self._prefetch_pool.submit(self._prefetch_page, url)
+                self._prefetch_counts["submitted"] += 1
+
+    def _prefetch_page(self, url: str) -> Optional[Tuple[Optional[str], str, float]]:
+        """Fetch and convert a text page off the main thread; returns (title, content, seconds) or None."""
+        host = urlparse(url).netloc
+        with self._prefetch_lock:
+            slots = self._host_slots.setdefault(host, threading.Semaphore(self.prefetch_per_host))
+        with slots:
+            started = time.time()
+            request_kwargs = self.request_kwargs.copy()
+            request_kwargs["stream"] = True
+            response = self.session.get(url, **request_kwargs)
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            if "text/" not in content_type.lower():
+                response.close()
+                return None  # Downloads are left to a regular visit
+            # Same size cap as a regular visit
+            body = read_limited(response, self.downloader.max_bytes, self.downloader.chunk_size)
+            if self._page_cache is not None:
+                self._page_cache.store_response(url, response.url, response.headers, body)
+            extension = mimetypes.guess_extension(content_type.split(";")[0])
+            res = self._mdconvert.convert_stream(io.BytesIO(body), file_extension=extension, url=response.url)
+            if res is None:
+                return None
+            return res.title, res.text_content, time.time() - started
+
+    def _take_prefetched(self, url: str) -> Optional[Tuple[Optional[str], str]]:
+        with self._prefetch_lock:
+            future = self._prefetched.pop(url, None)
+        if future is None:
+            return None
+        started = time.time()
+        was_done = future.done()
+        try:
+            result = future.result()
+        except Exception:
+            result = None
+        waited = time.time() - started
+        with self._prefetch_lock:
+            if result is None:
+                self._prefetch_counts["failed"] += 1
+                return None
+            self._prefetch_counts["hits" if was_done else "waited"] += 1
+            self._prefetch_time_saved += max(0.0, result[2] - waited)
+        return result[0], result[1]
+
+    def prefetch_stats(self) -> Dict[str, Any]:
+        """Prefetch counters: hits were ready on visit, waited were still in flight, unused were never visited."""
+        with self._prefetch_lock:
+            used = self._prefetch_counts["hits"] + self._prefetch_counts["waited"]
+            return {
+                **self._prefetch_counts,
+                "pending": len(self._prefetched),
+                "hit_rate": round(used / self._prefetch_counts["submitted"], 4) if self._prefetch_counts["submitted"] else 0.0,
+                "time_saved_sec": round(self._prefetch_time_saved, 3),
+            }
+
+    def http_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host connection reuse and DNS/connect/TLS/TTFB/download times of recent requests."""
+        return self.session.stats() if hasattr(self.session, "stats") else {}
 
     def _fetch_page(self, url: str) -> None:
         download_path = ""
         try:
             if url.startswith("file://"):
                 download_path = os.path.normcase(os.path.normpath(unquote(url[7:])))
+                if self.stream_pdfs and os.path.splitext(download_path)[1].lower() == ".pdf":
+                    self.page_title = None
+                    self._set_page_content("", pdf_stream=self._mdconvert.stream_pdf(download_path))
+                    return
                 res = self._mdconvert.convert_local(download_path)
                 self.page_title = res.title
                 self._set_page_content(res.text_content)
             else:
+                # A search result fetched in the background
+                prefetched = self._take_prefetched(url) if self._prefetched else None
+                if prefetched is not None:
+                    self.page_title, content = prefetched
+                    self._set_page_content(content)
+                    return
+
                 # Prepare the request parameters
                 request_kwargs = self.request_kwargs.copy() if self.request_kwargs is not None else {}
                 request_kwargs["stream"] = True
 
+                # Serve text pages from the cache while fresh, otherwise revalidate them
+                cached = self._page_cache.lookup(url) if self._page_cache is not None else None
+                if cached is not None and "text/" not in cached.content_type.lower():
+                    cached = None
+                if cached is not None and cached.fresh and self._show_cached_page(cached):
+                    return
+                if cached is not None:
+                    request_kwargs["headers"] = {**request_kwargs.get("headers", {}), **cached.conditional_headers()}
+
                 # Send a HTTP request to the URL
-                response = requests.get(url, **request_kwargs)
+                response = self.session.get(url, **request_kwargs)
+                if response.status_code == 304 and cached is not None:
+                    self._page_cache.revalidated(url, response.headers)
+                    if self._show_cached_page(cached):
+                        return
+                    request_kwargs["headers"] = self.request_kwargs.get("headers", {})
+                    response = self.session.get(url, **request_kwargs)
                 response.raise_for_status()
 
                 # If the HTTP request was successful
@@ -282,40 +498,31 @@ class SimpleTextBrowser:
 
                 # Text or HTML
                 if "text/" in content_type.lower():
-                    res = self._mdconvert.convert_response(response)
+                    # Read once, within the same size cap as downloads
+                    body = read_limited(response, self.downloader.max_bytes, self.downloader.chunk_size)
+                    if self._page_cache is not None:
+                        stored = self._page_cache.store_response(url, response.url, response.headers, body)
+                        if self._show_cached_page(stored):
+                            return
+                    extension = mimetypes.guess_extension(content_type.split(";")[0])
+                    res = self._mdconvert.convert_stream(io.BytesIO(body), file_extension=extension, url=response.url)
                     self.page_title = res.title
                     self._set_page_content(res.text_content)
                 # A download
                 else:
-                    # Try producing a safe filename
-                    fname = None
-                    download_path = None
-                    try:
-                        fname = pathvalidate.sanitize_filename(os.path.basename(urlparse(url).path)).strip()
-                        download_path = os.path.abspath(os.path.join(self.downloads_folder, fname))
-
-                        suffix = 0
-                        while os.path.exists(download_path) and suffix < 1000:
-                            suffix += 1
-                            base, ext = os.path.splitext(fname)
-                            new_fname = f"{base}__{suffix}{ext}"
-                            download_path = os.path.abspath(os.path.join(self.downloads_folder, new_fname))
-
-                    except NameError:
-                        pass
-
-                    # No suitable name, so make one
-                    if fname is None:
-                        extension = mimetypes.guess_extension(content_type)
-                        if extension is None:
-                            extension = ".download"
-                        fname = str(uuid.uuid4()) + extension
-                        download_path = os.path.abspath(os.path.join(self.downloads_folder, fname))
-
-                    # Open a file for writing
-                    with open(download_path, "wb") as fh:
-                        for chunk in response.iter_content(chunk_size=512):
-                            fh.write(chunk)
+                    download_path = self._download_path(url, content_type)
+
+                    # Decide from the first few KB whether the file is worth converting
+                    head, chunks = b"", None
+                    if self.sniff_downloads:
+                        head, chunks = self.downloader.sniff(response)
+                    self.downloader.save(url, download_path, response, chunks, request_kwargs=request_kwargs)
+                    if self.sniff_downloads and not self._mdconvert.can_convert(
+                        [mimetypes.guess_extension(content_type.split(";")[0]), os.path.splitext(download_path)[1]], head
+                    ):
+                        self.page_title = "Download complete."
+                        self._set_page_content(f"# Download complete\n\nSaved file to '{download_path}'")
+                        return
 
                     # Render it
                     local_uri = pathlib.Path(download_path).as_uri()
@@ -329,6 +536,10 @@ class SimpleTextBrowser:
             print(e)
             self.page_title = ("Download complete.",)
             self._set_page_content(f"# Download complete\n\nSaved file to '{download_path}'")
+        except DownloadTooLarge as e:
+            print(e)
+            self.page_title = "Download too large"
+            self._set_page_content(f"# Download too large\n\n{e}")
         except FileNotFoundError:
             self.page_title = "Error 404"
             self._set_page_content(f"## Error 404\n\nFile not found: {download_path}")
@@ -343,22 +554,61 @@ class SimpleTextBrowser:
                     self.page_title = f"Error {response.status_code}"
                     self._set_page_content(f"## Error {response.status_code}\n\n{res.text_content}")
                 else:
-                    text = ""
-                    for chunk in response.iter_content(chunk_size=512, decode_unicode=True):
-                        text += chunk
+                    body = read_limited(response, SNIFF_BYTES * 128, self.downloader.chunk_size)
+                    text = body.decode(response.encoding or "utf-8", errors="replace")
                     self.page_title = f"Error {response.status_code}"
                     self._set_page_content(f"## Error {response.status_code}\n\n{text}")
             except NameError:
                 self.page_title = "Error"
                 self._set_page_content(f"## Error\n\n{str(request_exception)}")
 
+    def _download_path(self, url: str, content_type: str) -> str:
+        """A path in downloads_folder for `url` that does not clash with an earlier download."""
+        # Try producing a safe filename
+        fname = None
+        download_path = None
+        try:
+            fname = pathvalidate.sanitize_filename(os.path.basename(urlparse(url).path)).strip()
+            download_path = os.path.abspath(os.path.join(self.downloads_folder, fname))
+
+            suffix = 0
+            while os.path.exists(download_path) and suffix < 1000:
+                suffix += 1
+                base, ext = os.path.splitext(fname)
+                new_fname = f"{base}__{suffix}{ext}"
+                download_path = os.path.abspath(os.path.join(self.downloads_folder, new_fname))
+
+        except NameError:
+            pass
+
+        # No suitable name, so make one
+        if fname is None:
+            extension = mimetypes.guess_extension(content_type)
+            if extension is None:
+                extension = ".download"
+            fname = str(uuid.uuid4()) + extension
+            download_path = os.path.abspath(os.path.join(self.downloads_folder, fname))
+        return download_path
+
+    def _show_cached_page(self, cached: CachedResponse) -> bool:
+        """Render a cached text response; the conversion itself is usually cached too."""
+        extension = mimetypes.guess_extension(cached.content_type.split(";")[0])
+        try:
+            res = self._mdconvert.convert_local(cached.body_path, file_extension=extension, url=cached.final_url)
+        except (FileNotFoundError, FileConversionException, UnsupportedFormatException):
+            return False
+        self.page_title = res.title
+        self._set_page_content(res.text_content)
+        return True
+
     def _state(self) -> Tuple[str, str]:
         header = f"Address: {self.address}\n"
         if self.page_title is not None:
             header += f"Title: {self.page_title}\n"
 
         current_page = self.viewport_current_page
-        total_pages = len(self.viewport_pages)
+        decoding = self._pdf_stream is not None
+        total_pages = self.page_count(exact=not decoding)  # Never decode a whole PDF just to count pages
 
         address = self.address
         for i in range(len(self.history) - 2, -1, -1):  # Start from the second last
@@ -366,7 +616,10 @@ class SimpleTextBrowser:
                 header += f"You previously visited this page {round(time.time() - self.history[i][1])} seconds ago.\n"
                 break
 
-        header += f"Viewport position: Showing page {current_page + 1} of {total_pages}.\n"
+        if decoding:
+            header += f"Viewport position: Showing page {current_page + 1} of about {total_pages} (the PDF is still being converted).\n"
+        else:
+            header += f"Viewport position: Showing page {current_page + 1} of {total_pages}.\n"
         return (header, self.viewport)
 
 
@@ -423,20 +676,25 @@ DO NOT use this tool for .pdf or .txt or .htm files: for these types of files us
     def forward(self, url: str) -> str:
         if "arxiv" in url:
             url = url.replace("abs", "pdf")
-        response = requests.get(url)
+        response = self.browser.session.get(url, stream=True)
+        response.raise_for_status()
         content_type = response.headers.get("content-type", "")
-        extension = mimetypes.guess_extension(content_type)
+        extension = mimetypes.guess_extension(content_type.split(";")[0])
         if extension and isinstance(extension, str):
             new_path = f"./downloads/file{extension}"
         else:
             new_path = "./downloads/file.object"
 
-        with open(new_path, "wb") as f:
-            f.write(response.content)
-
-        if "pdf" in extension or "txt" in extension or "htm" in extension:
+        # Checked before downloading, so a large PDF is not fetched only to be rejected
+        if extension and ("pdf" in extension or "txt" in extension or "htm" in extension):
+            response.close()
             raise Exception("Do not use this tool for pdf or txt or html files: use visit_page instead.")
 
+        try:
+            self.browser.downloader.save(url, new_path, response)
+        except DownloadTooLarge as e:
+            return f"File was not downloaded: {e}"
+
         return f"File was downloaded and saved under path {new_path}."
 
 
@@ -459,8 +717,8 @@ class ArchiveSearchTool(Tool):
     def forward(self, url, date) -> str:
         no_timestamp_url = f"https://archive.org/wayback/available?url={url}"
         archive_url = no_timestamp_url + f"&timestamp={date}"
-        response = requests.get(archive_url).json()
-        response_notimestamp = requests.get(no_timestamp_url).json()
+        response = self.browser.session.get(archive_url).json()
+        response_notimestamp = self.browser.session.get(no_timestamp_url).json()
         if "archived_snapshots" in response and "closest" in response["archived_snapshots"]:
             closest = response["archived_snapshots"]["closest"]
             print("Archive found!", closest)
@@ -563,6 +821,22 @@ class FindNextTool(Tool):
             return header.strip() + "\n=======================\n" + content
 
 
+
+class PageCountTool(Tool):
+    name = "page_count"
+    description = "Return how many viewport pages the current webpage has, without reading or scrolling it."
+    inputs = {}
+    output_type = "string"
+
+    def __init__(self, browser):
+        super().__init__()
+        self.browser = browser
+
+    def forward(self) -> str:
+        count = self.browser.page_count(exact=False)
+        approximately = "" if self.browser.is_split else "about "
+        return f"Address: {self.browser.address}\nThe page has {approximately}{count} pages."
+
 def main():
     # Initialize the browser with downloads folder
     browser = SimpleTextBrowser(